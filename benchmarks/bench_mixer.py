@@ -0,0 +1,63 @@
+"""
+MixerSource 每個音框的混音時間 (毫秒)，與 20 ms 的音框時間預算比較
+
+以記憶體內的隨機 PCM 音框當圖層 (不經過 ffmpeg)，只量測混音本身：int16 → float32、增益、ducking、限幅與轉回 int16。
+最後一個圖層為會壓低其他圖層的音效，所以 ducking 路徑也會被量到。
+
+用法:
+    python -m benchmarks.bench_mixer            # 預設 1 / 2 / 4 / 8 個圖層
+    BENCH_LAYERS=4,16 python -m benchmarks.bench_mixer
+"""
+
+import os
+import time
+
+import numpy as np
+
+from utils.mixer import MixerSource, Layer, FRAME_SAMPLES
+
+LAYERS = [int(n) for n in os.getenv("BENCH_LAYERS", "1,2,4,8").split(",")]
+FRAMES = 3000                    # 60 秒音訊
+BUDGET_MS = 20.0
+
+
+class NoiseSource:
+    """循環送出預先產生的隨機 PCM 音框"""
+
+    def __init__(self, seed: int):
+        rng = np.random.default_rng(seed)
+        self._frames = [rng.integers(-20000, 20000, FRAME_SAMPLES, dtype=np.int16).tobytes() for _ in range(16)]
+        self._i = 0
+
+    def read(self):
+        self._i += 1
+        return self._frames[self._i % len(self._frames)]
+
+    def cleanup(self):
+        pass
+
+
+def bench(layers: int) -> list:
+    main = Layer("music", NoiseSource(0))
+    others = [Layer(f"layer{i}", NoiseSource(i), gain=0.5, ducks_others=(i == layers - 1))
+              for i in range(1, layers)]
+    mixer = MixerSource(main, others)
+
+    timings = []
+    for _ in range(FRAMES):
+        start = time.perf_counter()
+        mixer.read()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    print(f"{'圖層':>4} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'預算占比(p99)':>14}")
+    for layers in LAYERS:
+        timings = np.array(bench(layers))
+        p50, p99 = np.percentile(timings, [50, 99])
+        print(f"{layers:>4} {p50:>8.3f} {p99:>8.3f} {timings.max():>8.3f} {p99 / BUDGET_MS:>13.1%}")
+
+
+if __name__ == "__main__":
+    main()
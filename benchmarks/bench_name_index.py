@@ -0,0 +1,80 @@
+"""
+角色名稱索引查詢延遲 (p50 / p99，微秒)
+
+用法:
+    python -m benchmarks.bench_name_index            # 預設 10000 個名稱
+    BENCH_NAMES=50000 python -m benchmarks.bench_name_index
+"""
+
+import os
+import time
+import random
+import string
+
+from utils.name_index import NameIndex
+
+NAMES = int(os.getenv("BENCH_NAMES", "10000"))
+QUERIES = 2000
+CJK = "哥布林弓箭手獸人戰士巫師騎士精靈法師盜賊牧師龍"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def random_name(rng):
+    if rng.random() < 0.3:
+        return "".join(rng.choice(CJK) for _ in range(rng.randint(2, 6))) + str(rng.randint(1, 99))
+    return rng.choice(string.ascii_uppercase) + "".join(
+        rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))
+    )
+
+
+def typo(name, rng):
+    if len(name) < 3:
+        return name
+    i = rng.randrange(len(name) - 1)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def measure(func, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    return percentile(samples, 50), percentile(samples, 99)
+
+
+def main():
+    rng = random.Random(42)
+    names = list({random_name(rng) for _ in range(NAMES)})
+
+    start = time.perf_counter()
+    index = NameIndex(names)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    picks = [rng.choice(names) for _ in range(QUERIES)]
+    workloads = {
+        "prefix(2)": (index.prefix, [n[:2] for n in picks]),
+        "prefix(4)": (index.prefix, [n[:4] for n in picks]),
+        "fuzzy(typo)": (index.fuzzy, [typo(n, rng) for n in picks]),
+        "search(typo)": (index.search, [typo(n, rng) for n in picks]),
+    }
+
+    print(f"{len(names)} 個名稱，建立索引 {build_ms:.1f} ms")
+    print(f"{'query':<14}{'p50 µs':>10}{'p99 µs':>10}")
+    for label, (func, queries) in workloads.items():
+        p50, p99 = measure(func, queries)
+        print(f"{label:<14}{p50:>10.1f}{p99:>10.1f}")
+
+    start = time.perf_counter()
+    for name in picks[:500]:
+        index.remove(name)
+        index.add(name)
+    print(f"增量更新 (remove + add) 平均 {(time.perf_counter() - start) / 500 * 1_000_000:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+每個播放串流的 CPU 用量：舊版 (mp3 → FFmpegPCMAudio → PCMVolumeTransformer → Opus 編碼) vs Opus 直送 (FFmpegOpusAudio -c:a copy)
+
+模擬 discord.py 的 AudioPlayer：每個串流一條執行緒不斷 read() 20 ms 的音框，PCM 路徑再做一次 Opus 編碼。
+CPU 時間包含本行程與 ffmpeg 子行程，換算成「每串流、每秒音訊」的 CPU 毫秒。
+需要 ffmpeg 與 libopus。
+
+用法:
+    python -m benchmarks.bench_playback_cpu            # 預設 1 / 4 / 8 個同時串流
+    BENCH_STREAMS=1,16 python -m benchmarks.bench_playback_cpu
+"""
+
+import os
+import shutil
+import resource
+import tempfile
+import threading
+import subprocess
+
+import discord
+from utils.audio_library import transcode_to_opus
+
+STREAMS = [int(n) for n in os.getenv("BENCH_STREAMS", "1,4,8").split(",")]
+SECONDS = 30
+FRAMES = SECONDS * 50            # 20 ms 一個音框
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def legacy_stream(path):
+    source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(path, options="-vn"), volume=0.5)
+    encoder = discord.opus.Encoder()
+
+    def play():
+        for _ in range(FRAMES):
+            data = source.read()
+            if not data:
+                break
+            encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+        source.cleanup()
+
+    return play
+
+
+def passthrough_stream(path):
+    source = discord.FFmpegOpusAudio(path, codec="copy")
+
+    def play():
+        for _ in range(FRAMES):
+            if not source.read():
+                break
+        source.cleanup()
+
+    return play
+
+
+def measure(factory, path, streams):
+    players = [factory(path) for _ in range(streams)]
+    threads = [threading.Thread(target=play) for play in players]
+    start = cpu_seconds()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (cpu_seconds() - start) / streams / SECONDS * 1000
+
+
+def main():
+    if not discord.opus.is_loaded():
+        discord.opus._load_default()
+
+    with tempfile.TemporaryDirectory() as directory:
+        mp3 = os.path.join(directory, "tone.mp3")
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi",
+                        "-i", f"sine=frequency=440:duration={SECONDS}", "-ac", "2", "-b:a", "192k", mp3], check=True)
+        source = os.path.join(directory, "tone.source")
+        shutil.copyfile(mp3, source)
+        opus = os.path.join(directory, "tone.opus")
+        transcode_to_opus(source, opus)
+
+        print(f"{'streams':<10}{'legacy ms/s':>14}{'opus copy ms/s':>16}")
+        for streams in STREAMS:
+            legacy = measure(legacy_stream, mp3, streams)
+            passthrough = measure(passthrough_stream, opus, streams)
+            print(f"{streams:<10}{legacy:>14.2f}{passthrough:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+save_tracker 延遲基準測試 (p50 / p99)
+
+用法:
+    python -m benchmarks.bench_save_tracker                      # 只測 SQLite (暫存檔)
+    python -m benchmarks.bench_save_tracker postgres://user:pw@localhost/goose_db
+    python -m benchmarks.bench_save_tracker sqlite:///data/bench.db postgres://...
+
+可用 BENCH_ITERATIONS 調整次數 (預設 2000)。
+每個後端的 utils.query_metrics 快照會寫入 logs/bench_<scheme>_metrics.json。
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import statistics
+
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "2000"))
+WARMUP = 50
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def sample_tracker():
+    """模擬一場 8 人戰鬥的先攻表"""
+    entries = [
+        {
+            "name": f"Combatant{i}",
+            "initiative": 20 - i,
+            "roll_detail": f"[{20 - i}] = {20 - i}",
+            "formula": "1d20",
+            "hp": 30 + i,
+            "elements": ["fire"],
+            "atk": 5,
+            "def_": 3,
+            "status_effects": {},
+            "favorite_dice": {"attack": "1d8+3"},
+        }
+        for i in range(8)
+    ]
+    return {"entries": entries, "current_index": 0, "current_round": 1, "is_active": True}
+
+
+async def bench(url: str, channel_id: str = "bench"):
+    from utils import db, initiative, journal, query_metrics
+    import utils.shared_state as shared_state
+
+    db.Database._backend = db.create_backend(url)
+    await db.Database._backend.connect()
+    try:
+        await db.init_db()
+        shared_state.initiative_trackers[channel_id] = sample_tracker()
+        tracker = shared_state.initiative_trackers[channel_id]
+
+        samples = []
+        for i in range(WARMUP + ITERATIONS):
+            tracker["current_index"] = i % len(tracker["entries"])
+            start = time.perf_counter()
+            await initiative.save_tracker(channel_id)
+            elapsed = time.perf_counter() - start
+            if i >= WARMUP:
+                samples.append(elapsed * 1000)
+        journal.get_journal().sync()
+
+        # 端到端延遲減去資料庫本身的耗時 = 日誌 + 事件迴圈開銷
+        scheme = url.split("://", 1)[0]
+        query_metrics.dump(os.path.join("logs", f"bench_{scheme}_metrics.json"))
+        upsert = query_metrics.snapshot()["queries"]["tracker_upsert"]
+        assert upsert["count"] >= ITERATIONS, upsert
+    finally:
+        await db.Database.close()
+
+    return {
+        "p50": percentile(samples, 50),
+        "p99": percentile(samples, 99),
+        "mean": statistics.fmean(samples),
+        "db_p50": upsert["p50_ms"],
+        "db_p99": upsert["p99_ms"],
+    }
+
+
+async def main(urls):
+    from utils import journal, query_metrics
+
+    with tempfile.TemporaryDirectory() as tmp:
+        journal.JOURNAL_PATH = os.path.join(tmp, "journal.log")
+        if not urls:
+            urls = [f"sqlite:///{os.path.join(tmp, 'bench.db')}"]
+
+        print(f"save_tracker x {ITERATIONS}")
+        print(f"{'backend':<12}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'db p50':>10}{'db p99':>10}")
+        for url in urls:
+            scheme = url.split("://", 1)[0]
+            query_metrics.reset()
+            try:
+                result = await bench(url)
+            except Exception as e:
+                print(f"{scheme:<12} 失敗: {e}")
+                continue
+            print(
+                f"{scheme:<12}{result['p50']:>10.3f}{result['p99']:>10.3f}{result['mean']:>10.3f}"
+                f"{result['db_p50']:>10.3f}{result['db_p99']:>10.3f}"
+            )
+        journal.close_journal()
+
+
+if __name__ == "__main__":
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,103 @@
+"""
+歌曲檔案查詢延遲：舊版逐檔掃描 vs 檔案索引 (p50 / p99，毫秒)，以及啟動對帳 (reconcile) 各階段耗時
+
+用法:
+    python -m benchmarks.bench_song_index            # 預設 5000 個檔案
+    BENCH_SONGS=20000 python -m benchmarks.bench_song_index
+"""
+
+import os
+import time
+import random
+import string
+import tempfile
+
+from fuzzywuzzy import fuzz
+from utils.music import clean_string
+from utils.song_index import SongIndex, reconcile
+
+SONGS = int(os.getenv("BENCH_SONGS", "5000"))
+QUERIES = 500
+LEGACY_QUERIES = 30      # 舊版每次查詢都要掃整個目錄，只取少量樣本
+WORDS = ["love", "night", "dream", "fire", "moon", "remix", "live", "official", "夜", "花", "雨", "君"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def random_title(rng, i):
+    words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5)))
+    tag = "".join(rng.choice(string.ascii_letters) for _ in range(6))
+    return f"{words} {tag} {i}"
+
+
+def legacy_find(directory, title):
+    """舊版 find_downloaded_file：每次 listdir 並對每個檔名做 regex 與 partial_ratio"""
+    cleaned_title = clean_string(title)
+    best_match, best_similarity = None, 0
+    for file in os.listdir(directory):
+        cleaned_file = clean_string(file)
+        if cleaned_title == cleaned_file and file.lower().endswith((".mp3", ".m4a")):
+            return os.path.join(directory, file)
+        similarity = fuzz.partial_ratio(cleaned_title, cleaned_file)
+        if similarity > best_similarity and file.lower().endswith((".mp3", ".m4a")):
+            best_similarity, best_match = similarity, os.path.join(directory, file)
+    return best_match if best_similarity > 80 else None
+
+
+def measure(func, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentile(samples, 50), percentile(samples, 99)
+
+
+def main():
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as directory:
+        titles = [random_title(rng, i) for i in range(SONGS)]
+        for title in titles:
+            open(os.path.join(directory, f"{title}.mp3"), "w").close()
+
+        index = SongIndex(directory)
+        start = time.perf_counter()
+        index.refresh()
+        build_ms = (time.perf_counter() - start) * 1000
+
+        exact = [rng.choice(titles) for _ in range(QUERIES)]
+        fuzzy = [t.rsplit(" ", 2)[0] + " " + t.rsplit(" ", 1)[1] for t in exact]   # 少了隨機標籤
+        workloads = [
+            ("legacy exact", lambda q: legacy_find(directory, q), exact[:LEGACY_QUERIES]),
+            ("legacy fuzzy", lambda q: legacy_find(directory, q), fuzzy[:LEGACY_QUERIES]),
+            ("index exact", index.find, exact),
+            ("index fuzzy", index.find, fuzzy),
+        ]
+
+        print(f"{SONGS} 個檔案，建立索引 {build_ms:.1f} ms")
+        print(f"{'query':<14}{'p50 ms':>10}{'p99 ms':>10}")
+        for label, func, queries in workloads:
+            p50, p99 = measure(func, queries)
+            print(f"{label:<14}{p50:>10.3f}{p99:>10.3f}")
+
+        open(os.path.join(directory, "brand new song.mp3"), "w").close()
+        start = time.perf_counter()
+        index.refresh()
+        print(f"新增一個檔案後增量更新 {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    # 歌單：90% 與檔名相同、5% 只差一點 (走模糊比對)、5% 沒有檔案
+    stems = [random_title(rng, i) for i in range(SONGS)]
+    titles = [t if i % 20 else t.rsplit(" ", 1)[0] for i, t in enumerate(stems[: int(SONGS * 0.95)])]
+    titles += [random_title(rng, SONGS + i) for i in range(SONGS - len(titles))]
+    start = time.perf_counter()
+    plan = reconcile(titles, stems)
+    phases = "，".join(f"{k} {v * 1000:.1f} ms" for k, v in plan["timings"].items())
+    print(f"reconcile {len(titles)} 首 x {len(stems)} 檔：共 {(time.perf_counter() - start) * 1000:.1f} ms ({phases}，"
+          f"模糊比對 {plan['fuzzy_candidates']} 首)")
+
+
+if __name__ == "__main__":
+    main()
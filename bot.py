@@ -4,8 +4,14 @@ from discord.ext import commands
 import asyncio
 import os
 from dotenv import load_dotenv
-from utils.music import log_message, scan_and_update_musicsheet, init_musicsheet_system
+from utils.music import log_message, scan_and_update_musicsheet_async, init_musicsheet_system
+from utils.musicsheet import get_store
+from utils.playback_session import get_session
+from utils.downloads import close_download_manager
+from utils.loudness import schedule_library_scan, shutdown_loudness
 from utils.db import init_db
+from utils.journal import replay_journal, close_journal
+from utils.character_cache import start_character_sync, stop_character_sync
 import utils.shared_state as shared_state
 
 # 加載環境變數
@@ -31,6 +37,7 @@ intents.voice_states = True
 class GooseBot(commands.Bot):
     def __init__(self):
         super().__init__(command_prefix="!", intents=intents, help_command=None)
+        self._services_started = False
 
     async def setup_hook(self):
         # 載入 Cogs
@@ -38,6 +45,7 @@ class GooseBot(commands.Bot):
         await self.load_extension("cogs.music")
         await self.load_extension("cogs.dice")
         await self.load_extension("cogs.initiative")
+        await self.load_extension("cogs.admin")
         
         # 同步 Slash Commands
         await self.tree.sync()
@@ -57,9 +65,26 @@ class GooseBot(commands.Bot):
         print(f"✅ 機器人已上線：{self.user}")
         
         init_musicsheet_system()
-        scan_and_update_musicsheet()
+        await scan_and_update_musicsheet_async()
         await init_db()
 
+        # on_ready 在每次 gateway 重新連線後都會再觸發：背景服務只啟動一次
+        if self._services_started:
+            return
+        self._services_started = True
+        schedule_library_scan()
+        await replay_journal()
+        await start_character_sync()
+
+    async def close(self):
+        await stop_character_sync()
+        await close_download_manager()
+        shutdown_loudness()
+        get_store().flush()
+        get_session().flush()
+        close_journal()
+        await super().close()
+
     async def on_error(self, event, *args, **kwargs):
         import traceback
         error_info = traceback.format_exc()
@@ -0,0 +1,46 @@
+import discord
+from discord.ext import commands
+from utils.permissions import check_authorization
+from utils import query_metrics
+from utils.character_cache import get_cache
+from utils.musicsheet import get_store
+
+class Admin(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.command(name="dbstats")
+    async def dbstats_command(self, ctx, action: str = None):
+        """
+        !dbstats        - 各查詢的延遲統計 (p50/p95/p99) 與連線池狀態
+        !dbstats dump   - 輸出機器可讀的 JSON 快照
+        !dbstats reset  - 清空統計
+        """
+        if not check_authorization(ctx):
+            return
+
+        if action == "reset":
+            query_metrics.reset()
+            await ctx.send("🧹 資料庫查詢統計已清空")
+            return
+
+        if action == "dump":
+            path = query_metrics.dump()
+            await ctx.send(f"💾 統計快照已寫入 `{path}`", file=discord.File(path))
+            return
+
+        pool = query_metrics.snapshot()["pool"]
+        pool_text = ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in pool.items())
+        cache = get_cache().stats()
+        cache_text = (
+            f"命中率 {cache['hit_ratio']:.0%} (文件 {cache['doc_hits']}/{cache['doc_hits'] + cache['doc_misses']}, "
+            f"名稱 {cache['name_hits']}/{cache['name_hits'] + cache['name_misses']})"
+        )
+        sheets = get_store().stats()
+        sheet_text = f"命中率 {sheets['hit_ratio']:.0%} (命中 {sheets['hits']}，重新讀取 {sheets['loads']}，寫入 {sheets['writes']}，合併 {sheets['coalesced']})"
+        await ctx.send(
+            f"{query_metrics.format_metrics()}\n🔌 連線池: {pool_text}\n🗃️ 角色快取: {cache_text}\n🎵 歌單快取: {sheet_text}"
+        )
+
+async def setup(bot):
+    await bot.add_cog(Admin(bot))
@@ -37,9 +37,13 @@ class General(commands.Cog):
 
 ⚔️ **先攻表**
 `!init` - 開啟先攻表 (含按鈕操作)
+`/init hp`、`/char show` 等 slash 指令可自動完成角色名稱
 
 📁 **歌單管理**
 `!sheet` - 顯示/切換歌單
+
+🛠️ **管理**
+`!dbstats` - 資料庫查詢延遲統計 (`dump` / `reset`)
 """
             await ctx.send(help_text)
             return
@@ -56,6 +60,12 @@ class General(commands.Cog):
 `!play <URL>` - 直接播放 YouTube 連結
 `!list` - 顯示目前歌單 (含按鈕選擇)
 `!now` - 顯示目前播放的歌曲
+`!downloads` - 顯示下載佇列與進度
+
+**場景音效**
+`!ambience <檔名> [音量]` - 循環播放環境音並與音樂混音
+`!ambience stop` - 停止環境音
+`!sfx <檔名> [音量]` - 播放一次性音效 (自動壓低其他聲音)
 
 **搜尋與加入**
 `!search <關鍵字>` - 搜尋 YouTube 音樂
@@ -128,7 +138,17 @@ class General(commands.Cog):
 
 **戰鬥控制**
 `!init reset` - 重置回合數
-`!init end` - 結束戰鬥
+`!init end` - 結束戰鬥 (自動封存戰鬥紀錄)
+`!init stats` - 顯示本場戰鬥統計 (傷害/治療/行動次數)
+`!init history` - 顯示最近的戰鬥紀錄
+
+**全域角色 / 隊伍**
+`!char list [關鍵字]` - 列出/搜尋全域角色
+`!char saveall` - 保存先攻表中所有角色
+`!char history 哥布林 [版本]` - 查看角色的版本紀錄 / 指定版本
+`!party save 冒險隊 [角色...]` - 儲存隊伍預設 (預設為目前先攻表)
+`!party load 冒險隊` - 一次導入整隊角色
+`!party` / `!party delete 冒險隊` - 列出/刪除隊伍預設
 
 **按鈕功能**
 介面提供完整的按鈕操作：
@@ -1,13 +1,16 @@
 
 import discord
+from discord import app_commands
 from discord.ext import commands
-from utils.permissions import check_authorization
+from utils.permissions import check_authorization, check_interaction_authorization
+from utils.name_index import get_character_index, entry_index
 from ui.views import InitiativeTrackerView, FavoriteDiceOverviewView
 from utils.initiative import (add_entry, add_entry_with_roll, remove_entry, get_entry,
                               next_turn, set_stats, modify_hp, modify_elements,
                               add_status, remove_status, reset_tracker, end_combat,
                               add_status, remove_status, reset_tracker, end_combat,
-                              get_tracker_display, get_entry_names, get_favorite_dice_display, get_tracker, get_selected_character)
+                              get_tracker_display, get_entry_names, get_favorite_dice_display, get_tracker, get_selected_character,
+                              get_combat_stats, get_combat_history, format_combat_report, format_combat_stats)
 import utils.shared_state as shared_state
 
 class Initiative(commands.Cog):
@@ -149,6 +152,27 @@ class Initiative(commands.Cog):
             else:
                 await ctx.send(f"❌ 找不到 **{name}**")
         
+        elif subcommand == "stats" and len(parts) == 1:
+            # !init stats (顯示目前戰鬥的累計統計)
+            tally = await get_combat_stats(ctx.channel.id)
+            await ctx.send(format_combat_stats(tally))
+
+        elif subcommand == "history":
+            # !init history (最近封存的戰鬥)
+            history = await get_combat_history(ctx.channel.id)
+            if not history:
+                await ctx.send("📚 此頻道尚無戰鬥紀錄")
+                return
+            lines = ["📚 **最近戰鬥紀錄**", "━" * 30]
+            for record in history:
+                summary = record["summary"]
+                tally = record.get("tally", {})
+                lines.append(
+                    f"• {str(record['ended_at'])[:16]} | {summary['total_rounds']} 回合 | "
+                    f"{summary['total_characters']} 角色 | 傷害 {tally.get('damage_taken', 0)} | 治療 {tally.get('healing', 0)}"
+                )
+            await ctx.send("\n".join(lines))
+
         elif subcommand == "stats":
             # !init stats <名字> <HP> [元素] [ATK] [DEF]
             if len(parts) < 3:
@@ -246,13 +270,7 @@ class Initiative(commands.Cog):
         elif subcommand == "end":
             # !init end
             summary = await end_combat(ctx.channel.id)
-            msg = f"🏁 **戰鬥結束！**\n"
-            msg += f"━━━━━━━━━━━━━━━━━━\n"
-            msg += f"📊 總回合數: {summary['total_rounds']}\n"
-            msg += f"👥 參戰角色: {summary['total_characters']}\n"
-            if summary['survivors']:
-                msg += f"✨ 存活者: {', '.join(summary['survivors'])}\n"
-            await ctx.send(msg)
+            await ctx.send(format_combat_report(summary))
         
         elif subcommand == "reset":
             # !init reset
@@ -279,11 +297,21 @@ class Initiative(commands.Cog):
     @commands.group(name="char", invoke_without_command=True)
     async def char_command(self, ctx):
         if not check_authorization(ctx): return
-        await ctx.send("使用 `!char list` 列出角色，`!char show <名字>` 查看詳情，或使用先攻表按鈕進行保存/導入。")
+        await ctx.send("使用 `!char list` 列出角色，`!char show <名字>` 查看詳情，`!char history <名字> [版本]` 查看歷史版本，`!char saveall` 保存先攻表所有角色，或使用先攻表按鈕進行保存/導入。")
 
     @char_command.command(name="list")
-    async def char_list(self, ctx):
+    async def char_list(self, ctx, *, query: str = None):
+        """!char list [關鍵字] - 列出角色，有關鍵字時以前綴 / 模糊搜尋篩選"""
         from utils.character_storage import get_all_names
+        if query:
+            index = await get_character_index()
+            names = index.search(query, 50)
+            if not names:
+                await ctx.send(f"📂 找不到符合 `{query}` 的角色。")
+                return
+            await ctx.send(f"🔎 **符合 `{query}` 的角色**:\n" + ", ".join(f"`{n}`" for n in names))
+            return
+
         names = await get_all_names()
         if not names:
             await ctx.send("📂 全域角色庫是空的。")
@@ -292,6 +320,26 @@ class Initiative(commands.Cog):
         msg = "📂 **全域角色列表**:\n" + ", ".join(f"`{n}`" for n in names)
         await ctx.send(msg)
 
+    @char_command.command(name="saveall")
+    async def char_saveall(self, ctx, *fields: str):
+        """!char saveall [stats] [dice] [formula] - 將先攻表中所有角色存入全域庫 (預設全部欄位)"""
+        if not check_authorization(ctx): return
+        from utils.character_storage import save_characters
+        from utils.initiative import get_tracker
+
+        valid = ("stats", "dice", "formula")
+        selected = [f for f in fields if f in valid] or list(valid)
+        tracker = await get_tracker(ctx.channel.id)
+        if not tracker["entries"]:
+            await ctx.send("❌ 先攻表是空的")
+            return
+
+        count = await save_characters(tracker["entries"], selected)
+        if count:
+            await ctx.send(f"✅ 已將 {count} 名角色保存至全域庫 (欄位: {', '.join(selected)})")
+        else:
+            await ctx.send("❌ 批次保存失敗")
+
     @char_command.command(name="delete")
     async def char_delete(self, ctx, name: str):
         from utils.character_storage import delete_character
@@ -308,28 +356,176 @@ class Initiative(commands.Cog):
         if not data:
             await ctx.send(f"❌ 找不到全域角色 **{name}**")
             return
-            
-        stats = data.get("stats", {})
-        dice = data.get("favorite_dice", {})
-        formula = data.get("initiative_formula")
-        
-        embed = discord.Embed(title=f"角色詳情: {name}", color=discord.Color.blue())
-        if formula:
-            embed.add_field(name="⚔️ 先攻公式", value=f"`{formula}`", inline=False)
-            
-        stats_desc = []
-        if stats.get("hp") is not None: stats_desc.append(f"HP: {stats['hp']}")
-        if stats.get("elements") is not None: stats_desc.append(f"元素: {stats['elements']}")
-        if stats.get("atk") is not None: stats_desc.append(f"ATK: {stats['atk']}")
-        if stats.get("def_") is not None: stats_desc.append(f"DEF: {stats['def_']}")
-        if stats_desc:
-            embed.add_field(name="📊 基礎數值", value=" | ".join(stats_desc), inline=False)
-            
-        if dice:
-            dice_desc = "\n".join(f"• **{k}**: `{v}`" for k, v in dice.items())
-            embed.add_field(name="🎲 常用骰", value=dice_desc, inline=False)
-            
+        await ctx.send(embed=character_embed(name, data))
+
+    @char_command.command(name="history")
+    async def char_history(self, ctx, name: str, version: int = None):
+        """!char history <名字> [版本] - 列出最近的版本紀錄，或查看指定版本的內容"""
+        from utils.character_versions import get_history, get_version, format_history
+        if version is None:
+            await ctx.send(format_history(name, await get_history(name)))
+            return
+        number, data = await get_version(name, version)
+        if data is None:
+            await ctx.send(f"❌ 找不到 **{name}** 的第 {version} 版")
+            return
+        embed = character_embed(name, data)
+        embed.title = f"角色詳情: {name} (v{number})"
         await ctx.send(embed=embed)
 
+    @commands.group(name="party", invoke_without_command=True)
+    async def party_command(self, ctx):
+        """!party - 列出隊伍預設"""
+        if not check_authorization(ctx): return
+        from utils.character_storage import get_all_parties
+        parties = await get_all_parties()
+        if not parties:
+            await ctx.send("👥 尚無隊伍預設。使用 `!party save <名稱> [角色...]` 建立 (不指定角色則使用目前先攻表)")
+            return
+        lines = [f"• **{name}**: {', '.join(members)}" for name, members in parties.items()]
+        await ctx.send("👥 **隊伍預設**\n" + "\n".join(lines))
+
+    @party_command.command(name="save")
+    async def party_save(self, ctx, name: str, *members: str):
+        """!party save <名稱> [角色...] - 儲存隊伍預設 (預設為目前先攻表的角色)"""
+        if not check_authorization(ctx): return
+        from utils.character_storage import save_party
+        members = list(members) or await get_entry_names(ctx.channel.id)
+        if not members:
+            await ctx.send("❌ 請指定角色，或先在先攻表中加入角色")
+            return
+        if await save_party(name, members):
+            await ctx.send(f"✅ 已儲存隊伍 **{name}**: {', '.join(members)}")
+        else:
+            await ctx.send("❌ 儲存隊伍失敗")
+
+    @party_command.command(name="load")
+    async def party_load(self, ctx, name: str):
+        """!party load <名稱> - 將隊伍中的全域角色一次導入先攻表"""
+        if not check_authorization(ctx): return
+        from utils.character_storage import get_party
+        from utils.initiative import import_characters, format_import_results
+        members = await get_party(name)
+        if not members:
+            await ctx.send(f"❌ 找不到隊伍 **{name}**")
+            return
+        results, missing = await import_characters(ctx.channel.id, members)
+        await ctx.send(f"👥 隊伍 **{name}**\n" + format_import_results(results, missing))
+        await self.display_init_ui(ctx)
+
+    @party_command.command(name="delete")
+    async def party_delete(self, ctx, name: str):
+        if not check_authorization(ctx): return
+        from utils.character_storage import delete_party
+        if await delete_party(name):
+            await ctx.send(f"🗑️ 已刪除隊伍 **{name}**")
+        else:
+            await ctx.send(f"❌ 找不到隊伍 **{name}**")
+
+    # ============================================
+    # Slash Commands (名稱自動完成)
+    # ============================================
+
+    char_group = app_commands.Group(name="char", description="全域角色庫")
+    init_group = app_commands.Group(name="init", description="先攻表")
+
+    async def character_autocomplete(self, interaction: discord.Interaction, current: str):
+        index = await get_character_index()
+        return [app_commands.Choice(name=n, value=n) for n in index.search(current, 25)]
+
+    async def entry_autocomplete(self, interaction: discord.Interaction, current: str):
+        names = await get_entry_names(interaction.channel_id)
+        index = entry_index(interaction.channel_id, names)
+        return [app_commands.Choice(name=n, value=n) for n in index.search(current, 25)]
+
+    @char_group.command(name="show", description="查看全域角色詳情")
+    @app_commands.describe(name="角色名稱")
+    @app_commands.autocomplete(name=character_autocomplete)
+    async def slash_char_show(self, interaction: discord.Interaction, name: str):
+        if not await check_interaction_authorization(interaction): return
+        from utils.character_storage import get_character
+        data = await get_character(name)
+        if not data:
+            await interaction.response.send_message(f"❌ 找不到全域角色 **{name}**", ephemeral=True)
+            return
+        await interaction.response.send_message(embed=character_embed(name, data))
+
+    @char_group.command(name="delete", description="刪除全域角色")
+    @app_commands.describe(name="角色名稱")
+    @app_commands.autocomplete(name=character_autocomplete)
+    async def slash_char_delete(self, interaction: discord.Interaction, name: str):
+        if not await check_interaction_authorization(interaction): return
+        from utils.character_storage import delete_character
+        if await delete_character(name):
+            await interaction.response.send_message(f"🗑️ 已刪除全域角色 **{name}**")
+        else:
+            await interaction.response.send_message(f"❌ 找不到全域角色 **{name}**", ephemeral=True)
+
+    @init_group.command(name="hp", description="調整角色 HP")
+    @app_commands.describe(name="角色名稱", delta="增減數值 (例如 -5 或 3)")
+    @app_commands.autocomplete(name=entry_autocomplete)
+    async def slash_init_hp(self, interaction: discord.Interaction, name: str, delta: int):
+        if not await check_interaction_authorization(interaction): return
+        success, result = await modify_hp(interaction.channel_id, name, delta)
+        if success:
+            await interaction.response.send_message(f"{'💚' if delta > 0 else '💔'} **{name}** HP {'+' if delta >= 0 else ''}{delta} → **{result}**")
+        else:
+            await interaction.response.send_message(f"❌ {result}", ephemeral=True)
+
+    @init_group.command(name="elements", description="調整角色元素")
+    @app_commands.describe(name="角色名稱", delta="增減數值")
+    @app_commands.autocomplete(name=entry_autocomplete)
+    async def slash_init_elements(self, interaction: discord.Interaction, name: str, delta: int):
+        if not await check_interaction_authorization(interaction): return
+        success, result = await modify_elements(interaction.channel_id, name, delta)
+        if success:
+            await interaction.response.send_message(f"✨ **{name}** 元素 {'+' if delta >= 0 else ''}{delta} → **{result}**")
+        else:
+            await interaction.response.send_message(f"❌ {result}", ephemeral=True)
+
+    @init_group.command(name="status", description="為角色新增狀態")
+    @app_commands.describe(name="角色名稱", status="狀態名稱")
+    @app_commands.autocomplete(name=entry_autocomplete)
+    async def slash_init_status(self, interaction: discord.Interaction, name: str, status: str):
+        if not await check_interaction_authorization(interaction): return
+        if await add_status(interaction.channel_id, name, status, ""):
+            await interaction.response.send_message(f"✨ **{name}** 獲得狀態 **{status}**")
+        else:
+            await interaction.response.send_message(f"❌ 找不到 **{name}**", ephemeral=True)
+
+    @init_group.command(name="remove", description="從先攻表移除角色")
+    @app_commands.describe(name="角色名稱")
+    @app_commands.autocomplete(name=entry_autocomplete)
+    async def slash_init_remove(self, interaction: discord.Interaction, name: str):
+        if not await check_interaction_authorization(interaction): return
+        if await remove_entry(interaction.channel_id, name):
+            await interaction.response.send_message(f"✅ 已移除 **{name}**")
+        else:
+            await interaction.response.send_message(f"❌ 找不到 **{name}**", ephemeral=True)
+
+
+def character_embed(name: str, data: dict) -> discord.Embed:
+    """全域角色詳情 Embed (`!char show` 與 `/char show` 共用)"""
+    stats = data.get("stats", {})
+    dice = data.get("favorite_dice", {})
+    formula = data.get("initiative_formula")
+
+    embed = discord.Embed(title=f"角色詳情: {name}", color=discord.Color.blue())
+    if formula:
+        embed.add_field(name="⚔️ 先攻公式", value=f"`{formula}`", inline=False)
+
+    stats_desc = []
+    if stats.get("hp") is not None: stats_desc.append(f"HP: {stats['hp']}")
+    if stats.get("elements") is not None: stats_desc.append(f"元素: {stats['elements']}")
+    if stats.get("atk") is not None: stats_desc.append(f"ATK: {stats['atk']}")
+    if stats.get("def_") is not None: stats_desc.append(f"DEF: {stats['def_']}")
+    if stats_desc:
+        embed.add_field(name="📊 基礎數值", value=" | ".join(stats_desc), inline=False)
+
+    if dice:
+        dice_desc = "\n".join(f"• **{k}**: `{v}`" for k, v in dice.items())
+        embed.add_field(name="🎲 常用骰", value=dice_desc, inline=False)
+    return embed
+
 async def setup(bot):
     await bot.add_cog(Initiative(bot))
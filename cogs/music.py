@@ -6,12 +6,20 @@ import os
 import yt_dlp
 import asyncio
 import math
-from utils.music import (load_musicsheet, save_musicsheet, download_song,
-                        find_downloaded_file, get_next_index, log_message, 
+from utils.music import (load_musicsheet, save_musicsheet, get_musicsheet, download_song,
+                        find_downloaded_file, log_message, 
                         debug_log, remove_song, convert_to_pcm, play_next,
                         PCMStreamReader, sanitize_filename,
                         list_musicsheets, create_musicsheet, delete_musicsheet,
                         switch_musicsheet, get_sheet_display_name, rename_musicsheet)
+from utils.musicsheet import index_for
+from utils.playback_session import get_session
+from utils.prefetch import schedule_prefetch
+from utils.audio_library import create_audio_source, FFMPEG_OPTIONS
+from utils.playback_engine import get_engine
+from utils.mixer import get_scene, find_scene_file, open_layer_source, SCENE_DIR
+from utils.loudness import cached_gain
+from utils.streaming import STREAM_NEW_SONGS, resolve_stream, persist_in_background
 from ui.views import QueuePaginationView, PlaySelectionView, NowPlayingView, SearchView
 import utils.shared_state as shared_state
 
@@ -107,19 +115,19 @@ class Music(commands.Cog):
                 await ctx.send("❌ 連接語音頻道失敗，請稍後再試")
                 return
 
-        musicsheet_data = load_musicsheet()
-        song_entry = next((s for s in musicsheet_data["songs"] if s["title"] == title), None)
+        sheet = get_musicsheet()
+        song_entry = sheet.find(title)
 
         if not song_entry:
             # 如果標題找不到，且是 URL，嘗試下載 (簡化處理)
             if title.startswith("http"):
                  # 這裡應該調用 add，然後重試
                  await self.add_command(ctx, url=title)
-                 musicsheet_data = load_musicsheet()
-                 song_entry = next((s for s in musicsheet_data["songs"] if s["url"] == title or s["title"] == title), None) # 可能 title 變了
-                 if not song_entry:
+                 sheet = get_musicsheet()
+                 song_entry = sheet.find_url(title) or sheet.find(title) # 可能 title 變了
+                 if not song_entry and sheet.songs:
                      # 嘗試找最後一個
-                     song_entry = musicsheet_data["songs"][-1]
+                     song_entry = sheet.songs[-1]
             
             if not song_entry:
                 log_message(f"❌ 找不到 `{title}` 在 `musicsheet.json` 中")
@@ -129,7 +137,14 @@ class Music(commands.Cog):
         title = song_entry["title"] # 確保使用正確標題
 
         song_file = find_downloaded_file(song_entry["title"])
-        if not song_file and song_entry.get("url"):
+        stream = None
+        if not song_file and song_entry.get("url") and STREAM_NEW_SONGS:
+            # 尚未下載：先直接串流播放，檔案在背景下載
+            stream = await resolve_stream(song_entry["url"])
+            if stream:
+                persist_in_background(song_entry["url"], song_entry["title"])
+
+        if not song_file and not stream and song_entry.get("url"):
             log_message(f"📥 開始下載 `{title}`")
             await ctx.send(f"📥 正在下載 `{title}`，請稍候...")
             song_file = await download_song(song_entry["url"], song_entry["title"], ctx)
@@ -139,7 +154,7 @@ class Music(commands.Cog):
                 await ctx.send(f"❌ 下載 `{title}` 失敗，請稍後再試")
                 return
 
-        if not os.path.exists(song_file):
+        if not stream and not os.path.exists(song_file):
             log_message(f"❌ 檔案不存在: {song_file}")
             await ctx.send(f"❌ 檔案不存在，請重新下載: {title}")
             return
@@ -161,28 +176,18 @@ class Music(commands.Cog):
                     
         await stop_current_playback()
 
-        for song in musicsheet_data["songs"]:
-            song["is_playing"] = (song["title"] == title)
-        save_musicsheet(musicsheet_data)
+        get_session().start(title)
+        # 背景準備接下來要播的歌
+        schedule_prefetch()
 
-        log_message(f"🎵 播放 `{title}` [操作ID: {operation_id[:8]}]")
+        log_message(f"🎵 播放 `{title}` [操作ID: {operation_id[:8]}]{' (串流)' if stream else ''}")
         await ctx.send(f"🎵 正在播放 `{title}`")
 
-        def after_playback(error):
-            if shared_state.current_operation_id != operation_id:
-                return
-            if error:
-                log_message(f"❌ 播放回調發生錯誤: {error}")
-                return
-            if shared_state.stop_reason == "manual":
-                return
-            else:
-                shared_state.stop_reason = "finished"
-                shared_state.current_operation = None
-                shared_state.current_song_title = None
-                asyncio.run_coroutine_threadsafe(play_next(ctx), ctx.bot.loop)
-
-        options = {'options': '-vn -b:a 320k -bufsize 8192k'}
+        options = FFMPEG_OPTIONS
+        # 預先分析好的響度增益 (沒有結果時使用預設音量，不在播放當下分析)
+        gain_db = None if stream else cached_gain(song_entry, song_file)
+        if stream:
+            song_file, options = stream.url, stream.ffmpeg_options(options)
         
         retries = 3
         for attempt in range(retries):
@@ -196,10 +201,10 @@ class Music(commands.Cog):
                     
                 shared_state.stop_reason = "finished"
                 
-                source = discord.FFmpegPCMAudio(song_file, **options)
-                transformed_source = discord.PCMVolumeTransformer(source, volume=0.5)
-                voice_client.play(transformed_source, after=after_playback)
-                log_message(f"✅ 開始播放 `{title}` (音量已調整)")
+                source = create_audio_source(song_file, options, gain_db, force_pcm=get_scene().active)
+                # 播放結束的 after 回呼由播放引擎處理 (直接接上已準備好的下一首，或交給 play_next)
+                get_engine().start(ctx, title, source, operation_id)
+                log_message(f"✅ 開始播放 `{title}` ({'Opus 直送' if isinstance(source, discord.FFmpegOpusAudio) else '音量已調整'})")
                 return
                 
             except Exception as e:
@@ -216,8 +221,7 @@ class Music(commands.Cog):
         if not check_authorization(ctx):
             return
         
-        musicsheet_data = load_musicsheet()
-        current_song = next((song for song in musicsheet_data["songs"] if song.get("is_playing")), None)
+        current_song = get_musicsheet().current
 
         if not current_song:
             await ctx.send("❌ 目前沒有正在播放的歌曲！")
@@ -228,10 +232,72 @@ class Music(commands.Cog):
             description=f"**{current_song['title']}**",
             color=discord.Color.green()
         )
+        stats = get_engine().stats()
+        if stats["armed"]:
+            embed.add_field(name="下一首 (已準備)", value=stats["armed"], inline=False)
+        if stats["last_gap_ms"] is not None:
+            embed.set_footer(text=f"切歌間隔 {stats['last_gap_ms']:.0f} ms (平均 {stats['avg_gap_ms']:.0f} ms)")
 
         view = NowPlayingView(ctx)
         await ctx.send(embed=embed, view=view)
 
+    @commands.command(name="downloads")
+    async def downloads_command(self, ctx):
+        """顯示下載佇列與進度"""
+        if not check_authorization(ctx):
+            return
+
+        from utils.downloads import get_download_manager, format_progress
+        await ctx.send(format_progress(get_download_manager().snapshot()))
+
+    @commands.command(name="ambience")
+    async def ambience_command(self, ctx, name: str = None, gain: float = 0.5):
+        """循環播放場景環境音 (與音樂混音)；!ambience stop 停止"""
+        if not check_authorization(ctx):
+            return
+
+        scene = get_scene()
+        if name is None or name == "stop":
+            scene.clear_ambience()
+            await ctx.send("🔇 已停止環境音")
+            return
+
+        voice_client = ctx.voice_client
+        if not voice_client:
+            await ctx.send("❌ 機器人不在語音頻道內！")
+            return
+        path = find_scene_file(name)
+        if not path:
+            await ctx.send(f"❌ 在 `{SCENE_DIR}` 找不到 `{name}`")
+            return
+
+        scene.set_ambience(name, open_layer_source(path, loop=True), gain)
+        if scene.attach(voice_client):
+            await ctx.send(f"🌧️ 環境音 `{name}` 播放中 (音量 {gain:.0%})")
+        else:
+            await ctx.send(f"🌧️ 環境音 `{name}` 將從下一首歌開始混音")
+        log_message(f"🌧️ 環境音: {path} (音量 {gain})")
+
+    @commands.command(name="sfx")
+    async def sfx_command(self, ctx, name: str, gain: float = 1.0):
+        """播放一次性音效，播放期間自動壓低音樂與環境音"""
+        if not check_authorization(ctx):
+            return
+
+        voice_client = ctx.voice_client
+        if not voice_client:
+            await ctx.send("❌ 機器人不在語音頻道內！")
+            return
+        path = find_scene_file(name)
+        if not path:
+            await ctx.send(f"❌ 在 `{SCENE_DIR}` 找不到 `{name}`")
+            return
+
+        if not get_scene().play_sfx(voice_client, name, open_layer_source(path), gain):
+            await ctx.send("⚠️ 目前的歌使用 Opus 直送，無法混入音效")
+            return
+        await ctx.send(f"💥 `{name}`")
+
     @commands.command(name="join")
     async def join_command(self, ctx):
         if not check_authorization(ctx):
@@ -265,10 +331,9 @@ class Music(commands.Cog):
         if voice_client.is_playing():
             voice_client.stop()
 
-        musicsheet_data = load_musicsheet()
-        for song in musicsheet_data["songs"]:
-            song["is_playing"] = False
-        save_musicsheet(musicsheet_data)
+        get_engine().stop()
+        get_scene().clear_ambience()
+        get_session().stop()
 
         await voice_client.disconnect()
         await ctx.send("👋 機器人已離開語音頻道！")
@@ -308,9 +373,7 @@ class Music(commands.Cog):
             title = entry.get('title', '未知標題')
             url = entry.get('url', '')
 
-            page = (current_total + i) // QUEUE_PAGE_SIZE + 1
-            track_number = ((current_total + i) % QUEUE_PAGE_SIZE) + 1
-            index = f"{page}.{track_number}"
+            index = index_for(current_total + i)
 
             formatted_results.append({
                 'index': index,
@@ -351,25 +414,22 @@ class Music(commands.Cog):
             return
 
         async with shared_state.music_lock:
-            musicsheet_data = load_musicsheet()
+            sheet = get_musicsheet()
 
-            if len(musicsheet_data["songs"]) >= MAX_SONGS:
+            if len(sheet.songs) >= MAX_SONGS:
                 await ctx.send("❌ 播放清單已滿 (最多 50 首)！")
                 return
 
-            new_song = {
+            new_song = sheet.add({
                 "title": song_title,
                 "is_downloaded": False,
                 "url": url,
                 "musicsheet": "default",
-                "index": get_next_index(musicsheet_data),
                 "is_playing": False,
                 "is_previous": False,
                 "sanitized_title": sanitize_filename(song_title)
-            }
-
-            musicsheet_data["songs"].append(new_song)
-            save_musicsheet(musicsheet_data)
+            })
+            save_musicsheet(sheet.data)
 
         await ctx.send(f"✅ 已加入播放清單：{song_title} (索引：{new_song['index']})")
 
@@ -378,7 +438,8 @@ class Music(commands.Cog):
         if not check_authorization(ctx):
             return
             
-        musicsheet_data = load_musicsheet()
+        sheet = get_musicsheet()
+        musicsheet_data = sheet.data
         current_songs_count = len(musicsheet_data["songs"])
 
         if current_songs_count >= MAX_SONGS:
@@ -424,20 +485,18 @@ class Music(commands.Cog):
             if entry and 'url' in entry and 'title' in entry:
                 title = entry.get('title', '未知標題')
                 
-                if any(song["title"] == title for song in musicsheet_data["songs"]):
+                if sheet.find(title):
                     continue
                 
-                new_song = {
+                sheet.add({
                     "title": title,
                     "is_downloaded": False,
                     "url": entry['url'],
                     "musicsheet": "default",
-                    "index": get_next_index(musicsheet_data),
                     "is_playing": False,
                     "is_previous": False,
                     "sanitized_title": sanitize_filename(title)
-                }
-                musicsheet_data["songs"].append(new_song)
+                })
                 added_count += 1
 
         save_musicsheet(musicsheet_data)
@@ -461,13 +520,9 @@ class Music(commands.Cog):
                 marker = "▶ " if name == current else "   "
                 
                 from utils.music import get_musicsheet_path
-                path = get_musicsheet_path(name)
                 try:
-                    with open(path, "r", encoding="utf-8") as f:
-                        import json
-                        data = json.load(f)
-                        count = len(data.get("songs", []))
-                except:
+                    count = len(load_musicsheet(get_musicsheet_path(name)).get("songs", []))
+                except Exception:
                     count = 0
                 
                 lines.append(f"{marker}**{display}** (`{name}`) - {count} 首")
@@ -525,6 +580,8 @@ class Music(commands.Cog):
             name = sub_cmd
             success, msg = switch_musicsheet(name)
             if success:
+                # 下一首已不同，重新準備
+                get_engine().schedule_arm()
                 display = get_sheet_display_name(name)
                 await ctx.send(f"🔄 已切換到歌單: **{display}**")
             else:
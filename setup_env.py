@@ -33,7 +33,7 @@ def setup():
     if new_token:
         current_token = new_token
 
-    new_db = input("請輸入 PostgreSQL 連線字串 (直接按 Enter 保留當前值): ").strip()
+    new_db = input("請輸入資料庫連線字串 postgres://... 或 sqlite:///data/goose.db (直接按 Enter 保留當前值): ").strip()
     if new_db:
         current_db = new_db
 
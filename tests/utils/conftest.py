@@ -4,13 +4,68 @@ Handles mocking of problematic dependencies.
 """
 
 import sys
+import pytest
 from unittest.mock import MagicMock
 
-sys.modules['pydub'] = MagicMock()
-sys.modules['pydub.AudioSegment'] = MagicMock()
 sys.modules['yt_dlp'] = MagicMock()
 sys.modules['yt_dlp.utils'] = MagicMock()
 sys.modules['fuzzywuzzy'] = MagicMock()
 sys.modules['fuzzywuzzy.fuzz'] = MagicMock()
 sys.modules['asyncpg'] = MagicMock()
 sys.modules['dotenv'] = MagicMock()
+
+
+@pytest.fixture(autouse=True)
+def isolated_journal(tmp_path, monkeypatch):
+    """Point the write-ahead journal at a temp file and reset it per test."""
+    import utils.journal as journal
+
+    monkeypatch.setattr(journal, "JOURNAL_PATH", str(tmp_path / "journal.log"))
+    journal.close_journal()
+    yield journal
+    journal.close_journal()
+
+
+@pytest.fixture(autouse=True)
+def isolated_character_cache(monkeypatch):
+    """Give every test a fresh (detached, therefore disabled) character cache."""
+    import utils.character_cache as character_cache
+    import utils.name_index as name_index
+
+    name_index.reset_character_index()
+    cache = character_cache.CharacterCache()
+    monkeypatch.setattr(character_cache, "_cache", cache)
+    yield cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_musicsheet_store(monkeypatch):
+    """Fresh in-memory musicsheet store so no parsed sheet leaks between tests."""
+    import utils.musicsheet as musicsheet
+
+    store = musicsheet.MusicsheetStore()
+    monkeypatch.setattr(musicsheet, "_store", store)
+    yield store
+
+
+@pytest.fixture(autouse=True)
+def isolated_playback_session(tmp_path, monkeypatch):
+    """Per-test playback state file, so tests never touch musicsheet/playback_state.json."""
+    import utils.playback_session as playback_session
+
+    session = playback_session.PlaybackSession(str(tmp_path / "playback_state.json"))
+    monkeypatch.setattr(playback_session, "_session", session)
+    yield session
+
+
+@pytest.fixture
+async def sqlite_database(tmp_path):
+    """Real SQLite backend so merge / version statements run end to end"""
+    from utils import db
+
+    backend = db.SQLiteBackend(str(tmp_path / "goose.db"))
+    await backend.connect()
+    db.Database._backend = backend
+    await db.init_db()
+    yield backend
+    await db.Database.close()
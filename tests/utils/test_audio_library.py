@@ -0,0 +1,149 @@
+"""
+Test suite for utils/audio_library.py
+
+Tests cover:
+- Native Opus downloads are stream-copied, other formats encoded once without a fixed volume
+- The measured gain is encoded from the kept download, so files go through one lossy generation
+- A gain is only applied when one is passed (the measured loudness gain)
+- Failed / missing ffmpeg leaves no partial files
+- Opus files play through passthrough, legacy files through PCM + volume
+"""
+
+import os
+import pytest
+from unittest.mock import MagicMock, patch
+from utils import audio_library
+from utils.audio_library import transcode_to_opus, finalize_download, create_audio_source
+
+
+def completed(returncode, stderr=""):
+    return MagicMock(returncode=returncode, stderr=stderr)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "Song.source"
+    path.write_bytes(b"webm")
+    return str(path)
+
+
+def fake_ffmpeg(results):
+    """subprocess.run 替身：成功時寫出 ffmpeg 的輸出檔"""
+    commands = []
+
+    def run(command, **kwargs):
+        commands.append(command)
+        result = results[len(commands) - 1]
+        if result.returncode == 0:
+            with open(command[-1], "wb") as f:
+                f.write(b"OggS")
+        return result
+
+    return run, commands
+
+
+class TestTranscode:
+
+    def test_download_is_stream_copied_without_volume(self, source, tmp_path):
+        run, commands = fake_ffmpeg([completed(0)])
+        target = str(tmp_path / "Song.opus")
+        with patch("utils.audio_library.subprocess.run", side_effect=run):
+            assert transcode_to_opus(source, target) is True
+
+        assert len(commands) == 1
+        assert commands[0][commands[0].index("-c:a") + 1] == "copy"
+        assert "-af" not in commands[0]
+        assert os.path.exists(target) and not os.path.exists(source)
+        assert not os.path.exists(f"{target}.part")
+
+    def test_non_opus_source_falls_back_to_encode(self, source, tmp_path):
+        run, commands = fake_ffmpeg([completed(1, "codec not supported"), completed(0)])
+        with patch("utils.audio_library.subprocess.run", side_effect=run):
+            assert transcode_to_opus(source, str(tmp_path / "Song.opus")) is True
+
+        assert commands[0][commands[0].index("-c:a") + 1] == "copy"
+        assert "libopus" in commands[1] and "-af" not in commands[1]
+        assert commands[1][commands[1].index("-ar") + 1] == "48000"
+
+    def test_gain_is_encoded_in_one_pass(self, source, tmp_path):
+        run, commands = fake_ffmpeg([completed(0)])
+        with patch("utils.audio_library.subprocess.run", side_effect=run):
+            assert transcode_to_opus(source, str(tmp_path / "Song.opus"), gain_db=-4.5) is True
+
+        assert len(commands) == 1
+        assert commands[0][commands[0].index("-af") + 1] == "volume=-4.50dB"
+        assert "libopus" in commands[0]
+
+    def test_failure_keeps_source(self, source, tmp_path):
+        run, _ = fake_ffmpeg([completed(1, "bad input")])
+        with patch("utils.audio_library.subprocess.run", side_effect=run), \
+             patch("utils.music.log_message") as mock_log:
+            assert transcode_to_opus(source, str(tmp_path / "Song.opus"), gain_db=-6.0) is False
+
+        assert os.path.exists(source)
+        assert "bad input" in mock_log.call_args[0][0]
+
+    def test_missing_ffmpeg(self, source, tmp_path):
+        with patch("utils.audio_library.subprocess.run", side_effect=FileNotFoundError), \
+             patch("utils.music.log_message"):
+            assert transcode_to_opus(source, str(tmp_path / "Song.opus")) is False
+
+    def test_finalize_paths(self, tmp_path):
+        with patch("utils.audio_library.transcode_to_opus", return_value=True) as mock_transcode:
+            assert finalize_download(str(tmp_path), "Song")() is True
+        mock_transcode.assert_called_once_with(str(tmp_path / "Song.source"), str(tmp_path / "Song.opus"),
+                                               keep_source=True)
+
+    def test_keep_source_for_later_gain(self, source, tmp_path):
+        run, _ = fake_ffmpeg([completed(0)])
+        with patch("utils.audio_library.subprocess.run", side_effect=run):
+            assert transcode_to_opus(source, str(tmp_path / "Song.opus"), keep_source=True) is True
+        assert os.path.exists(source)
+
+
+class TestApplyGain:
+
+    def test_gain_is_encoded_from_the_source(self, source, tmp_path):
+        target = tmp_path / "Song.opus"
+        target.write_bytes(b"OggS copy")
+        run, commands = fake_ffmpeg([completed(0)])
+        with patch("utils.audio_library.subprocess.run", side_effect=run):
+            assert audio_library.apply_gain_to_opus(str(target), -4.0) is True
+
+        assert len(commands) == 1
+        assert commands[0][commands[0].index("-i") + 1] == source
+        assert commands[0][commands[0].index("-af") + 1] == "volume=-4.00dB"
+        assert not os.path.exists(source)
+
+    def test_legacy_file_without_source_is_reencoded(self, tmp_path):
+        target = tmp_path / "Old.opus"
+        target.write_bytes(b"OggS")
+        run, commands = fake_ffmpeg([completed(0)])
+        with patch("utils.audio_library.subprocess.run", side_effect=run):
+            assert audio_library.apply_gain_to_opus(str(target), -4.0) is True
+        assert commands[0][commands[0].index("-i") + 1] == str(target)
+
+    def test_discard_source(self, source, tmp_path):
+        audio_library.discard_source(str(tmp_path / "Song.opus"))
+        assert not os.path.exists(source)
+        audio_library.discard_source(str(tmp_path / "Song.opus"))     # 已刪除時不報錯
+
+
+class TestCreateAudioSource:
+
+    def test_opus_passthrough(self):
+        with patch("utils.audio_library.discord.FFmpegOpusAudio") as mock_opus, \
+             patch("utils.audio_library.discord.PCMVolumeTransformer") as mock_volume:
+            source = create_audio_source("song/Song.opus", {"options": "-vn"})
+
+        mock_opus.assert_called_once_with("song/Song.opus", codec="copy")
+        mock_volume.assert_not_called()
+        assert source is mock_opus.return_value
+
+    def test_legacy_file_uses_pcm_volume(self):
+        with patch("utils.audio_library.discord.FFmpegPCMAudio") as mock_pcm, \
+             patch("utils.audio_library.discord.PCMVolumeTransformer") as mock_volume:
+            create_audio_source("song/Song.mp3", {"options": "-vn"})
+
+        mock_pcm.assert_called_once_with("song/Song.mp3", options="-vn")
+        mock_volume.assert_called_once_with(mock_pcm.return_value, volume=audio_library.PCM_VOLUME)
@@ -0,0 +1,218 @@
+"""
+Test suite for utils/character_cache.py
+
+Tests cover:
+- CharacterCache: disabled until a notifier is attached, hit/miss counters
+- Cross-instance invalidation through a shared LocalNotifier
+- Read-through / write-through integration with character_storage
+- PostgresNotifier shutdown does not reconnect
+"""
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from utils.character_cache import CharacterCache, LocalNotifier, PostgresNotifier
+
+
+class FakeListenConnection:
+    """模擬 asyncpg 連線：close() 時觸發仍註冊的斷線監聽"""
+
+    def __init__(self):
+        self.termination_listeners = []
+
+    async def add_listener(self, channel, callback):
+        pass
+
+    def add_termination_listener(self, callback):
+        self.termination_listeners.append(callback)
+
+    def remove_termination_listener(self, callback):
+        self.termination_listeners.remove(callback)
+
+    async def close(self):
+        for callback in list(self.termination_listeners):
+            callback(self)
+
+
+@pytest.fixture
+async def two_instances():
+    """Two caches (simulating two bot processes) sharing one notifier"""
+    notifier = LocalNotifier()
+    first, second = CharacterCache(), CharacterCache()
+    await first.attach(notifier)
+    await second.attach(notifier)
+    yield first, second
+    await first.detach()
+
+
+class TestCharacterCache:
+    def test_disabled_without_notifier(self):
+        cache = CharacterCache()
+        cache.put("Aragorn", {"stats": {}}, cache.token())
+        assert cache.get("Aragorn") is None
+        assert cache.stats()["doc_misses"] == 0
+
+    @pytest.mark.asyncio
+    async def test_hits_and_copies(self):
+        cache = CharacterCache()
+        await cache.attach(LocalNotifier())
+        assert cache.get("Aragorn") is None
+        cache.put("Aragorn", {"stats": {"hp": 10}}, cache.token())
+
+        doc = cache.get("Aragorn")
+        doc["stats"]["hp"] = 0
+        assert cache.get("Aragorn")["stats"]["hp"] == 10
+
+        stats = cache.stats()
+        assert (stats["doc_hits"], stats["doc_misses"]) == (2, 1)
+        assert stats["hit_ratio"] == pytest.approx(2 / 3)
+
+    @pytest.mark.asyncio
+    async def test_stale_read_is_not_cached(self):
+        cache = CharacterCache()
+        await cache.attach(LocalNotifier())
+        token = cache.token()
+        cache.handle_message({"origin": "other", "op": "upsert", "names": ["Aragorn"]})
+        cache.put("Aragorn", {"stats": {"hp": 1}}, token)
+        assert cache.get("Aragorn") is None
+
+    @pytest.mark.asyncio
+    async def test_sorted_names_write_through(self):
+        cache = CharacterCache()
+        await cache.attach(LocalNotifier())
+        cache.set_names(["Gimli", "Aragorn"], cache.token())
+        cache.apply_patch("Boromir", {"stats": {}})
+        cache.apply_patch("Aragorn", {"stats": {}})
+        cache.remove("Gimli")
+        assert cache.names() == ["Aragorn", "Boromir"]
+
+
+class TestCrossInstanceInvalidation:
+    @pytest.mark.asyncio
+    async def test_upsert_invalidates_other_instance(self, two_instances):
+        first, second = two_instances
+        for cache in (first, second):
+            cache.put("Aragorn", {"stats": {"hp": 10}}, cache.token())
+            cache.set_names(["Aragorn"], cache.token())
+
+        first.apply_patch("Aragorn", {"stats": {"hp": 20}})
+        await first.publish("upsert", ["Aragorn", "Legolas"])
+
+        assert first.get("Aragorn")["stats"]["hp"] == 20
+        assert second.get("Aragorn") is None
+        assert second.names() == ["Aragorn", "Legolas"]
+
+    @pytest.mark.asyncio
+    async def test_delete_and_full_invalidation(self, two_instances):
+        first, second = two_instances
+        second.put("Gimli", {"stats": {}}, second.token())
+        second.set_names(["Aragorn", "Gimli"], second.token())
+
+        await first.publish("delete", ["Gimli"])
+        assert second.get("Gimli") is None
+        assert second.names() == ["Aragorn"]
+
+        with patch("utils.character_cache.NOTIFY_MAX_PAYLOAD", 10):
+            await first.publish("upsert", ["Aragorn"])
+        assert second.names() is None
+
+    @pytest.mark.asyncio
+    async def test_attach_replaces_previous_notifier(self):
+        cache = CharacterCache()
+        old, new = LocalNotifier(), LocalNotifier()
+        await cache.attach(old)
+        await cache.attach(new)
+        assert old._callbacks == []
+        assert new._callbacks == [cache.handle_message]
+
+    @pytest.mark.asyncio
+    async def test_start_sync_runs_once(self, isolated_character_cache, sqlite_database):
+        from utils.character_cache import start_character_sync
+
+        await start_character_sync()
+        notifier = isolated_character_cache._notifier
+        await start_character_sync()            # on_ready 重新連線後再次觸發
+        assert isolated_character_cache._notifier is notifier
+        assert notifier._callbacks == [isolated_character_cache.handle_message]
+
+
+class TestPostgresNotifier:
+    @pytest.mark.asyncio
+    async def test_stop_does_not_reconnect(self):
+        conn = FakeListenConnection()
+        messages = []
+        notifier = PostgresNotifier("postgres://localhost/goose")
+        with patch("asyncpg.connect", new=AsyncMock(return_value=conn)):
+            await notifier.start(messages.append)
+        assert conn.termination_listeners
+
+        await notifier.stop()
+
+        assert notifier._reconnect_task is None
+        assert notifier._conn is None
+        assert messages == []
+
+    @pytest.mark.asyncio
+    async def test_unexpected_disconnect_still_reconnects(self):
+        conn = FakeListenConnection()
+        messages = []
+        notifier = PostgresNotifier("postgres://localhost/goose")
+        with patch("asyncpg.connect", new=AsyncMock(return_value=conn)):
+            await notifier.start(messages.append)
+            conn.termination_listeners[0](conn)
+            assert messages == [{"all": True}]
+            assert notifier._reconnect_task is not None
+            await notifier.stop()
+        assert notifier._reconnect_task is None
+
+
+class TestStorageIntegration:
+    @pytest.mark.asyncio
+    async def test_read_through_and_write_through(self, tmp_path, isolated_character_cache):
+        from utils import db, query_metrics
+        from utils.character_storage import save_character, get_character, get_all_names, delete_character
+
+        backend = db.SQLiteBackend(str(tmp_path / "goose.db"))
+        await backend.connect()
+        db.Database._backend = backend
+        await isolated_character_cache.attach(LocalNotifier())
+        query_metrics.reset()
+        try:
+            with patch("utils.character_storage.log_message"):
+                await db.init_db()
+                await save_character("Aragorn", {"hp": 10}, ["stats"])
+
+                assert (await get_character("Aragorn"))["stats"]["hp"] == 10
+                assert (await get_character("Aragorn"))["stats"]["hp"] == 10
+                assert await get_all_names() == ["Aragorn"]
+                assert await get_all_names() == ["Aragorn"]
+
+                # write-through：更新後不需重新查詢即為最新
+                await save_character("Aragorn", {"hp": 30}, ["stats"])
+                assert (await get_character("Aragorn"))["stats"]["hp"] == 30
+                await save_character("Boromir", {"hp": 5}, ["stats"])
+                assert await get_all_names() == ["Aragorn", "Boromir"]
+
+                await delete_character("Aragorn")
+                assert await get_all_names() == ["Boromir"]
+        finally:
+            await db.Database.close()
+
+        queries = query_metrics.snapshot()["queries"]
+        assert queries["character_select"]["count"] == 1
+        assert queries["select_characters"]["count"] == 1
+        query_metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_names_sorted_the_same_with_and_without_cache(self, isolated_character_cache):
+        from utils.character_storage import get_all_names
+
+        rows = [{"name": n} for n in ["bard", "Zed", "Árni", "Aragorn"]]
+        with patch("utils.character_storage.Database") as mock_db:
+            mock_db.fetch = AsyncMock(return_value=rows)
+            uncached = await get_all_names()
+            await isolated_character_cache.attach(LocalNotifier())
+            loaded = await get_all_names()
+            cached = await get_all_names()
+
+        assert uncached == loaded == cached == sorted(n["name"] for n in rows)
+        assert mock_db.fetch.await_count == 2
@@ -12,6 +12,7 @@ Tests cover:
 import pytest
 import json
 from unittest.mock import AsyncMock, MagicMock, patch
+from utils.db import decode_json
 from utils.character_storage import (
     save_character,
     get_character,
@@ -52,8 +53,10 @@ def sample_stored_data():
 
 @pytest.fixture
 def mock_database():
-    """Mock Database class"""
-    with patch('utils.character_storage.Database') as mock_db:
+    """Mock Database class (shared with the version log so no real backend is touched)"""
+    with patch('utils.character_storage.Database') as mock_db, \
+            patch('utils.character_versions.Database', mock_db):
+        mock_db.fetchrow = AsyncMock(return_value={"version": 1, "notified": True})
         yield mock_db
 
 
@@ -81,13 +84,13 @@ class TestSaveCharacter:
 
         # Verify
         assert result is True
-        mock_database.execute.assert_called_once()
-        call_args = mock_database.execute.call_args
+        mock_database.fetchrow.assert_called_once()
+        call_args = mock_database.fetchrow.call_args
         assert "INSERT INTO characters" in call_args[0][0]
         assert call_args[0][1] == "Aragorn"
         
         # Verify JSON data structure
-        saved_data = json.loads(call_args[0][2])
+        saved_data = decode_json(call_args[0][2])
         assert saved_data["stats"]["hp"] == 100
         assert saved_data["favorite_dice"]["initiative"] == "1d20+5"
         assert saved_data["initiative_formula"] == "1d20+5"
@@ -96,29 +99,25 @@ class TestSaveCharacter:
 
     @pytest.mark.asyncio
     async def test_save_character_update_existing(self, mock_database, mock_log_message, sample_char_data):
-        """Test updating an existing character"""
-        # Setup - existing data
-        existing_data = {
-            "stats": {"hp": 50, "elements": [], "atk": 10, "def_": 5},
-            "favorite_dice": {"old": "1d6"},
-            "initiative_formula": "1d20"
-        }
-        mock_database.fetchval = AsyncMock(return_value=json.dumps(existing_data))
-        mock_database.execute = AsyncMock(return_value="UPDATE 1")
+        """Test updating an existing character merges only the selected fields server-side"""
+        # Setup
+        mock_database.fetchval = AsyncMock()
+        mock_database.execute = AsyncMock(return_value="INSERT 0 1")
 
         # Execute
         result = await save_character("Aragorn", sample_char_data, ["stats"])
 
-        # Verify
+        # Verify - single round-trip: no read before write, version record and NOTIFY in the same statement
         assert result is True
-        call_args = mock_database.execute.call_args
-        saved_data = json.loads(call_args[0][2])
-        
-        # Stats should be updated
-        assert saved_data["stats"]["hp"] == 100
-        # Other fields should remain unchanged
-        assert saved_data["favorite_dice"]["old"] == "1d6"
-        assert saved_data["initiative_formula"] == "1d20"
+        mock_database.fetchval.assert_not_called()
+        mock_database.execute.assert_not_called()
+        mock_database.fetchrow.assert_awaited_once()
+        call_args = mock_database.fetchrow.call_args
+        assert "ON CONFLICT (name) DO UPDATE SET data = characters.data ||" in call_args[0][0]
+
+        # Only the selected top-level field is in the patch, other fields stay untouched
+        patch = decode_json(call_args[0][3])
+        assert patch == {"stats": {"hp": 100, "elements": ["fire", "water"], "atk": 15, "def_": 10}}
 
     @pytest.mark.asyncio
     async def test_save_character_partial_fields(self, mock_database, mock_log_message, sample_char_data):
@@ -132,8 +131,8 @@ class TestSaveCharacter:
 
         # Verify
         assert result is True
-        call_args = mock_database.execute.call_args
-        saved_data = json.loads(call_args[0][2])
+        call_args = mock_database.fetchrow.call_args
+        saved_data = decode_json(call_args[0][2])
         
         # Only dice should be set, stats should remain as initialized (empty dict)
         assert saved_data["favorite_dice"]["initiative"] == "1d20+5"
@@ -151,8 +150,8 @@ class TestSaveCharacter:
 
         # Verify
         assert result is True
-        call_args = mock_database.execute.call_args
-        saved_data = json.loads(call_args[0][2])
+        call_args = mock_database.fetchrow.call_args
+        saved_data = decode_json(call_args[0][2])
         
         # No fields selected, so all remain as initialized
         assert saved_data["stats"] == {}
@@ -164,7 +163,7 @@ class TestSaveCharacter:
         """Test handling database errors"""
         # Setup
         mock_database.fetchval = AsyncMock(return_value=None)
-        mock_database.execute = AsyncMock(side_effect=Exception("DB connection failed"))
+        mock_database.fetchrow = AsyncMock(side_effect=Exception("DB connection failed"))
 
         # Execute
         result = await save_character("Aragorn", sample_char_data, ["stats"])
@@ -187,8 +186,8 @@ class TestSaveCharacter:
 
         # Verify
         assert result is True
-        call_args = mock_database.execute.call_args
-        saved_data = json.loads(call_args[0][2])
+        call_args = mock_database.fetchrow.call_args
+        saved_data = decode_json(call_args[0][2])
         
         # Should handle missing fields gracefully
         assert saved_data["stats"]["hp"] == 100
@@ -324,6 +323,28 @@ class TestDeleteCharacter:
         mock_log_message.assert_called()
         assert "❌" in mock_log_message.call_args[0][0]
 
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("outcome", [Exception("DB error"), "DELETE 0"])
+    async def test_failed_delete_keeps_pending_save(self, mock_database, mock_log_message, sample_char_data, outcome):
+        """A delete that fails or removes nothing must not drop the journalled save"""
+        from utils.journal import get_journal
+
+        journal = get_journal()
+        journal.degraded = True
+        await save_character("Aragorn", sample_char_data, ["stats"])
+        journal.degraded = False
+
+        if isinstance(outcome, Exception):
+            mock_database.execute = AsyncMock(side_effect=outcome)
+        else:
+            mock_database.execute = AsyncMock(return_value=outcome)
+        assert await delete_character("Aragorn") is False
+        assert journal.latest("character", "Aragorn") is not None
+
+        mock_database.execute = AsyncMock(return_value="DELETE 1")
+        assert await delete_character("Aragorn") is True
+        assert journal.latest("character", "Aragorn") is None
+
     @pytest.mark.asyncio
     async def test_delete_character_empty_name(self, mock_database, mock_log_message):
         """Test deleting with empty character name"""
@@ -356,8 +377,8 @@ class TestGetAllNames:
         # Execute
         result = await get_all_names()
 
-        # Verify
-        assert result == ["Aragorn", "Legolas", "Gimli"]
+        # Verify (sorted in Python, same order as the cached name list)
+        assert result == ["Aragorn", "Gimli", "Legolas"]
         mock_database.fetch.assert_called_once()
         call_args = mock_database.fetch.call_args
         assert "SELECT name FROM characters" in call_args[0][0]
@@ -507,7 +528,7 @@ class TestEdgeCases:
 
         # Verify
         assert result is True
-        call_args = mock_database.execute.call_args
+        call_args = mock_database.fetchrow.call_args
         assert call_args[0][1] == "Aragorn's Heir (v2)"
 
     @pytest.mark.asyncio
@@ -576,3 +597,96 @@ class TestEdgeCases:
         assert result is not None
         assert result["stats"]["hp"] is None
         assert result["favorite_dice"] is None
+
+
+# ==================== Server-side merge (SQLite) ====================
+
+class TestMergeUpsert:
+    """save_character / save_characters against a real database"""
+
+    @pytest.mark.asyncio
+    async def test_merge_keeps_unselected_fields(self, sqlite_database, mock_log_message, sample_char_data):
+        await save_character("Aragorn", sample_char_data, ["dice", "formula"])
+        await save_character("Aragorn", dict(sample_char_data, hp=5, favorite_dice={}), ["stats"])
+
+        data = await get_character("Aragorn")
+        assert data["stats"]["hp"] == 5
+        assert data["favorite_dice"] == {"initiative": "1d20+5", "attack": "2d6+3"}
+        assert data["initiative_formula"] == "1d20+5"
+
+    @pytest.mark.asyncio
+    async def test_save_characters_bulk(self, sqlite_database, mock_log_message):
+        from utils.character_storage import save_characters
+
+        entries = [{"name": f"Goblin{i}", "hp": i, "last_formula": "1d20"} for i in range(20)]
+        assert await save_characters(entries, ["stats", "formula"]) == 20
+
+        assert len(await get_all_names()) == 20
+        data = await get_character("Goblin7")
+        assert data["stats"]["hp"] == 7
+        assert data["initiative_formula"] == "1d20"
+
+    @pytest.mark.asyncio
+    async def test_pending_patches_fold(self, sqlite_database, mock_log_message, sample_char_data):
+        from utils.journal import get_journal
+
+        journal = get_journal()
+        journal.degraded = True
+        await save_character("Legolas", sample_char_data, ["stats"])
+        await save_character("Legolas", sample_char_data, ["formula"])
+
+        data = await get_character("Legolas")
+        assert data["stats"]["hp"] == 100
+        assert data["initiative_formula"] == "1d20+5"
+
+        assert await journal.replay() == 1
+        journal.degraded = False
+        assert (await get_character("Legolas"))["initiative_formula"] == "1d20+5"
+
+    @pytest.mark.asyncio
+    async def test_degraded_patch_keeps_existing_fields(self, sqlite_database, mock_log_message, sample_char_data,
+                                                        isolated_character_cache):
+        from utils.journal import get_journal
+        from utils.character_cache import LocalNotifier
+
+        await isolated_character_cache.attach(LocalNotifier())
+        await save_character("Aragorn", sample_char_data, ["stats", "dice", "formula"])
+        assert (await get_character("Aragorn"))["favorite_dice"]      # 載入快取
+
+        journal = get_journal()
+        journal.degraded = True
+        await save_character("Aragorn", dict(sample_char_data, hp=7), ["stats"])
+
+        data = await get_character("Aragorn")
+        assert data["stats"]["hp"] == 7
+        assert data["favorite_dice"] == {"initiative": "1d20+5", "attack": "2d6+3"}
+        assert data["initiative_formula"] == "1d20+5"
+        journal.degraded = False
+
+    @pytest.mark.asyncio
+    async def test_get_characters_single_query(self, sqlite_database, mock_log_message, sample_char_data, mocker):
+        from utils.character_storage import get_characters
+        from utils import db
+
+        for name in ("Aragorn", "Legolas", "Gimli"):
+            await save_character(name, sample_char_data, ["stats"])
+
+        fetch = mocker.spy(db.Database, "fetch")
+        found = await get_characters(["Aragorn", "Gimli", "Sauron"])
+
+        assert set(found) == {"Aragorn", "Gimli"}
+        assert found["Gimli"]["stats"]["hp"] == 100
+        assert fetch.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_party_presets(self, sqlite_database, mock_log_message):
+        from utils.character_storage import save_party, get_party, get_all_parties, delete_party
+
+        assert await save_party("冒險隊", ["Aragorn", "Legolas"]) is True
+        assert await save_party("冒險隊", ["Aragorn", "Gimli"]) is True
+        assert await get_party("冒險隊") == ["Aragorn", "Gimli"]
+        assert await get_all_parties() == {"冒險隊": ["Aragorn", "Gimli"]}
+
+        assert await delete_party("冒險隊") is True
+        assert await delete_party("冒險隊") is False
+        assert await get_party("冒險隊") is None
@@ -0,0 +1,139 @@
+"""
+Test suite for utils/character_versions.py
+
+Tests cover:
+- apply_patch: legacy JSON-patch style diffs
+- Version records written in the same statement as the save: checkpoint every CHECKPOINT_INTERVAL versions,
+  the merged top-level fields otherwise
+- get_version / get_history: rebuild historical versions from a real SQLite database
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from utils import character_versions
+from utils.character_versions import (
+    apply_patch, get_version, get_history, format_history, CHECKPOINT_INTERVAL,
+)
+from utils.character_storage import save_character, save_characters, delete_character
+
+
+@pytest.fixture
+def mock_log_message():
+    with patch('utils.character_storage.log_message') as mock_log:
+        yield mock_log
+
+
+class TestJsonPatch:
+
+    def test_apply_legacy_diff(self):
+        old = {"stats": {"hp": 10, "atk": 3}, "favorite_dice": {"a/b": "1d6"}, "initiative_formula": "1d20"}
+        ops = [
+            {"op": "replace", "path": "/stats/hp", "value": 7},
+            {"op": "add", "path": "/stats/def_", "value": 2},
+            {"op": "remove", "path": "/favorite_dice/a~1b"},
+        ]
+
+        new = apply_patch(old, ops)
+
+        assert new == {"stats": {"hp": 7, "atk": 3, "def_": 2}, "favorite_dice": {}, "initiative_formula": "1d20"}
+        assert old["stats"]["hp"] == 10
+
+
+class TestVersionStorage:
+
+    @pytest.mark.asyncio
+    async def test_rebuild_any_version(self, sqlite_database, mock_log_message):
+        for hp in range(40):
+            await save_character("Aragorn", {"hp": hp}, ["stats"])
+
+        assert (await get_version("Aragorn"))[0] == 40
+        for version in (1, 5, 16, 17, 33, 40):
+            number, doc = await get_version("Aragorn", version)
+            assert number == version
+            assert doc["stats"]["hp"] == version - 1
+        assert await get_version("Aragorn", 41) == (None, None)
+
+    @pytest.mark.asyncio
+    async def test_reads_bounded_by_checkpoint_interval(self, sqlite_database, mock_log_message):
+        for hp in range(3 * CHECKPOINT_INTERVAL):
+            await save_character("Gimli", {"hp": hp}, ["stats"])
+
+        rows = await sqlite_database.fetch(character_versions.VERSION_RANGE, "Gimli", CHECKPOINT_INTERVAL * 2)
+        assert len(rows) == CHECKPOINT_INTERVAL
+        assert rows[0]["kind"] == "checkpoint"
+
+    @pytest.mark.asyncio
+    async def test_diffs_grow_with_change_size(self, sqlite_database, mock_log_message):
+        dice = {f"技能{i}": f"{i}d6+{i}" for i in range(50)}
+        await save_character("Legolas", {"hp": 1, "favorite_dice": dice}, ["stats", "dice"])
+        await save_character("Legolas", {"hp": 2}, ["stats"])
+
+        rows = await sqlite_database.fetch(
+            "SELECT kind, length(body) AS size FROM character_versions WHERE name = $1 ORDER BY version", "Legolas"
+        )
+        assert [row["kind"] for row in rows] == ["checkpoint", "merge"]
+        assert rows[1]["size"] < rows[0]["size"] / 10
+
+    @pytest.mark.asyncio
+    async def test_bulk_save_records_versions(self, sqlite_database, mock_log_message):
+        await save_characters([{"name": "Goblin", "hp": 7}], ["stats"])
+        await save_characters([{"name": "Goblin", "hp": 3}, {"name": "Orc", "hp": 15}], ["stats"])
+
+        assert (await get_version("Goblin", 1))[1]["stats"]["hp"] == 7
+        assert (await get_version("Goblin"))[1]["stats"]["hp"] == 3
+        assert (await get_version("Orc"))[0] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_bulk_saves_keep_versions_contiguous(self, sqlite_database, mock_log_message):
+        await asyncio.gather(*[
+            save_characters([{"name": "Goblin", "hp": hp}, {"name": "Goblin", "hp": hp + 100}], ["stats"])
+            for hp in range(5)
+        ])
+
+        version = await sqlite_database.fetchval("SELECT version FROM characters WHERE name = $1", "Goblin")
+        assert version == 10
+        for number in range(1, version + 1):
+            assert (await get_version("Goblin", number))[0] == number
+
+    @pytest.mark.asyncio
+    async def test_stale_version_row_is_replaced(self, sqlite_database, mock_log_message):
+        await save_character("Gimli", {"hp": 1}, ["stats"])
+        await sqlite_database.execute(
+            "INSERT INTO character_versions (name, version, kind, body) VALUES ($1, 2, 'merge', $2)",
+            "Gimli", {"stats": {"hp": 99}},
+        )
+
+        assert await save_character("Gimli", {"hp": 2}, ["stats"]) is True
+        assert (await get_version("Gimli", 2))[1]["stats"]["hp"] == 2
+
+    @pytest.mark.asyncio
+    async def test_legacy_diff_rows_still_rebuild(self, sqlite_database, mock_log_message):
+        await save_character("Gimli", {"hp": 1}, ["stats"])
+        await sqlite_database.execute(
+            "UPDATE characters SET version = 2 WHERE name = $1", "Gimli"
+        )
+        await sqlite_database.execute(
+            "INSERT INTO character_versions (name, version, kind, body) VALUES ($1, 2, 'diff', $2)",
+            "Gimli", [{"op": "replace", "path": "/stats/hp", "value": 5}],
+        )
+        await save_character("Gimli", {"hp": 6}, ["stats"])
+
+        assert (await get_version("Gimli", 2))[1]["stats"]["hp"] == 5
+        assert (await get_version("Gimli"))[1]["stats"]["hp"] == 6
+        assert [item["paths"] for item in await get_history("Gimli")] == [["/stats"], ["/stats/hp"], []]
+
+    @pytest.mark.asyncio
+    async def test_history_and_delete(self, sqlite_database, mock_log_message):
+        await save_character("Boromir", {"hp": 10, "last_formula": "1d20"}, ["stats", "formula"])
+        await save_character("Boromir", {"hp": 4}, ["stats"])
+
+        history = await get_history("Boromir")
+        assert [item["version"] for item in history] == [2, 1]
+        assert history[0]["paths"] == ["/stats"]
+        assert "/stats" in format_history("Boromir", history)
+
+        assert await delete_character("Boromir") is True
+        assert await get_history("Boromir") == []
+        await save_character("Boromir", {"hp": 1}, ["stats"])
+        assert (await get_version("Boromir"))[0] == 1
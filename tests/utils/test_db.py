@@ -0,0 +1,166 @@
+"""
+Test suite for utils/db.py
+
+Tests cover:
+- create_backend: backend selection by URL scheme
+- translate_sql: Postgres placeholders / DDL translated for SQLite
+- SQLiteBackend: schema init, upserts, asyncpg-style status strings, row access
+- JSON codec, named statement registry and pool statistics
+"""
+
+import json
+import sqlite3
+import pytest
+from utils import db
+from utils.db import (
+    SQLiteBackend, PostgresBackend, create_backend, translate_sql, init_db,
+    encode_json, decode_json, statement_name,
+)
+
+
+@pytest.fixture
+async def sqlite_db(tmp_path):
+    """Install a real SQLite backend on Database for the duration of a test."""
+    backend = SQLiteBackend(str(tmp_path / "goose.db"))
+    await backend.connect()
+    db.Database._backend = backend
+    yield backend
+    await db.Database.close()
+
+
+class TestCreateBackend:
+    def test_postgres_scheme(self):
+        assert isinstance(create_backend("postgres://u:p@localhost/goose"), PostgresBackend)
+        assert isinstance(create_backend("postgresql://localhost/goose"), PostgresBackend)
+
+    def test_sqlite_relative_and_absolute(self):
+        assert create_backend("sqlite:///data/goose.db").path == "data/goose.db"
+        assert create_backend("sqlite:////tmp/goose.db").path == "/tmp/goose.db"
+        assert create_backend("sqlite:///:memory:").path == ":memory:"
+
+    def test_unknown_scheme(self):
+        with pytest.raises(ValueError):
+            create_backend("mysql://localhost/goose")
+
+
+class TestTranslateSql:
+    def test_placeholders(self):
+        sql = "INSERT INTO t (a, b) VALUES ($1, $2) ON CONFLICT (a) DO UPDATE SET b = $2"
+        assert translate_sql(sql) == (
+            "INSERT INTO t (a, b) VALUES (?1, ?2) ON CONFLICT (a) DO UPDATE SET b = ?2"
+        )
+
+    def test_ddl_types(self):
+        sql = "CREATE TABLE t (id SERIAL PRIMARY KEY, data JSONB NOT NULL)"
+        assert translate_sql(sql) == (
+            "CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, data JSONB NOT NULL)"
+        )
+
+
+class TestSQLiteBackend:
+    @pytest.mark.asyncio
+    async def test_wal_mode(self, sqlite_db):
+        assert await sqlite_db.fetchval("PRAGMA journal_mode") == "wal"
+
+    @pytest.mark.asyncio
+    async def test_tracker_upsert_roundtrip(self, sqlite_db):
+        from utils.initiative import TRACKER_UPSERT
+
+        await init_db()
+        status = await db.Database.execute(TRACKER_UPSERT, "123", {"round": 1})
+        assert status == "INSERT 0 1"
+        # 舊呼叫方式 (已序列化的字串) 仍然可用
+        await db.Database.execute(TRACKER_UPSERT, "123", json.dumps({"round": 2}))
+
+        data = await db.Database.fetchval(
+            "SELECT data FROM initiative_trackers WHERE channel_id = $1", "123"
+        )
+        assert data == {"round": 2}
+
+    @pytest.mark.asyncio
+    async def test_delete_status_and_rows(self, sqlite_db):
+        await init_db()
+        await db.Database.execute(
+            "INSERT INTO characters (name, data) VALUES ($1, $2)", "Goblin", "{}"
+        )
+
+        rows = await db.Database.fetch("SELECT name FROM characters ORDER BY name")
+        assert [row["name"] for row in rows] == ["Goblin"]
+
+        assert await db.Database.execute("DELETE FROM characters WHERE name = $1", "Goblin") == "DELETE 1"
+        assert await db.Database.execute("DELETE FROM characters WHERE name = $1", "Goblin") == "DELETE 0"
+        assert await db.Database.fetchrow("SELECT * FROM characters WHERE name = $1", "Goblin") is None
+
+    @pytest.mark.asyncio
+    async def test_combat_history_serial_id(self, sqlite_db):
+        await init_db()
+        for i in range(3):
+            await db.Database.execute(
+                "INSERT INTO combat_history (channel_id, data) VALUES ($1, $2)", "c", {"n": i}
+            )
+        rows = await db.Database.fetch(
+            "SELECT data FROM combat_history WHERE channel_id = $1 ORDER BY ended_at DESC, id DESC LIMIT $2",
+            "c", 2,
+        )
+        assert [r["data"]["n"] for r in rows] == [2, 1]
+
+    @pytest.mark.asyncio
+    async def test_pool_stats(self, sqlite_db):
+        await db.Database.fetchval("SELECT 1")
+        stats = db.Database.pool_stats()
+        assert stats["backend"] == "sqlite"
+        assert stats["size"] == 1
+
+    @pytest.mark.asyncio
+    async def test_json_params_without_global_adapters(self, sqlite_db):
+        await init_db()
+        await db.Database.executemany(
+            "INSERT INTO combat_history (channel_id, data) VALUES ($1, $2)", [("c", {"n": 1}), ("c", [2])]
+        )
+        rows = await db.Database.fetch("SELECT data FROM combat_history ORDER BY id")
+        assert [r["data"] for r in rows] == [{"n": 1}, [2]]
+        assert (dict, sqlite3.PrepareProtocol) not in sqlite3.adapters
+        assert (list, sqlite3.PrepareProtocol) not in sqlite3.adapters
+
+    @pytest.mark.asyncio
+    async def test_statement_chain_runs_in_one_transaction(self, sqlite_db):
+        await init_db()
+        chain = db.register_statement("test_chain", "SELECT 'postgres only'", sqlite=(
+            "INSERT INTO combat_history (channel_id, data) VALUES ($1, $2) RETURNING id",
+            "INSERT INTO party_presets (name, members) VALUES ($3, $2)",
+        ))
+
+        row = await db.Database.fetchrow(chain, "c", {"n": 1}, "Party")
+        assert row["id"] == 1
+        assert await db.Database.fetchval("SELECT members FROM party_presets WHERE name = $1", "Party") == {"n": 1}
+
+        # 第二個語句失敗 (名稱重複) 時第一個語句一併回滾
+        with pytest.raises(sqlite3.IntegrityError):
+            await db.Database.fetchrow(chain, "c", {"n": 2}, "Party")
+        assert await db.Database.fetchval("SELECT COUNT(*) FROM combat_history") == 1
+
+    def test_postgres_stats_count_real_prepares(self):
+        stats = PostgresBackend("postgres://localhost/goose").stats()
+        assert stats["prepares"] == 0
+        assert stats["registered_statements"] >= 1
+
+
+class TestJsonCodec:
+    def test_encode_passthrough_and_roundtrip(self):
+        assert encode_json('{"a": 1}') == '{"a": 1}'
+        assert decode_json(encode_json({"名字": "哥布林", 1: [1, 2]})) == {"名字": "哥布林", "1": [1, 2]}
+
+    def test_decode_tolerates_native_values(self):
+        assert decode_json({"a": 1}) == {"a": 1}
+        assert decode_json(None) is None
+        assert decode_json('[1, 2]') == [1, 2]
+
+    def test_statement_registry(self):
+        from utils.initiative import TRACKER_UPSERT, TRACKER_SELECT
+        from utils.character_storage import CHARACTER_MERGE, CHARACTER_SELECT
+
+        assert statement_name(TRACKER_UPSERT) == "tracker_upsert"
+        assert statement_name(TRACKER_SELECT) == "tracker_select"
+        assert statement_name(CHARACTER_MERGE) == "character_merge"
+        assert statement_name(CHARACTER_SELECT) == "character_select"
+        assert statement_name("SELECT 1") is None
@@ -0,0 +1,147 @@
+"""
+Test suite for utils/downloads.py
+
+Tests cover:
+- In-flight deduplication and shared futures
+- Priority ordering with a bounded worker pool (and priority bumps)
+- Progress hooks feeding snapshot() / format_progress()
+- Finalize step after a successful download
+"""
+
+import asyncio
+import threading
+import pytest
+from unittest.mock import MagicMock
+from utils.downloads import (
+    DownloadManager, format_progress,
+    PRIORITY_NOW_PLAYING, PRIORITY_PREFETCH, PRIORITY_BACKGROUND,
+)
+
+
+@pytest.fixture
+def fake_ydl(mocker):
+    """YoutubeDL whose download() blocks until the test releases it and records call order"""
+    calls = []
+    release = threading.Event()
+
+    def make(options):
+        ydl = MagicMock()
+
+        def download(urls):
+            calls.append(urls[0])
+            for hook in options["progress_hooks"]:
+                hook({"status": "downloading", "downloaded_bytes": 50, "total_bytes": 100, "speed": 2e6})
+            release.wait(5)
+
+        ydl.download.side_effect = download
+        context = MagicMock()
+        context.__enter__ = MagicMock(return_value=ydl)
+        context.__exit__ = MagicMock(return_value=None)
+        return context
+
+    mocker.patch("utils.downloads.yt_dlp.YoutubeDL", side_effect=make)
+    return calls, release
+
+
+async def wait_until(predicate):
+    for _ in range(200):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+class TestDownloadManager:
+
+    @pytest.mark.asyncio
+    async def test_same_url_is_downloaded_once(self, fake_ydl):
+        calls, release = fake_ydl
+        manager = DownloadManager(workers=2)
+        try:
+            first = manager.submit("http://a", "A", {})
+            second = manager.submit("http://a", "A", {})
+            assert first is second
+
+            release.set()
+            assert await first is True
+            assert calls == ["http://a"]
+            assert manager.deduplicated == 1
+        finally:
+            await manager.close()
+
+    @pytest.mark.asyncio
+    async def test_priority_order_with_single_worker(self, fake_ydl):
+        calls, release = fake_ydl
+        manager = DownloadManager(workers=1)
+        try:
+            blocker = manager.submit("http://busy", "busy", {})
+            await wait_until(lambda: calls)
+
+            background = manager.submit("http://bg", "bg", {}, PRIORITY_BACKGROUND)
+            prefetch = manager.submit("http://pre", "pre", {}, PRIORITY_PREFETCH)
+            bumped = manager.submit("http://late", "late", {}, PRIORITY_BACKGROUND)
+            manager.submit("http://late", "late", {}, PRIORITY_NOW_PLAYING)
+
+            release.set()
+            await asyncio.gather(blocker, background, prefetch, bumped)
+            assert calls == ["http://busy", "http://late", "http://pre", "http://bg"]
+        finally:
+            await manager.close()
+
+    @pytest.mark.asyncio
+    async def test_progress_surface(self, fake_ydl):
+        calls, release = fake_ydl
+        manager = DownloadManager(workers=1)
+        try:
+            future = manager.submit("http://a", "Song A", {}, PRIORITY_NOW_PLAYING)
+            manager.submit("http://b", "Song B", {})
+            await wait_until(lambda: calls)
+
+            jobs = manager.snapshot()
+            assert [(j["title"], j["status"]) for j in jobs] == [("Song A", "downloading"), ("Song B", "queued")]
+            assert jobs[0]["percent"] == 50
+            text = format_progress(jobs)
+            assert "Song A" in text and "50%" in text and "2.0 MB/s" in text
+
+            release.set()
+            await future
+        finally:
+            await manager.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_download_resolves_false(self, mocker):
+        mocker.patch("utils.music.log_message")
+        mocker.patch("utils.downloads.yt_dlp.YoutubeDL", side_effect=RuntimeError("boom"))
+        manager = DownloadManager(workers=1)
+        try:
+            assert await manager.download("http://x", "X", {}) is False
+            assert manager.snapshot()[0]["error"] == "boom"
+            assert format_progress([]) == "📭 目前沒有下載工作"
+        finally:
+            await manager.close()
+
+    @pytest.mark.asyncio
+    async def test_finalize_runs_once_after_download(self, fake_ydl):
+        calls, release = fake_ydl
+        release.set()
+        finalize = MagicMock(return_value=True)
+        manager = DownloadManager(workers=2)
+        try:
+            first = manager.submit("http://a", "A", {}, finalize=finalize)
+            second = manager.submit("http://a", "A", {}, finalize=finalize)
+            assert await first is True and await second is True
+            finalize.assert_called_once_with()
+            assert manager.snapshot()[0]["status"] == "finished"
+        finally:
+            await manager.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_finalize_fails_download(self, fake_ydl):
+        calls, release = fake_ydl
+        release.set()
+        manager = DownloadManager(workers=1)
+        try:
+            assert await manager.download("http://a", "A", {}, finalize=lambda: False) is False
+            assert manager.snapshot()[0]["status"] == "error"
+        finally:
+            await manager.close()
@@ -1005,6 +1005,144 @@ class TestReroll:
         assert "無公式" in results[0][3]
 
 
+# ============================================
+# TESTS: COMBAT TALLY AND ARCHIVE
+# ============================================
+
+
+class TestCombatTally:
+    """Test incremental combat tally and combat_history archive."""
+
+    @pytest.mark.asyncio
+    async def test_modify_hp_updates_tally(self, channel_id, clean_tracker):
+        """Damage and healing deltas are accumulated per combatant."""
+        await initiative.add_entry(channel_id, "Hero", 20)
+        await initiative.modify_hp(channel_id, "Hero", -7)
+        await initiative.modify_hp(channel_id, "Hero", -3)
+        await initiative.modify_hp(channel_id, "Hero", 4)
+
+        tally = await initiative.get_combat_stats(channel_id)
+
+        assert tally["damage_taken"] == 10
+        assert tally["healing"] == 4
+        assert tally["combatants"]["Hero"]["damage_taken"] == 10
+        assert tally["combatants"]["Hero"]["healing"] == 4
+
+    @pytest.mark.asyncio
+    async def test_next_and_prev_turn_update_tally(self, channel_id, clean_tracker):
+        """Turns are credited on next_turn and undone on prev_turn."""
+        await initiative.add_entry(channel_id, "A", 20)
+        await initiative.add_entry(channel_id, "B", 10)
+
+        await initiative.next_turn(channel_id)  # A done
+        await initiative.next_turn(channel_id)  # B done, round 2
+        await initiative.next_turn(channel_id)  # A done
+        await initiative.prev_turn(channel_id)  # back to A
+
+        tally = await initiative.get_combat_stats(channel_id)
+
+        assert tally["turns"] == 2
+        assert tally["rounds"] == 2
+        assert tally["combatants"]["A"]["turns"] == 1
+        assert tally["combatants"]["B"]["turns"] == 1
+
+    @pytest.mark.asyncio
+    async def test_created_tally_is_persisted_once(self, channel_id, clean_tracker, mocker):
+        """A tally built for an old tracker is saved, later calls read it back without saving."""
+        save = mocker.patch("utils.initiative.save_tracker", new=AsyncMock())
+
+        first = await initiative.get_combat_stats(channel_id)
+        second = await initiative.get_combat_stats(channel_id)
+
+        assert first is second
+        save.assert_awaited_once_with(channel_id)
+
+    @pytest.mark.asyncio
+    async def test_end_combat_archives_history(self, channel_id, clean_tracker, mock_database):
+        """Ending combat writes the tally and entries to combat_history."""
+        await initiative.add_entry(channel_id, "Hero", 20)
+        await initiative.modify_hp(channel_id, "Hero", -5)
+
+        summary = await initiative.end_combat(channel_id)
+
+        archive_calls = [
+            c for c in mock_database.execute.call_args_list
+            if "INSERT INTO combat_history" in c[0][0]
+        ]
+        assert len(archive_calls) == 1
+        record = archive_calls[0][0][2]
+        assert record["tally"]["damage_taken"] == 5
+        assert record["entries"][0]["name"] == "Hero"
+        assert summary["tally"]["damage_taken"] == 5
+
+        tracker = await initiative.get_tracker(channel_id)
+        assert "tally" not in tracker
+
+    @pytest.mark.asyncio
+    async def test_archive_survives_database_outage(self, channel_id, clean_tracker, mock_database):
+        """With the database down the archive stays in the journal and is replayed later."""
+        from utils.journal import get_journal
+
+        await initiative.add_entry(channel_id, "Hero", 20)
+        mock_database.execute = AsyncMock(side_effect=Exception("DB down"))
+        journal = get_journal()
+        journal.start_replayer = MagicMock()
+
+        await initiative.end_combat(channel_id)
+        assert [r["op"] for r in journal.coalesced()].count("combat") == 1
+
+        mock_database.execute = AsyncMock()
+        await journal.replay()
+        archive_calls = [
+            c for c in mock_database.execute.call_args_list
+            if "INSERT INTO combat_history" in c[0][0]
+        ]
+        assert len(archive_calls) == 1
+        assert archive_calls[0][0][2]["entries"][0]["name"] == "Hero"
+        assert journal.pending_count() == 0
+
+    @pytest.mark.asyncio
+    async def test_archive_keeps_end_time(self, channel_id, sqlite_database):
+        """Replayed archives are stored with the time the combat ended, not the replay time."""
+        summary = {"total_rounds": 1, "total_characters": 0, "survivors": [], "tally": {"turns": 1}}
+        await initiative._write_combat(None, {
+            "channel_id": channel_id, "ended_at": 86400.0,
+            "record": {"summary": summary, "tally": {"turns": 1}, "entries": []},
+        })
+
+        history = await initiative.get_combat_history(channel_id)
+        assert history[0]["tally"] == {"turns": 1}
+        assert str(history[0]["ended_at"]).startswith("1970-01-02")
+
+    @pytest.mark.asyncio
+    async def test_end_combat_empty_tracker_not_archived(self, channel_id, clean_tracker, mock_database):
+        """Nothing is archived when no combat took place."""
+        await initiative.end_combat(channel_id)
+
+        assert not any(
+            "INSERT INTO combat_history" in c[0][0]
+            for c in mock_database.execute.call_args_list
+        )
+
+    def test_format_combat_report(self):
+        """The end-of-combat report includes the tally lines."""
+        summary = {
+            "total_rounds": 3,
+            "total_characters": 1,
+            "survivors": ["Hero"],
+            "tally": {
+                "rounds": 3, "turns": 4, "damage_taken": 9, "healing": 2,
+                "combatants": {"Hero": {"damage_taken": 9, "healing": 2, "turns": 4}},
+            },
+        }
+
+        report = initiative.format_combat_report(summary)
+
+        assert "總回合數: 3" in report
+        assert "總傷害: 9" in report
+        assert "**Hero**" in report
+
+
 # ============================================
 # TESTS: ADD ENTRY WITH ROLL
 # ============================================
@@ -1128,3 +1266,63 @@ class TestRollFavoriteDice:
         
         assert success is False
         assert "Bad formula" in msg
+
+
+# ============================================
+# TESTS: BULK IMPORT
+# ============================================
+
+
+class TestBulkImport:
+    """Test importing several global characters at once."""
+
+    @pytest.mark.asyncio
+    async def test_bulk_sorts_and_saves_once(self, channel_id, clean_tracker, mock_dice_functions, mocker):
+        mock_dice_functions["parse_and_roll"].side_effect = [(5, []), (18, []), (11, [])]
+        save = mocker.patch("utils.initiative.save_tracker", new=AsyncMock())
+
+        results = await initiative.add_entries_bulk(channel_id, {
+            "Goblin": {"initiative_formula": "1d20", "stats": {"hp": 7}},
+            "Hero": {"initiative_formula": "1d20+3", "stats": {"hp": 30}},
+            "Wizard": {},
+        })
+
+        assert [r["added"] for r in results] == [True, True, True]
+        assert results[2]["formula"] == "1d20"
+        tracker = await initiative.get_tracker(channel_id)
+        assert [e["name"] for e in tracker["entries"]] == ["Hero", "Wizard", "Goblin"]
+        assert tracker["entries"][0]["hp"] == 30
+        save.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_bulk_updates_existing_and_reports_errors(self, channel_id, clean_tracker, mock_dice_functions):
+        from utils.dice import DiceParseError
+
+        await initiative.add_entry(channel_id, "Hero", 12)
+        mock_dice_functions["parse_and_roll"].side_effect = DiceParseError("Bad formula")
+
+        results = await initiative.add_entries_bulk(channel_id, {
+            "Hero": {"stats": {"hp": 25}, "favorite_dice": {"攻擊": "1d8"}},
+            "Broken": {"initiative_formula": "bad"},
+        })
+
+        assert results[0]["added"] is False and results[0]["error"] is None
+        assert "Bad formula" in results[1]["error"]
+        entry = await initiative.get_entry(channel_id, "Hero")
+        assert entry["initiative"] == 12
+        assert entry["hp"] == 25
+        assert entry["favorite_dice"] == {"攻擊": "1d8"}
+        assert await initiative.get_entry(channel_id, "Broken") is None
+
+    @pytest.mark.asyncio
+    async def test_import_characters_reports_missing(self, channel_id, clean_tracker, mock_dice_functions, mocker):
+        mocker.patch(
+            "utils.character_storage.get_characters",
+            new=AsyncMock(return_value={"Hero": {"initiative_formula": "1d20"}}),
+        )
+
+        results, missing = await initiative.import_characters(channel_id, ["Hero", "Ghost"])
+
+        assert [r["name"] for r in results] == ["Hero"]
+        assert missing == ["Ghost"]
+        assert "Ghost" in initiative.format_import_results(results, missing)
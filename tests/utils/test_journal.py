@@ -0,0 +1,171 @@
+"""
+Test suite for utils/journal.py
+
+Tests cover:
+- Journal append/ack and rebuilding pending records after a restart
+- Coalescing to the latest record per key
+- Replay through registered appliers
+- save_tracker / load_tracker falling back to the journal when the DB is down
+"""
+
+import threading
+import pytest
+from unittest.mock import AsyncMock, patch
+from utils.journal import Journal, register_applier, _appliers
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.log")
+
+
+@pytest.fixture
+def test_applier():
+    applier = AsyncMock()
+    register_applier("test", applier)
+    yield applier
+    _appliers.pop("test", None)
+
+
+class TestJournalRecords:
+    def test_append_and_ack(self, journal_path):
+        journal = Journal(journal_path)
+        seq = journal.append("test", "a", {"v": 1})
+        assert journal.pending_count() == 1
+        assert journal.latest("test", "a") == {"v": 1}
+
+        journal.ack(seq)
+        assert journal.pending_count() == 0
+        assert journal.latest("test", "a") is None
+        journal.close()
+
+    def test_pending_survives_restart(self, journal_path):
+        journal = Journal(journal_path)
+        acked = journal.append("test", "a", {"v": 1})
+        journal.append("test", "b", {"v": 2})
+        journal.ack(acked)
+        journal.close()
+
+        reopened = Journal(journal_path)
+        assert reopened.pending_count() == 1
+        assert reopened.latest("test", "a") is None
+        assert reopened.degraded is True
+        # 序號延續，不會與舊紀錄衝突
+        assert reopened.append("test", "c", {}) == 3
+        reopened.close()
+
+    def test_truncated_last_line_ignored(self, journal_path):
+        journal = Journal(journal_path)
+        journal.append("test", "a", {"v": 1})
+        journal.close()
+        with open(journal_path, "a", encoding="utf-8") as f:
+            f.write('{"seq": 2, "op": "te')
+
+        reopened = Journal(journal_path)
+        assert reopened.pending_count() == 1
+        reopened.close()
+
+    def test_coalesced_keeps_latest_per_key(self, journal_path):
+        journal = Journal(journal_path)
+        journal.append("test", "a", {"v": 1})
+        journal.append("test", "b", {"v": 1})
+        journal.append("test", "a", {"v": 2})
+
+        records = journal.coalesced()
+        assert [(r["key"], r["data"]["v"]) for r in records] == [("b", 1), ("a", 2)]
+        journal.close()
+
+    def test_discard(self, journal_path):
+        journal = Journal(journal_path)
+        journal.append("test", "a", {"v": 1})
+        journal.append("test", "b", {"v": 1})
+        journal.discard("test", "a")
+        assert journal.latest("test", "a") is None
+        assert journal.pending_count() == 1
+        journal.close()
+
+    def test_pending_record_is_a_snapshot(self, journal_path):
+        journal = Journal(journal_path)
+        data = {"entries": [1]}
+        journal.append("test", "a", data)
+        data["entries"].append(2)
+        assert journal.latest("test", "a") == {"entries": [1]}
+
+        loaded = journal.latest("test", "a")
+        loaded["entries"].append(3)
+        assert journal.latest("test", "a") == {"entries": [1]}
+        journal.close()
+
+    @pytest.mark.asyncio
+    async def test_writes_and_fsync_run_off_the_event_loop(self, journal_path):
+        journal = Journal(journal_path)
+        threads = []
+        with patch.object(Journal, "_write_file",
+                          side_effect=lambda f, line: threads.append(threading.current_thread())), \
+             patch("utils.journal.os.fsync",
+                   side_effect=lambda fd: threads.append(threading.current_thread())):
+            journal.append("test", "a", {"v": 1})
+            journal.sync()
+            journal.close()
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+
+
+class TestJournalReplay:
+    @pytest.mark.asyncio
+    async def test_replay_applies_latest_and_clears_degraded(self, journal_path, test_applier):
+        journal = Journal(journal_path)
+        journal.append("test", "a", {"v": 1})
+        journal.append("test", "a", {"v": 2})
+        journal.degraded = True
+
+        replayed = await journal.replay()
+
+        assert replayed == 1
+        test_applier.assert_awaited_once_with("a", {"v": 2})
+        assert journal.pending_count() == 0
+        assert journal.degraded is False
+        journal.close()
+
+    @pytest.mark.asyncio
+    async def test_replay_failure_keeps_records(self, journal_path, test_applier):
+        test_applier.side_effect = Exception("connection refused")
+        journal = Journal(journal_path)
+        journal.append("test", "a", {"v": 1})
+
+        with pytest.raises(Exception):
+            await journal.replay()
+        assert journal.pending_count() == 1
+        journal.close()
+
+
+class TestTrackerJournal:
+    @pytest.mark.asyncio
+    async def test_save_tracker_degraded_keeps_state(self, isolated_journal):
+        from utils import initiative
+        import utils.shared_state as shared_state
+
+        channel_id = "journal_test_channel"
+        shared_state.initiative_trackers.pop(channel_id, None)
+        with patch("utils.initiative.Database") as mock_db, \
+                patch("utils.initiative.log_message"), patch("utils.journal.log_message"):
+            mock_db.execute = AsyncMock(side_effect=Exception("db down"))
+            mock_db.fetchval = AsyncMock(return_value=None)
+
+            await initiative.add_entry(channel_id, "Goblin", 12)
+            journal = isolated_journal.get_journal()
+            assert journal.degraded is True
+
+            # 降級期間不再嘗試寫入資料庫
+            calls = mock_db.execute.await_count
+            await initiative.add_entry(channel_id, "Orc", 8)
+            assert mock_db.execute.await_count == calls
+
+            # 重新載入時以日誌內容為準
+            shared_state.initiative_trackers.pop(channel_id, None)
+            tracker = await initiative.get_tracker(channel_id)
+            assert [e["name"] for e in tracker["entries"]] == ["Goblin", "Orc"]
+
+        if journal._replay_task is not None:
+            journal._replay_task.cancel()
+        shared_state.initiative_trackers.pop(channel_id, None)
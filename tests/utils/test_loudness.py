@@ -0,0 +1,191 @@
+"""
+Test suite for utils/loudness.py
+
+Tests cover:
+- Parsing ffmpeg loudnorm measurements (silence and missing ffmpeg)
+- Gain towards the target loudness, limited by true peak and clamps
+- Cache validity keyed by file name, size and mtime
+- One background analysis per file, written back to the song entry
+- Gain outside the passthrough tolerance baked into .opus files once, from the kept download
+- Precomputed gain applied at playback
+"""
+
+import os
+import pytest
+from unittest.mock import MagicMock, patch
+from utils import loudness
+from utils.loudness import measure_loudness, gain_for, cached_gain, LoudnessAnalyzer
+from utils.musicsheet import Musicsheet
+from utils.audio_library import create_audio_source
+
+LOUDNORM_OUTPUT = """
+[Parsed_loudnorm_0 @ 0x55]
+{
+	"input_i" : "-9.50",
+	"input_tp" : "-0.20",
+	"input_lra" : "5.10",
+	"input_thresh" : "-19.80"
+}
+"""
+
+
+class TestMeasure:
+
+    def test_parses_loudnorm_json(self):
+        result = MagicMock(returncode=0, stderr=LOUDNORM_OUTPUT)
+        with patch("utils.loudness.subprocess.run", return_value=result) as mock_run:
+            assert measure_loudness("song/A.opus") == {"lufs": -9.5, "true_peak": -0.2}
+        assert "loudnorm=print_format=json" in mock_run.call_args[0][0]
+
+    def test_silence_is_rejected(self):
+        stderr = LOUDNORM_OUTPUT.replace('"-9.50"', '"-inf"')
+        with patch("utils.loudness.subprocess.run", return_value=MagicMock(returncode=0, stderr=stderr)):
+            assert measure_loudness("song/A.opus") is None
+
+    def test_missing_ffmpeg(self):
+        with patch("utils.loudness.subprocess.run", side_effect=FileNotFoundError):
+            assert measure_loudness("song/A.opus") is None
+
+
+class TestGain:
+
+    def test_reaches_target(self, monkeypatch):
+        monkeypatch.setattr(loudness, "TARGET_LUFS", -18.0)
+        assert gain_for(-12.0, -6.0) == -6.0
+
+    def test_limited_by_true_peak(self, monkeypatch):
+        monkeypatch.setattr(loudness, "TARGET_LUFS", -18.0)
+        assert gain_for(-24.0, -3.0) == 2.0
+
+    def test_clamped(self):
+        assert gain_for(-80.0, -70.0) == loudness.MAX_BOOST_DB
+
+
+class TestCache:
+
+    def test_valid_until_file_changes(self, tmp_path):
+        path = tmp_path / "A.opus"
+        path.write_bytes(b"OggS")
+        stat = os.stat(path)
+        song = {"title": "A", "loudness": {"file": "A.opus", "size": stat.st_size,
+                                           "mtime_ns": stat.st_mtime_ns, "gain_db": -3.0}}
+        assert cached_gain(song, str(path)) == -3.0
+
+        path.write_bytes(b"OggS more data")
+        assert cached_gain(song, str(path)) is None
+        assert cached_gain({"title": "A"}, str(path)) is None
+
+
+class TestAnalyzer:
+
+    @pytest.mark.asyncio
+    async def test_analyzes_once_and_stores_in_song(self, tmp_path):
+        path = tmp_path / "A.opus"
+        path.write_bytes(b"OggS")
+        sheet = Musicsheet("unused.json", {"songs": [{"title": "A", "index": "1.1"}]}, None)
+        analyzer = LoudnessAnalyzer()
+
+        with patch.object(LoudnessAnalyzer, "_executor", return_value=None), \
+             patch("utils.loudness.measure_loudness", return_value={"lufs": -12.0, "true_peak": -6.0}) as mock_measure, \
+             patch("utils.loudness.apply_gain_to_opus", return_value=False) as mock_bake, \
+             patch("utils.music.get_musicsheet", return_value=sheet), \
+             patch("utils.music.save_musicsheet") as mock_save:
+            first = await analyzer.analyze("A", str(path))
+            second = await analyzer.analyze("A", str(path))
+
+        # 寫入增益失敗：保留增益 (播放時重新編碼)，不再重試
+        assert first == second == gain_for(-12.0, -6.0)
+        mock_measure.assert_called_once_with(str(path))
+        mock_bake.assert_called_once()
+        mock_save.assert_called_once_with(sheet.data)
+        assert sheet.find("A")["loudness"]["file"] == "A.opus"
+        assert analyzer.analyzed == 1
+
+    @pytest.mark.asyncio
+    async def test_gain_is_baked_into_opus_file(self, tmp_path):
+        path = tmp_path / "A.opus"
+        path.write_bytes(b"OggS")
+        sheet = Musicsheet("unused.json", {"songs": [{"title": "A", "index": "1.1"}]}, None)
+        analyzer = LoudnessAnalyzer()
+
+        def bake(song_path, gain_db):
+            with open(song_path, "wb") as f:
+                f.write(b"OggS re-encoded")
+            return True
+
+        with patch.object(LoudnessAnalyzer, "_executor", return_value=None), \
+             patch("utils.loudness.measure_loudness", return_value={"lufs": -12.0, "true_peak": -6.0}), \
+             patch("utils.loudness.apply_gain_to_opus", side_effect=bake) as mock_bake, \
+             patch("utils.music.get_musicsheet", return_value=sheet), \
+             patch("utils.music.save_musicsheet"):
+            assert await analyzer.analyze("A", str(path)) == 0.0
+            assert await analyzer.analyze("A", str(path)) == 0.0
+
+        mock_bake.assert_called_once_with(str(path), -6.0)
+        entry = sheet.find("A")["loudness"]
+        assert entry["applied_db"] == -6.0
+        assert entry["size"] == os.path.getsize(path)
+        assert cached_gain(sheet.find("A"), str(path)) == 0.0
+        with patch("utils.audio_library.discord.FFmpegOpusAudio") as mock_opus:
+            create_audio_source(str(path), {}, cached_gain(sheet.find("A"), str(path)))
+        mock_opus.assert_called_once_with(str(path), codec="copy")
+
+    @pytest.mark.asyncio
+    async def test_source_is_removed_once_analysis_needs_no_gain(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(loudness, "TARGET_LUFS", -18.0)
+        path = tmp_path / "A.opus"
+        path.write_bytes(b"OggS")
+        source = tmp_path / "A.source"
+        source.write_bytes(b"webm")
+        sheet = Musicsheet("unused.json", {"songs": [{"title": "A", "index": "1.1"}]}, None)
+
+        with patch.object(LoudnessAnalyzer, "_executor", return_value=None), \
+             patch("utils.loudness.measure_loudness", return_value={"lufs": -18.3, "true_peak": -6.0}), \
+             patch("utils.loudness.apply_gain_to_opus") as mock_bake, \
+             patch("utils.music.get_musicsheet", return_value=sheet), \
+             patch("utils.music.save_musicsheet"):
+            assert await LoudnessAnalyzer().analyze("A", str(path)) == pytest.approx(0.3)
+
+        mock_bake.assert_not_called()
+        assert not source.exists()
+
+    @pytest.mark.asyncio
+    async def test_failed_measurement(self, tmp_path):
+        path = tmp_path / "A.mp3"
+        path.write_bytes(b"ID3")
+        sheet = Musicsheet("unused.json", {"songs": [{"title": "A", "index": "1.1"}]}, None)
+        analyzer = LoudnessAnalyzer()
+
+        with patch.object(LoudnessAnalyzer, "_executor", return_value=None), \
+             patch("utils.loudness.measure_loudness", return_value=None), \
+             patch("utils.music.get_musicsheet", return_value=sheet):
+            assert await analyzer.analyze("A", str(path)) is None
+        assert "loudness" not in sheet.find("A")
+        assert analyzer.failed == 1
+
+
+class TestPlaybackGain:
+
+    def test_pcm_volume_from_gain(self):
+        with patch("utils.audio_library.discord.FFmpegPCMAudio"), \
+             patch("utils.audio_library.discord.PCMVolumeTransformer") as mock_volume:
+            create_audio_source("song/A.mp3", {}, gain_db=-6.0)
+        assert mock_volume.call_args[1]["volume"] == pytest.approx(0.501, abs=1e-3)
+
+    def test_forced_pcm_opus_keeps_library_volume(self):
+        with patch("utils.audio_library.discord.FFmpegPCMAudio"), \
+             patch("utils.audio_library.discord.PCMVolumeTransformer") as mock_volume:
+            create_audio_source("song/A.opus", {}, force_pcm=True)
+            assert mock_volume.call_args[1]["volume"] == 1.0
+            create_audio_source("song/A.mp3", {})
+            assert mock_volume.call_args[1]["volume"] == 0.5
+
+    def test_opus_within_tolerance_stays_passthrough(self):
+        with patch("utils.audio_library.discord.FFmpegOpusAudio") as mock_opus:
+            create_audio_source("song/A.opus", {}, gain_db=0.5)
+        mock_opus.assert_called_once_with("song/A.opus", codec="copy")
+
+    def test_opus_outside_tolerance_is_reencoded_with_gain(self):
+        with patch("utils.audio_library.discord.FFmpegOpusAudio") as mock_opus:
+            create_audio_source("song/A.opus", {}, gain_db=-4.0)
+        mock_opus.assert_called_once_with("song/A.opus", codec="libopus", options="-af volume=-4.00dB")
@@ -0,0 +1,105 @@
+"""
+Test suite for utils/migrate_json_to_db.py
+
+Tests cover:
+- JsonStream: values split across tiny chunks, nested objects, escapes
+- iter_trackers: channels map and the legacy single-tracker format
+- import_json / export_json: idempotent bulk load and backup round-trip on SQLite
+"""
+
+import io
+import json
+import pytest
+from utils.migrate_json_to_db import (
+    JsonStream, iter_characters, iter_trackers, import_json, export_json,
+)
+
+
+@pytest.fixture
+def character_file(tmp_path):
+    chars = {
+        f"角色{i}": {"stats": {"hp": i, "atk": i * 1.5}, "favorite_dice": {"攻/擊": "1d20+\"3\""}, "initiative_formula": None}
+        for i in range(30)
+    }
+    path = tmp_path / "characters.json"
+    path.write_text(json.dumps(chars, ensure_ascii=False, indent=2), encoding="utf-8")
+    return str(path), chars
+
+
+@pytest.fixture
+def tracker_file(tmp_path):
+    trackers = {"channels": {str(100 + i): {"entries": [{"name": "Hero", "initiative": i}], "round": 1} for i in range(5)}}
+    path = tmp_path / "initiative_tracker.json"
+    path.write_text(json.dumps(trackers), encoding="utf-8")
+    return str(path), trackers
+
+
+class TestJsonStream:
+
+    @pytest.mark.parametrize("chunk_size", [1, 3, 7, 4096])
+    def test_members_across_chunk_boundaries(self, character_file, chunk_size):
+        path, chars = character_file
+        assert dict(iter_characters(path, chunk_size)) == chars
+
+    def test_number_at_chunk_end_is_not_truncated(self):
+        stream = JsonStream(io.StringIO('{"a": 12345, "b": [1, 2]}'), chunk_size=8)
+        result = {key: stream.value() for key in stream.members()}
+        assert result == {"a": 12345, "b": [1, 2]}
+
+    def test_empty_object_and_errors(self):
+        assert list(JsonStream(io.StringIO(" { } ")).members()) == []
+        with pytest.raises(ValueError):
+            stream = JsonStream(io.StringIO('{"a": 1 "b": 2}'))
+            for _ in stream.members():
+                stream.value()
+
+    def test_iter_trackers_formats(self, tmp_path, tracker_file):
+        path, trackers = tracker_file
+        assert dict(iter_trackers(path, 5)) == trackers["channels"]
+
+        legacy = tmp_path / "legacy.json"
+        legacy.write_text(json.dumps({"entries": [], "round": 3}), encoding="utf-8")
+        assert list(iter_trackers(str(legacy))) == [("legacy", {"entries": [], "round": 3})]
+
+
+class TestImportExport:
+
+    @pytest.mark.asyncio
+    async def test_import_is_idempotent(self, sqlite_database, character_file, tracker_file):
+        from utils.character_storage import get_character
+        from utils.character_versions import get_version
+
+        chars_path, chars = character_file
+        trackers_path, _ = tracker_file
+
+        reports = await import_json(chars_path, trackers_path, batch_size=7)
+        assert reports["characters"]["rows"] == 30
+        assert reports["characters"]["changed"] == 30
+        assert reports["initiative_trackers"]["changed"] == 5
+        assert reports["characters"]["rows_per_s"] > 0
+
+        again = await import_json(chars_path, trackers_path, batch_size=7)
+        assert again["characters"]["changed"] == 0
+        assert again["initiative_trackers"]["changed"] == 0
+
+        assert await get_character("角色3") == chars["角色3"]
+        assert (await get_version("角色3"))[1] == chars["角色3"]
+
+    @pytest.mark.asyncio
+    async def test_export_round_trip(self, sqlite_database, tmp_path, character_file, tracker_file):
+        chars_path, chars = character_file
+        trackers_path, trackers = tracker_file
+        await import_json(chars_path, trackers_path)
+
+        out_chars = str(tmp_path / "backup" / "characters.json")
+        out_trackers = str(tmp_path / "backup" / "initiative_tracker.json")
+        reports = await export_json(out_chars, out_trackers, batch_size=4)
+
+        assert reports["characters"]["rows"] == 30
+        with open(out_chars, encoding="utf-8") as f:
+            assert json.load(f) == chars
+        with open(out_trackers, encoding="utf-8") as f:
+            assert json.load(f) == trackers
+
+        again = await import_json(out_chars, out_trackers)
+        assert again["characters"]["changed"] == 0
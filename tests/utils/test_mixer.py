@@ -0,0 +1,232 @@
+"""
+Test suite for utils/mixer.py
+
+Tests cover:
+- Per-layer gain and summing of PCM frames
+- Limiter / clipping keeps the mix inside int16
+- Ducking ramps other layers down during a sound effect and back up afterwards
+- Finished layers are dropped; the mixer ends with its main layer
+- Scene ambience survives across mixers and wraps engine tracks
+- Layers removed from the event loop are cleaned up on the audio thread
+"""
+
+import struct
+import pytest
+from unittest.mock import MagicMock
+from utils.mixer import (MixerSource, Layer, Scene, FRAME_SIZE, FRAME_SAMPLES,
+                         DUCK_GAIN, DUCK_RAMP_FRAMES)
+from utils.playback_engine import PlaybackEngine, TrackSource
+
+
+class FakeSource:
+    """固定數值的 PCM 音框來源"""
+
+    def __init__(self, value, frames=None, opus=False):
+        self.value = value
+        self.frames = frames            # None 表示無限
+        self.opus = opus
+        self.cleaned = False
+
+    def read(self):
+        if self.frames is not None:
+            if self.frames <= 0:
+                return b""
+            self.frames -= 1
+        return struct.pack(f"<{FRAME_SAMPLES}h", *([self.value] * FRAME_SAMPLES))
+
+    def is_opus(self):
+        return self.opus
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+def first_sample(frame):
+    return struct.unpack_from("<h", frame)[0]
+
+
+class TestMixing:
+
+    def test_layers_are_summed_with_gain(self):
+        mixer = MixerSource(Layer("music", FakeSource(1000)),
+                            [Layer("rain", FakeSource(2000), gain=0.5)])
+        frame = mixer.read()
+        assert len(frame) == FRAME_SIZE
+        assert first_sample(frame) == 2000
+
+    def test_limiter_keeps_mix_in_range(self):
+        mixer = MixerSource(Layer("a", FakeSource(30000)), [Layer("b", FakeSource(30000))])
+        samples = struct.unpack(f"<{FRAME_SAMPLES}h", mixer.read())
+        assert max(samples) <= 32767
+        assert samples[0] > 30000           # 整體縮小而不是相加後溢位
+        assert mixer.limited_frames == 1
+
+    def test_limiter_releases_gradually(self):
+        loud = FakeSource(30000, frames=1)
+        mixer = MixerSource(Layer("music", FakeSource(10000)), [Layer("hit", loud)])
+        mixer.read()
+        assert first_sample(mixer.read()) < 10000     # 不會一次跳回原音量
+        for _ in range(100):
+            frame = mixer.read()
+        assert first_sample(frame) == 10000
+
+    def test_short_last_frame_is_padded(self):
+        class Short(FakeSource):
+            def read(self):
+                return struct.pack("<2h", 500, 500) if self.frames else b""
+
+        mixer = MixerSource(Layer("music", FakeSource(0)), [Layer("tail", Short(0, frames=1))])
+        assert len(mixer.read()) == FRAME_SIZE
+
+
+class TestDucking:
+
+    def test_sfx_ducks_and_recovers(self):
+        mixer = MixerSource(Layer("music", FakeSource(10000)))
+        mixer.add_layer(Layer("sfx:boom", FakeSource(0, frames=DUCK_RAMP_FRAMES + 5),
+                              ducks_others=True, duckable=False))
+
+        ducked = [first_sample(mixer.read()) for _ in range(DUCK_RAMP_FRAMES + 5)]
+        assert ducked[0] < 10000
+        assert ducked == sorted(ducked, reverse=True)           # 平滑壓低
+        assert ducked[-1] == int(10000 * DUCK_GAIN)
+
+        recovered = [first_sample(mixer.read()) for _ in range(DUCK_RAMP_FRAMES + 1)]
+        assert recovered == sorted(recovered)
+        assert recovered[-1] == 10000
+        assert "sfx:boom" not in mixer.layer_names
+
+
+class TestLifecycle:
+
+    def test_ends_with_main_layer(self):
+        rain = FakeSource(100)
+        music = FakeSource(100, frames=2)
+        mixer = MixerSource(Layer("music", music), [Layer("rain", rain, owned=False)])
+        assert mixer.read() and mixer.read()
+        assert mixer.read() == b""
+        assert mixer.finished
+        assert music.cleaned and not rain.cleaned
+
+    def test_without_main_plays_until_layers_end(self):
+        mixer = MixerSource(None, [Layer("sfx", FakeSource(100, frames=1))])
+        assert mixer.read()
+        assert mixer.read() == b""
+
+    def test_failing_layer_is_dropped(self):
+        class Broken(FakeSource):
+            def read(self):
+                raise OSError("pipe closed")
+
+        broken = Broken(0)
+        mixer = MixerSource(Layer("music", FakeSource(700)), [Layer("rain", broken)])
+        assert first_sample(mixer.read()) == 700
+        assert mixer.layer_names == ["music"]
+        assert broken.cleaned
+
+    def test_retire_after_cleanup_cleans_immediately(self):
+        rain = FakeSource(0)
+        mixer = MixerSource(None, [Layer("rain", rain, owned=False)])
+        mixer.cleanup()
+        mixer.retire(Layer("rain", rain, owned=False))
+        assert rain.cleaned
+
+    def test_cleanup_keeps_scene_layers(self):
+        rain, music = FakeSource(0), FakeSource(0)
+        mixer = MixerSource(Layer("music", music), [Layer("rain", rain, owned=False)])
+        mixer.cleanup()
+        assert music.cleaned and not rain.cleaned
+        assert mixer.read() == b""
+
+
+class TestScene:
+
+    def test_ambience_carries_over_to_next_mixer(self):
+        scene = Scene()
+        rain = FakeSource(1000)
+        scene.set_ambience("rain", rain, gain=1.0)
+
+        first = scene.wrap(FakeSource(0, frames=0))
+        assert first.read() == b""
+        second = scene.wrap(FakeSource(500))
+        assert first_sample(second.read()) == 1500
+        assert not rain.cleaned
+
+        scene.clear_ambience()
+        assert not scene.active
+        assert "ambience:rain" not in second.layer_names
+        assert not rain.cleaned                 # 由播放執行緒在下一個音框前清理
+        assert first_sample(second.read()) == 500
+        assert rain.cleaned
+
+    def test_sfx_when_idle_starts_mixer_with_the_layer(self):
+        scene = Scene()
+        voice_client = MagicMock()
+        voice_client.is_playing.return_value = False
+        voice_client.is_paused.return_value = False
+
+        assert scene.play_sfx(voice_client, "boom", FakeSource(1000, frames=1)) is True
+        mixer = voice_client.play.call_args[0][0]
+        assert mixer is scene.mixer
+        assert first_sample(mixer.read()) == 1000
+        assert not mixer.finished
+
+    def test_sfx_added_to_live_mixer(self):
+        scene = Scene()
+        mixer = scene.wrap(FakeSource(0))
+        voice_client = MagicMock(source=mixer)
+        voice_client.is_playing.return_value = True
+
+        assert scene.play_sfx(voice_client, "boom", FakeSource(0)) is True
+        assert mixer.layer_names == ["music", "sfx:boom"]
+        voice_client.play.assert_not_called()
+
+    def test_sfx_over_opus_passthrough_is_refused(self):
+        scene = Scene()
+        voice_client = MagicMock(source=FakeSource(0, opus=True))
+        voice_client.is_playing.return_value = True
+        sfx = FakeSource(0)
+        assert scene.play_sfx(voice_client, "boom", sfx) is False
+        assert sfx.cleaned
+
+    def test_attach_hot_swaps_pcm_music(self):
+        scene = Scene()
+        scene.set_ambience("rain", FakeSource(0))
+        current = FakeSource(0)
+        voice_client = MagicMock(source=current)
+        voice_client.is_playing.return_value = True
+
+        assert scene.attach(voice_client) is True
+        assert voice_client.source is scene.mixer
+        assert scene.mixer.main.source is current
+
+    def test_attach_skips_opus_passthrough(self):
+        scene = Scene()
+        voice_client = MagicMock(source=FakeSource(0, opus=True))
+        voice_client.is_playing.return_value = True
+        assert scene.attach(voice_client) is False
+
+    def test_attach_starts_ambience_when_idle(self):
+        scene = Scene()
+        voice_client = MagicMock()
+        voice_client.is_playing.return_value = False
+        voice_client.is_paused.return_value = False
+        assert scene.attach(voice_client) is True
+        voice_client.play.assert_called_once_with(scene.mixer)
+
+
+class TestEngineIntegration:
+
+    def test_engine_wraps_tracks_when_scene_active(self, mocker):
+        scene = Scene()
+        mocker.patch("utils.mixer.get_scene", return_value=scene)
+        engine = PlaybackEngine(crossfade_ms=0)
+        track = TrackSource("A", FakeSource(0))
+
+        assert engine._wrap(track) is track
+        scene.set_ambience("rain", FakeSource(0))
+        wrapped = engine._wrap(track)
+        assert isinstance(wrapped, MixerSource) and wrapped.main.source is track
+
+        opus = TrackSource("B", FakeSource(0, opus=True))
+        assert engine._wrap(opus) is opus
@@ -16,7 +16,7 @@ CRITICAL MOCKING:
 - discord.FFmpegPCMAudio: Mocked
 - discord.PCMVolumeTransformer: Mocked
 - asyncio.sleep: Mocked to speed up tests
-- pydub.AudioSegment: Mocked
+- ffmpeg decode subprocess (utils.pcm_stream): Mocked
 - fuzzywuzzy.fuzz: Mocked
 """
 
@@ -395,55 +395,58 @@ class TestFileOperations:
 
 # ==================== PCM Conversion Tests ====================
 
+@pytest.fixture
+def fake_decoder(mocker):
+    """ffmpeg decode subprocess whose stdout yields three PCM frames."""
+    process = MagicMock()
+    process.stdout = io.BytesIO(b"\x01" * 3840 * 3)
+    process.poll.return_value = 0
+    return mocker.patch("utils.pcm_stream.subprocess.Popen", return_value=process)
+
+
 class TestPCMConversion:
     """Test PCM conversion and streaming."""
 
-    @patch("utils.music.AudioSegment")
-    def test_convert_to_pcm_mp3(self, mock_audio_segment, mock_song_dir, mock_log_dir):
-        """Test convert_to_pcm with MP3 file."""
-        # Mock AudioSegment
-        mock_audio = MagicMock()
-        mock_audio.set_channels = MagicMock(return_value=mock_audio)
-        mock_audio.set_frame_rate = MagicMock(return_value=mock_audio)
-        mock_audio.set_sample_width = MagicMock(return_value=mock_audio)
-        mock_audio.normalize = MagicMock(return_value=mock_audio)
-        mock_audio.export = MagicMock()
-        
-        mock_audio_segment.from_mp3 = MagicMock(return_value=mock_audio)
-        
+    def test_convert_to_pcm_mp3(self, fake_decoder, mock_song_dir, mock_log_dir):
+        """Test convert_to_pcm streams an MP3 file through ffmpeg."""
         test_file = os.path.join(mock_song_dir, "test.mp3")
         Path(test_file).touch()
         
         result = music.convert_to_pcm(test_file)
         assert result is not None
+        args = fake_decoder.call_args[0][0]
+        assert test_file in args and "s16le" in args and "dynaudnorm" in args
+        assert result.read(3840) == b"\x01" * 3840
+        result.close()
+
+    def test_convert_to_pcm_precomputed_gain(self, fake_decoder, mock_song_dir, mock_log_dir):
+        """Test convert_to_pcm applies a precomputed gain instead of normalizing."""
+        test_file = os.path.join(mock_song_dir, "test.mp3")
+        Path(test_file).touch()
+
+        result = music.convert_to_pcm(test_file, gain_db=-4.5)
+        args = fake_decoder.call_args[0][0]
+        assert "volume=-4.50dB" in args
+        assert "dynaudnorm" not in args
+        result.close()
 
-    @patch("utils.music.AudioSegment")
-    def test_convert_to_pcm_m4a(self, mock_audio_segment, mock_song_dir, mock_log_dir):
+    def test_convert_to_pcm_m4a(self, fake_decoder, mock_song_dir, mock_log_dir):
         """Test convert_to_pcm with M4A file."""
-        mock_audio = MagicMock()
-        mock_audio.set_channels = MagicMock(return_value=mock_audio)
-        mock_audio.set_frame_rate = MagicMock(return_value=mock_audio)
-        mock_audio.set_sample_width = MagicMock(return_value=mock_audio)
-        mock_audio.normalize = MagicMock(return_value=mock_audio)
-        mock_audio.export = MagicMock()
-        
-        mock_audio_segment.from_file = MagicMock(return_value=mock_audio)
-        
         test_file = os.path.join(mock_song_dir, "test.m4a")
         Path(test_file).touch()
         
         result = music.convert_to_pcm(test_file)
         assert result is not None
+        assert test_file in fake_decoder.call_args[0][0]
+        result.close()
 
-    @patch("utils.music.AudioSegment")
-    def test_convert_to_pcm_error(self, mock_audio_segment, mock_song_dir, mock_log_dir):
+    def test_convert_to_pcm_error(self, mock_song_dir, mock_log_dir):
         """Test convert_to_pcm handles errors."""
-        mock_audio_segment.from_mp3 = MagicMock(side_effect=Exception("Test error"))
-        
         test_file = os.path.join(mock_song_dir, "test.mp3")
         Path(test_file).touch()
         
-        result = music.convert_to_pcm(test_file)
+        with patch("utils.pcm_stream.subprocess.Popen", side_effect=FileNotFoundError("ffmpeg")):
+            result = music.convert_to_pcm(test_file)
         assert result is None
 
     def test_pcm_stream_reader_read(self):
@@ -481,6 +484,16 @@ class TestPCMConversion:
         chunk = reader.read(10)
         assert chunk == b""
 
+    def test_pcm_stream_reader_progress_in_memory(self):
+        """Test PCMStreamReader tracks progress in counters without logging."""
+        reader = music.PCMStreamReader(io.BytesIO(b"x" * 400))
+        with patch("utils.music.log_message") as mock_log:
+            for _ in range(100):
+                reader.read(2)
+        
+        assert reader.progress() == {"reads": 100, "bytes": 200, "percent": 50}
+        mock_log.assert_not_called()
+
     def test_pcm_stream_reader_cleanup(self):
         """Test PCMStreamReader.cleanup()."""
         pcm_io = io.BytesIO(b"test")
@@ -497,23 +510,16 @@ class TestDownloadSong:
     """Test song downloading with mocked yt_dlp."""
 
     @pytest.mark.asyncio
-    @patch("utils.music.fuzz.partial_ratio")
-    @patch("utils.music.threading.Thread")
     @patch("utils.music.yt_dlp.YoutubeDL")
     async def test_download_song_success(
-        self, mock_ydl_class, mock_thread_class, mock_fuzz,
+        self, mock_ydl_class,
         mock_musicsheet_path, mock_song_dir, mock_log_dir,
         sample_musicsheet, mock_discord_context
     ):
         """Test download_song succeeds."""
-        mock_fuzz.return_value = 100
         with open(mock_musicsheet_path, "w", encoding="utf-8") as f:
             json.dump(sample_musicsheet, f)
         
-        mock_thread = MagicMock()
-        mock_thread.is_alive = MagicMock(side_effect=[True, False])
-        mock_thread_class.return_value = mock_thread
-        
         mock_ydl = MagicMock()
         mock_ydl_class.return_value.__enter__ = MagicMock(return_value=mock_ydl)
         mock_ydl_class.return_value.__exit__ = MagicMock(return_value=None)
@@ -521,28 +527,34 @@ class TestDownloadSong:
         test_file = os.path.join(mock_song_dir, "Song 1.mp3")
         Path(test_file).touch()
         
-        result = await music.download_song("http://example.com", "Song 1", mock_discord_context)
+        with patch("utils.audio_library.transcode_to_opus", return_value=True) as mock_transcode, \
+             patch("utils.loudness.schedule_analysis") as mock_analysis:
+            result = await music.download_song("http://example.com", "Song 1", mock_discord_context)
         
-        mock_thread_class.assert_called_once()
+        assert result == test_file
+        mock_ydl.download.assert_called_once_with(["http://example.com"])
+        assert mock_ydl_class.call_args[0][0]["progress_hooks"]
+        assert mock_ydl_class.call_args[0][0]["outtmpl"] == os.path.join(mock_song_dir, "Song 1.source")
+        mock_transcode.assert_called_once_with(
+            os.path.join(mock_song_dir, "Song 1.source"), os.path.join(mock_song_dir, "Song 1.opus"),
+            keep_source=True
+        )
+        mock_analysis.assert_called_once_with("Song 1", test_file)
 
     @pytest.mark.asyncio
-    @patch("utils.music.fuzz.partial_ratio")
-    @patch("utils.music.threading.Thread")
+    @patch("utils.music.yt_dlp.YoutubeDL")
     async def test_download_song_null_url(
-        self, mock_thread_class, mock_fuzz,
-        mock_musicsheet_path, mock_log_dir, sample_musicsheet,
+        self, mock_ydl_class,
+        mock_musicsheet_path, mock_log_dir, mock_song_dir, sample_musicsheet,
         mock_discord_context
     ):
         """Test download_song handles null URL."""
-        mock_fuzz.return_value = 0
         with open(mock_musicsheet_path, "w", encoding="utf-8") as f:
             json.dump(sample_musicsheet, f)
         
-        mock_thread = MagicMock()
-        mock_thread.is_alive = MagicMock(side_effect=[True, False])
-        mock_thread_class.return_value = mock_thread
-        
         result = await music.download_song(None, "Song 1", mock_discord_context)
+        assert result is None
+        mock_ydl_class.assert_not_called()
 
 
 # ==================== Play Next Tests ====================
@@ -688,9 +700,11 @@ class TestMusicsheetManagement:
         shared_state.playback_mode = "隨機播放"
         music.update_previous_song(sample_musicsheet["songs"][0])
         
+        from utils.playback_session import get_session
+        assert get_session().previous == "Song 1"
+        # 上一首只記在播放狀態，歌單檔案不會被改寫
         loaded = music.load_musicsheet()
-        assert loaded["songs"][0]["is_previous"] is True
-        assert loaded["songs"][1]["is_previous"] is False
+        assert loaded["songs"][0]["is_previous"] is False
 
     def test_delete_unlisted_songs(self, mock_song_dir, mock_musicsheet_path, sample_musicsheet, mock_log_dir):
         """Test delete_unlisted_songs removes orphaned files."""
@@ -998,6 +1012,8 @@ class TestMusicsheetManagement:
         shared_state.playback_mode = "循環播放清單"
         music.update_previous_song(sample_musicsheet["songs"][0])
         
+        from utils.playback_session import get_session
+        assert get_session().previous is None
         loaded = music.load_musicsheet()
         assert loaded["songs"][0]["is_previous"] is False
 
@@ -1083,41 +1099,25 @@ class TestMusicsheetManagement:
         
         await music.play_next(mock_discord_context)
 
-    @patch("utils.music.AudioSegment")
-    def test_convert_to_pcm_wav(self, mock_audio_segment, mock_song_dir, mock_log_dir):
+    def test_convert_to_pcm_wav(self, fake_decoder, mock_song_dir, mock_log_dir):
         """Test convert_to_pcm with WAV file."""
-        mock_audio = MagicMock()
-        mock_audio.set_channels = MagicMock(return_value=mock_audio)
-        mock_audio.set_frame_rate = MagicMock(return_value=mock_audio)
-        mock_audio.set_sample_width = MagicMock(return_value=mock_audio)
-        mock_audio.normalize = MagicMock(return_value=mock_audio)
-        mock_audio.export = MagicMock()
-        
-        mock_audio_segment.from_wav = MagicMock(return_value=mock_audio)
-        
         test_file = os.path.join(mock_song_dir, "test.wav")
         Path(test_file).touch()
         
         result = music.convert_to_pcm(test_file)
         assert result is not None
+        assert test_file in fake_decoder.call_args[0][0]
+        result.close()
 
-    @patch("utils.music.AudioSegment")
-    def test_convert_to_pcm_generic(self, mock_audio_segment, mock_song_dir, mock_log_dir):
+    def test_convert_to_pcm_generic(self, fake_decoder, mock_song_dir, mock_log_dir):
         """Test convert_to_pcm with generic audio file."""
-        mock_audio = MagicMock()
-        mock_audio.set_channels = MagicMock(return_value=mock_audio)
-        mock_audio.set_frame_rate = MagicMock(return_value=mock_audio)
-        mock_audio.set_sample_width = MagicMock(return_value=mock_audio)
-        mock_audio.normalize = MagicMock(return_value=mock_audio)
-        mock_audio.export = MagicMock()
-        
-        mock_audio_segment.from_file = MagicMock(return_value=mock_audio)
-        
         test_file = os.path.join(mock_song_dir, "test.ogg")
         Path(test_file).touch()
         
         result = music.convert_to_pcm(test_file)
         assert result is not None
+        assert test_file in fake_decoder.call_args[0][0]
+        result.close()
 
     def test_check_audio_file_m4a_valid(self, mock_song_dir):
         """Test check_audio_file validates M4A files."""
@@ -1182,22 +1182,9 @@ class TestErrorHandling:
         except OSError:
             pass
 
-    @patch("utils.music.AudioSegment")
-    def test_convert_to_pcm_export_error(self, mock_audio_segment, mock_song_dir, mock_log_dir):
-        """Test convert_to_pcm handles export error."""
-        mock_audio = MagicMock()
-        mock_audio.set_channels = MagicMock(return_value=mock_audio)
-        mock_audio.set_frame_rate = MagicMock(return_value=mock_audio)
-        mock_audio.set_sample_width = MagicMock(return_value=mock_audio)
-        mock_audio.normalize = MagicMock(return_value=mock_audio)
-        mock_audio.export = MagicMock(side_effect=Exception("Export failed"))
-        
-        mock_audio_segment.from_mp3 = MagicMock(return_value=mock_audio)
-        
-        test_file = os.path.join(mock_song_dir, "test.mp3")
-        Path(test_file).touch()
-        
-        result = music.convert_to_pcm(test_file)
+    def test_convert_to_pcm_missing_file(self, mock_song_dir, mock_log_dir):
+        """Test convert_to_pcm returns None for a missing file."""
+        result = music.convert_to_pcm(os.path.join(mock_song_dir, "missing.mp3"))
         assert result is None
 
     def test_pcm_stream_reader_total_bytes_error(self):
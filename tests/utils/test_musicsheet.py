@@ -0,0 +1,248 @@
+"""
+Test suite for utils/musicsheet.py
+
+Tests cover:
+- Repeated reads are served from memory while mtime / size are unchanged
+- External edits are picked up on the next read
+- save() refreshes the cache without reparsing
+- Missing and corrupted files
+- Title / URL / position lookups, position-derived indexes, current pointer
+- Debounced, atomic writes and flush
+"""
+
+import os
+import json
+import pytest
+from utils.musicsheet import MusicsheetStore, index_for, position_of
+
+
+@pytest.fixture
+def sheet_path(tmp_path):
+    path = tmp_path / "musicsheet" / "default" / "musicsheet.json"
+    path.parent.mkdir(parents=True)
+    path.write_text(json.dumps({"songs": [{"title": "Song A", "index": "1.1"}]}), encoding="utf-8")
+    return str(path)
+
+
+class TestMusicsheetStore:
+
+    def test_second_read_is_a_hit(self, sheet_path):
+        store = MusicsheetStore()
+        first = store.get(sheet_path)
+        second = store.get(sheet_path)
+
+        assert first is second
+        assert first.songs[0]["is_playing"] is False
+        assert first.songs[0]["sanitized_title"] == "Song A"
+        assert store.stats()["hits"] == 1
+        assert store.stats()["loads"] == 1
+
+    def test_external_change_is_reloaded(self, sheet_path):
+        store = MusicsheetStore()
+        store.get(sheet_path)
+
+        with open(sheet_path, "w", encoding="utf-8") as f:
+            json.dump({"songs": [{"title": "Song A", "index": "1.1"}, {"title": "Song B", "index": "1.2"}]}, f)
+        stat = os.stat(sheet_path)
+        os.utime(sheet_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        assert [s["title"] for s in store.get(sheet_path).songs] == ["Song A", "Song B"]
+        assert store.stats()["loads"] == 2
+
+    def test_save_updates_cache_without_reparse(self, sheet_path, mocker):
+        store = MusicsheetStore()
+        data = store.get(sheet_path).data
+        data["songs"].append({"title": "Song/B", "index": "1.2"})
+        store.save(sheet_path, data)
+
+        read = mocker.spy(store, "_read")
+        assert store.get(sheet_path).data is data
+        read.assert_not_called()
+        assert data["songs"][1]["sanitized_title"] == "Song_B"
+
+        with open(sheet_path, encoding="utf-8") as f:
+            assert len(json.load(f)["songs"]) == 2
+
+    def test_missing_file_is_not_cached(self, tmp_path):
+        store = MusicsheetStore()
+        path = str(tmp_path / "missing.json")
+
+        assert store.get(path).songs == []
+        assert store.stats()["sheets"] == 0
+
+        store.save(path, {"songs": [{"title": "New"}]})
+        assert store.get(path).songs[0]["title"] == "New"
+
+    def test_corrupted_file_is_backed_up(self, tmp_path):
+        path = tmp_path / "bad.json"
+        path.write_text("{ not json", encoding="utf-8")
+
+        assert MusicsheetStore().get(str(path)).songs == []
+        assert (tmp_path / "bad.json.corrupted").exists()
+
+
+class TestMusicsheetModel:
+
+    @pytest.fixture
+    def sheet(self, tmp_path):
+        store = MusicsheetStore()
+        path = str(tmp_path / "musicsheet.json")
+        songs = [{"title": f"Song {i}", "url": f"https://example.com/{i}"} for i in range(12)]
+        store.save(path, {"songs": songs})
+        return store.get(path)
+
+    def test_indexes_follow_position(self, sheet):
+        assert [s["index"] for s in sheet.songs[9:12]] == ["1.10", "2.1", "2.2"]
+        assert index_for(10) == "2.1"
+        assert position_of("2.1") == 10
+        assert position_of("invalid") is None
+        assert sheet.at("2.2")["title"] == "Song 11"
+        assert sheet.at("9.1") is None
+        assert [s["title"] for s in sheet.page(2)] == ["Song 10", "Song 11"]
+
+    def test_lookups(self, sheet):
+        assert sheet.find("Song 3") is sheet.songs[3]
+        assert sheet.find_url("https://example.com/5")["title"] == "Song 5"
+        assert sheet.position("Song 7") == 7
+        assert sheet.find("missing") is None
+
+    def test_add_and_remove_renumber(self, sheet):
+        added = sheet.add({"title": "New", "url": None})
+        assert added["index"] == "2.3"
+        assert sheet.position("New") == 12
+
+        removed = sheet.remove("Song 0")
+        assert removed["title"] == "Song 0"
+        assert sheet.songs[0]["index"] == "1.1"
+        assert sheet.find("New")["index"] == "2.2"
+        assert sheet.position("Song 1") == 0
+        assert sheet.remove("Song 0") is None
+
+    def test_current_comes_from_playback_session(self, sheet, isolated_playback_session):
+        assert sheet.current is None
+        isolated_playback_session.start("Song 4")
+        assert sheet.current is sheet.songs[4]
+        isolated_playback_session.start("not in this sheet")
+        assert sheet.current is None
+
+    def test_legacy_playing_flag_is_adopted(self, tmp_path, isolated_playback_session):
+        path = tmp_path / "legacy.json"
+        path.write_text(json.dumps({"songs": [
+            {"title": "A", "index": "1.1"}, {"title": "B", "index": "1.2", "is_playing": True},
+        ]}), encoding="utf-8")
+
+        sheet = MusicsheetStore().get(str(path))
+        assert isolated_playback_session.current == "B"
+        assert not any(s["is_playing"] for s in sheet.songs)
+
+    def test_maps_rebuilt_when_songs_replaced(self, sheet):
+        sheet.data["songs"] = [s for s in sheet.songs if s["title"] != "Song 1"]
+        assert sheet.find("Song 1") is None
+        assert sheet.position("Song 2") == 1
+
+    def test_legacy_file_sorted_once(self, tmp_path):
+        path = tmp_path / "legacy.json"
+        path.write_text(json.dumps({"songs": [
+            {"title": "B", "index": "1.3"}, {"title": "A", "index": "1.1"},
+        ]}), encoding="utf-8")
+
+        songs = MusicsheetStore().get(str(path)).songs
+        assert [(s["title"], s["index"]) for s in songs] == [("A", "1.1"), ("B", "1.2")]
+
+
+class TestMusicsheetWrites:
+
+    @pytest.mark.asyncio
+    async def test_saves_in_event_loop_are_coalesced(self, sheet_path, monkeypatch):
+        import asyncio
+        import utils.musicsheet as musicsheet
+
+        monkeypatch.setattr(musicsheet, "WRITE_DEBOUNCE_SECONDS", 0.01)
+        store = MusicsheetStore()
+        sheet = store.get(sheet_path)
+        for i in range(5):
+            sheet.add({"title": f"New {i}"})
+            store.save(sheet_path, sheet.data)
+
+        # 尚未寫入前讀到的是記憶體中的最新內容
+        assert len(store.get(sheet_path).songs) == 6
+        with open(sheet_path, encoding="utf-8") as f:
+            assert len(json.load(f)["songs"]) == 1
+
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not store.stats()["pending"]:
+                break
+        with open(sheet_path, encoding="utf-8") as f:
+            assert len(json.load(f)["songs"]) == 6
+        assert store.stats()["writes"] == 1
+        assert store.stats()["coalesced"] == 4
+        assert not os.path.exists(sheet_path + ".tmp")
+
+    @pytest.mark.asyncio
+    async def test_flush_writes_pending(self, sheet_path):
+        store = MusicsheetStore()
+        sheet = store.get(sheet_path)
+        sheet.add({"title": "Pending"})
+        store.save(sheet_path, sheet.data)
+
+        store.flush()
+        with open(sheet_path, encoding="utf-8") as f:
+            assert json.load(f)["songs"][-1]["title"] == "Pending"
+        assert store.stats()["pending"] == 0
+
+    def test_older_snapshot_does_not_overwrite_newer(self, sheet_path):
+        store = MusicsheetStore()
+        store.get(sheet_path)
+        assert store._write_file(sheet_path, 2, json.dumps({"songs": []}))[0] is True
+        assert store._write_file(sheet_path, 1, json.dumps({"songs": [{"title": "old"}]}))[0] is False
+        with open(sheet_path, encoding="utf-8") as f:
+            assert json.load(f) == {"songs": []}
+
+    @pytest.mark.asyncio
+    async def test_save_during_write_stays_dirty(self, sheet_path, monkeypatch):
+        """The writer thread only does file IO; a save made while it runs is still written afterwards"""
+        import asyncio
+        import threading
+        import utils.musicsheet as musicsheet
+
+        monkeypatch.setattr(musicsheet, "WRITE_DEBOUNCE_SECONDS", 0.01)
+        store = MusicsheetStore()
+        started, release = threading.Event(), threading.Event()
+        write_file = store._write_file
+
+        def slow_write(*args):
+            started.set()
+            release.wait(5)
+            writes = store.writes
+            result = write_file(*args)
+            assert sheet_path in store._dirty and store.writes == writes    # 執行緒不碰快取狀態
+            return result
+
+        monkeypatch.setattr(store, "_write_file", slow_write)
+        sheet = store.get(sheet_path)
+        sheet.add({"title": "First"})
+        store.save(sheet_path, sheet.data)
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+
+        sheet.add({"title": "Second"})
+        store.save(sheet_path, sheet.data)
+        release.set()
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not store.stats()["pending"]:
+                break
+
+        with open(sheet_path, encoding="utf-8") as f:
+            assert json.load(f)["songs"][-1]["title"] == "Second"
+        assert store.stats()["writes"] == 2
+
+    def test_failed_write_keeps_previous_file(self, sheet_path, mocker):
+        store = MusicsheetStore()
+        mocker.patch("utils.musicsheet.os.replace", side_effect=OSError("disk full"))
+
+        with pytest.raises(OSError):
+            store.save(sheet_path, {"songs": []})
+        with open(sheet_path, encoding="utf-8") as f:
+            assert json.load(f)["songs"][0]["title"] == "Song A"
@@ -0,0 +1,81 @@
+"""
+Test suite for utils/name_index.py
+
+Tests cover:
+- NameIndex prefix lookups (case-insensitive, ordered, limited)
+- Trigram fuzzy lookups and combined search
+- Incremental add/remove, including trie pruning
+- Global character index kept in sync through the character cache hooks
+"""
+
+import pytest
+from utils.name_index import NameIndex, entry_index
+
+
+@pytest.fixture
+def index():
+    return NameIndex(["Aragorn", "Arwen", "Boromir", "Gimli", "Legolas", "哥布林弓箭手", "哥布林", "aragorn"])
+
+
+class TestPrefix:
+    def test_case_insensitive_and_sorted(self, index):
+        assert index.prefix("ar") == ["Aragorn", "aragorn", "Arwen"]
+        assert index.prefix("哥布") == ["哥布林", "哥布林弓箭手"]
+
+    def test_limit_and_empty_query(self, index):
+        assert index.prefix("", limit=3) == ["Aragorn", "aragorn", "Arwen"]
+        assert index.prefix("zz") == []
+
+
+class TestFuzzy:
+    def test_typo(self, index):
+        assert index.fuzzy("legolsa")[0] == "Legolas"
+        assert index.fuzzy("boromri")[0] == "Boromir"
+
+    def test_substring_ranks_first(self, index):
+        assert index.fuzzy("弓箭")[0] == "哥布林弓箭手"
+
+    def test_search_prefix_then_fuzzy(self, index):
+        results = index.search("gimil")
+        assert results[0] == "Gimli"
+        assert index.search("Ara")[:2] == ["Aragorn", "aragorn"]
+
+
+class TestIncremental:
+    def test_add_remove(self, index):
+        index.add("Arathorn")
+        assert "Arathorn" in index
+        assert index.prefix("arat") == ["Arathorn"]
+
+        index.remove("Arathorn")
+        assert "Arathorn" not in index
+        assert index.prefix("arat") == []
+        assert index.fuzzy("arathorn")[0] in ("Aragorn", "aragorn")
+        # 共用路徑的其他名稱不受影響
+        assert index.prefix("ara") == ["Aragorn", "aragorn"]
+
+    def test_remove_one_of_casefold_duplicates(self, index):
+        index.remove("aragorn")
+        assert index.prefix("arag") == ["Aragorn"]
+        assert len(index) == 7
+
+    def test_entry_index_rebuilds_on_change(self):
+        first = entry_index("c1", ["Goblin", "Orc"])
+        assert entry_index("c1", ["Goblin", "Orc"]) is first
+        second = entry_index("c1", ["Goblin", "Orc", "Troll"])
+        assert second is not first
+        assert second.prefix("tr") == ["Troll"]
+
+
+class TestCharacterIndexSync:
+    @pytest.mark.asyncio
+    async def test_hooks_update_index(self, isolated_character_cache):
+        from unittest.mock import AsyncMock, patch
+        from utils.name_index import get_character_index
+
+        with patch("utils.character_storage.get_all_names", AsyncMock(return_value=["Aragorn"])):
+            index = await get_character_index()
+        isolated_character_cache.apply_patch("Boromir", {})
+        assert index.prefix("bo") == ["Boromir"]
+        isolated_character_cache.remove("Aragorn")
+        assert "Aragorn" not in index
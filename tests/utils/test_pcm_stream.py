@@ -0,0 +1,113 @@
+"""
+Test suite for utils/pcm_stream.py
+
+Tests cover:
+- Ring buffer wrap-around, fixed capacity and writer back-pressure
+- End of stream and close wake blocked readers / writers
+- ffmpeg decode pump: fixed 20 ms frames, silence padding, in-memory counters
+- close() stops the decoder process and thread
+"""
+
+import io
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+from utils.pcm_stream import PCMRingBuffer, FFmpegPCMStream, FRAME_SIZE
+
+
+class TestPCMRingBuffer:
+
+    def test_wraps_around(self):
+        ring = PCMRingBuffer(frames=1, frame_size=8)
+        assert ring.write(b"abcdef")
+        assert ring.read(4) == b"abcd"
+        assert ring.write(b"ghijkl")          # 跨過緩衝區尾端
+        assert ring.read(8) == b"efghijkl"
+        assert ring.level == 0
+
+    def test_writer_blocks_when_full(self):
+        ring = PCMRingBuffer(frames=2, frame_size=4)
+        done = threading.Event()
+
+        def writer():
+            ring.write(b"x" * 20)
+            done.set()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        assert not done.wait(0.1)
+        assert ring.level == ring.capacity == 8
+
+        received = b""
+        while len(received) < 20:
+            received += ring.read(4)
+        thread.join(1)
+        assert done.is_set() and received == b"x" * 20
+
+    def test_finish_returns_remaining_then_empty(self):
+        ring = PCMRingBuffer(frames=1, frame_size=8)
+        ring.write(b"abc")
+        ring.finish()
+        assert ring.read(8) == b"abc"
+        assert ring.read(8) == b""
+
+    def test_close_unblocks_reader_and_writer(self):
+        ring = PCMRingBuffer(frames=1, frame_size=4)
+        ring.write(b"1234")
+        results = []
+        thread = threading.Thread(target=lambda: results.append(ring.write(b"5678")))
+        thread.start()
+        ring.close()
+        thread.join(1)
+        assert results == [False]
+        assert ring.read(4) == b""
+
+
+def fake_process(data: bytes):
+    process = MagicMock()
+    process.stdout = io.BytesIO(data)
+    process.poll.return_value = None
+    return process
+
+
+class TestFFmpegPCMStream:
+
+    def test_frames_and_padding(self):
+        data = b"\x01" * FRAME_SIZE + b"\x02" * 100
+        with patch("utils.pcm_stream.subprocess.Popen", return_value=fake_process(data)):
+            stream = FFmpegPCMStream("song/A.mp3", frames=4)
+
+        assert stream.read() == b"\x01" * FRAME_SIZE
+        assert stream.read() == b"\x02" * 100 + b"\x00" * (FRAME_SIZE - 100)
+        assert stream.read() == b""
+        assert stream.stats()["frames_decoded"] == 2
+        assert stream.tell() == 2 * FRAME_SIZE
+        stream.close()
+
+    def test_memory_is_bounded(self):
+        data = b"\x01" * FRAME_SIZE * 50
+        with patch("utils.pcm_stream.subprocess.Popen", return_value=fake_process(data)):
+            stream = FFmpegPCMStream("song/A.mp3", frames=4)
+        threading.Event().wait(0.1)
+
+        stats = stream.stats()
+        assert stats["capacity"] == 4 * FRAME_SIZE
+        assert stats["buffered"] <= stats["capacity"]
+        assert stats["frames_decoded"] <= 5            # 緩衝區滿後解碼暫停
+        stream.close()
+
+    def test_gain_filter(self):
+        with patch("utils.pcm_stream.subprocess.Popen", return_value=fake_process(b"")) as mock_popen:
+            stream = FFmpegPCMStream("song/A.mp3", gain_db=3.0)
+        assert "volume=3.00dB" in mock_popen.call_args[0][0]
+        stream.close()
+
+    def test_close_kills_running_decoder(self):
+        process = fake_process(b"\x01" * FRAME_SIZE * 50)
+        with patch("utils.pcm_stream.subprocess.Popen", return_value=process):
+            stream = FFmpegPCMStream("song/A.mp3", frames=2)
+        stream.close()
+
+        process.kill.assert_called_once()
+        assert not stream._thread.is_alive()
+        assert stream.read() == b""
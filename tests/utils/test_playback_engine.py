@@ -0,0 +1,241 @@
+"""
+Test suite for utils/playback_engine.py
+
+Tests cover:
+- Pre-buffered track sources and first / last frame timing
+- The after callback switching straight to the armed source (no sleeps) and recording the gap
+- Falling back to play_next when the armed song is stale or missing
+- PCM crossfade inside one source with is_fading_out
+- Arming computes the next title on the loop and cleans up sources when cancelled
+"""
+
+import struct
+import threading
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+import utils.shared_state as shared_state
+from utils.playback_engine import PlaybackEngine, TrackSource, CrossfadeSource
+
+
+class FakeSource:
+    """固定內容的 PCM / Opus 音框來源"""
+
+    def __init__(self, frames, opus=False):
+        self.frames = list(frames)
+        self.reads = 0
+        self.opus = opus
+        self.cleaned = False
+
+    def read(self):
+        self.reads += 1
+        return self.frames.pop(0) if self.frames else b""
+
+    def is_opus(self):
+        return self.opus
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+def pcm(value, samples=2):
+    return struct.pack(f"<{samples}h", *([value] * samples))
+
+
+@pytest.fixture
+def engine(mocker):
+    engine = PlaybackEngine(crossfade_ms=0)
+    engine.voice_client = MagicMock()
+    engine.ctx = MagicMock(send=AsyncMock())
+    engine._operation_id = "op"
+    mocker.patch.object(engine, "schedule_arm")
+    mocker.patch("utils.prefetch.schedule_prefetch")
+    mocker.patch("utils.music.log_message")
+    mocker.patch.object(shared_state, "current_operation_id", "op")
+    mocker.patch.object(shared_state, "stop_reason", "finished")
+    mocker.patch.object(shared_state, "playback_mode", "循環播放清單")
+    return engine
+
+
+class TestTrackSource:
+
+    def test_prebuffer_serves_buffered_frames_first(self):
+        source = FakeSource([b"a", b"b", b"c"])
+        track = TrackSource("A", source)
+        track.prebuffer(frames=2)
+
+        assert source.reads == 2
+        assert [track.read(), track.read(), track.read(), track.read()] == [b"a", b"b", b"c", b""]
+        assert track.first_frame_at is not None and track.ended_at >= track.first_frame_at
+
+    def test_gap_reported_on_first_frame(self):
+        gaps = []
+        track = TrackSource("A", FakeSource([b"a"]), on_first_frame=gaps.append)
+        track.gap_from = 0.0
+        track.read()
+        track.read()
+        assert len(gaps) == 1 and gaps[0] > 0
+
+
+class TestAfterCallback:
+
+    @pytest.mark.asyncio
+    async def test_switches_to_armed_source(self, engine):
+        engine.loop = asyncio.get_running_loop()
+        engine.current = engine._track("A", FakeSource([]))
+        engine.current.read()                        # 上一首已讀完
+        armed = engine._track("B", FakeSource([pcm(1)]))
+        engine.armed = armed
+
+        engine.next_title = "B"
+        with patch("utils.music.play_next", new_callable=AsyncMock) as mock_play_next:
+            engine._after(None)
+
+        engine.voice_client.play.assert_called_once_with(armed, after=engine._after)
+        assert armed.gap_from == engine.current.ended_at
+        armed.read()
+        assert engine.gaps_ms[-1] >= 0
+
+        await asyncio.sleep(0)
+        assert engine.current is armed
+        assert engine.transitions == 1
+        from utils.playback_session import get_session
+        assert get_session().current == "B"
+        mock_play_next.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_stale_armed_song_falls_back_to_play_next(self, engine):
+        engine.loop = asyncio.get_running_loop()
+        engine.current = engine._track("A", FakeSource([]))
+        engine.armed = engine._track("B", FakeSource([pcm(1)]))
+
+        engine.next_title = "C"
+        with patch("utils.music.play_next", new_callable=AsyncMock) as mock_play_next:
+            engine._after(None)
+            await asyncio.sleep(0.01)
+
+        engine.voice_client.play.assert_not_called()
+        mock_play_next.assert_awaited_once_with(engine.ctx)
+        assert engine.fallbacks == 1
+        assert engine.armed is not None      # 留給下一次準備時丟棄
+
+    def test_switch_does_not_read_musicsheet_on_player_thread(self, engine, mocker):
+        engine.loop = MagicMock()
+        engine.current = engine._track("A", FakeSource([]))
+        armed = engine._track("B", FakeSource([pcm(1)]))
+        engine.armed = armed
+        engine.next_title = "B"
+        mocker.patch("utils.music.get_musicsheet", side_effect=AssertionError("player thread"))
+
+        engine._after(None)
+
+        engine.voice_client.play.assert_called_once_with(armed, after=engine._after)
+        engine.loop.call_soon_threadsafe.assert_called_once_with(engine._advanced, armed)
+
+    def test_manual_stop_does_nothing(self, engine):
+        shared_state.stop_reason = "manual"
+        engine.armed = engine._track("B", FakeSource([]))
+        engine._after(None)
+        engine.voice_client.play.assert_not_called()
+
+    def test_superseded_operation_does_nothing(self, engine):
+        shared_state.current_operation_id = "newer"
+        engine._after(None)
+        engine.voice_client.play.assert_not_called()
+
+
+class TestCrossfade:
+
+    @pytest.mark.asyncio
+    async def test_mixes_tail_with_next_head(self, engine):
+        engine.loop = asyncio.get_running_loop()
+        engine.crossfade_ms = 60                      # 3 個音框
+        current = engine._track("A", FakeSource([pcm(1000)] * 5))
+        incoming_source = FakeSource([pcm(3000)] * 5)
+        engine.armed = engine._track("B", incoming_source)
+        engine.current = current
+        source = engine._wrap(current)
+        assert isinstance(source, CrossfadeSource)
+
+        frames, fading = [], []
+        engine.next_title = "B"
+        while True:
+            frame = source.read()
+            fading.append(shared_state.is_fading_out)
+            if not frame:
+                break
+            frames.append(struct.unpack("<2h", frame)[0])
+
+        assert frames[:2] == [1000, 1000]
+        assert frames[2:5] == [1500, 2000, 2500]        # 線性交叉淡入淡出
+        assert frames[5:] == [3000, 3000]
+        assert fading[2:4] == [True, True] and fading[-1] is False
+        assert engine.gaps_ms[-1] == 0.0
+        await asyncio.sleep(0)
+        assert engine.current.title == "B"
+
+    def test_blend_pads_short_head_and_stays_int16(self):
+        from utils.playback_engine import _blend
+
+        mixed = struct.unpack("<4h", _blend(struct.pack("<4h", 32767, -32768, 1000, 1000), pcm(32767), 0.5))
+        assert mixed == (32767, 0, 500, 500)        # 下一首較短的部分補靜音
+        assert _blend(pcm(1000), pcm(3000), 0.25) == pcm(1500)
+
+    def test_opus_tracks_are_not_wrapped(self, engine):
+        engine.crossfade_ms = 60
+        track = engine._track("A", FakeSource([], opus=True))
+        assert engine._wrap(track) is track
+
+    def test_no_armed_song_plays_out_tail(self, engine):
+        engine.crossfade_ms = 40
+        source = engine._wrap(engine._track("A", FakeSource([pcm(1000)] * 3)))
+        frames = [source.read() for _ in range(4)]
+        assert frames == [pcm(1000)] * 3 + [b""]
+
+
+class TestArm:
+
+    @pytest.fixture
+    def arm_env(self, mocker):
+        prefetcher = MagicMock(wait=AsyncMock())
+        mocker.patch("utils.prefetch.get_prefetcher", return_value=prefetcher)
+        mocker.patch("utils.prefetch.peek_next", return_value={"title": "B"})
+        mocker.patch("utils.music.get_musicsheet")
+        mocker.patch("utils.music.find_downloaded_file", return_value="song_list/B.opus")
+        mocker.patch("utils.loudness.cached_gain", return_value=None)
+
+    @pytest.mark.asyncio
+    async def test_arm_stores_next_title(self, engine, arm_env, mocker):
+        source = FakeSource([pcm(1)])
+        mocker.patch("utils.audio_library.create_audio_source", return_value=source)
+
+        await engine._arm()
+
+        assert engine.next_title == "B"
+        assert engine.armed.title == "B"
+
+    @pytest.mark.asyncio
+    async def test_cancel_while_creating_source_cleans_it_up(self, engine, arm_env, mocker):
+        started, release = threading.Event(), threading.Event()
+        source = FakeSource([])
+
+        def slow_create(*args):
+            started.set()
+            release.wait(5)
+            return source
+
+        mocker.patch("utils.audio_library.create_audio_source", side_effect=slow_create)
+        task = asyncio.get_running_loop().create_task(engine._arm())
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not source.cleaned
+
+        release.set()
+        for _ in range(100):
+            if source.cleaned:
+                break
+            await asyncio.sleep(0.01)
+        assert source.cleaned
+        assert engine.armed is None
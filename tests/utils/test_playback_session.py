@@ -0,0 +1,85 @@
+"""
+Test suite for utils/playback_session.py
+
+Tests cover:
+- current / previous / history transitions
+- Lazy persistence to the state file and reload
+- Switching tracks never rewrites the musicsheet
+"""
+
+import json
+import asyncio
+import pytest
+from utils.playback_session import PlaybackSession
+
+
+class TestPlaybackSession:
+
+    def test_transitions(self, tmp_path):
+        session = PlaybackSession(str(tmp_path / "state.json"))
+        session.start("A")
+        session.start("B")
+        session.start("B")
+        session.start("C")
+
+        assert session.current == "C"
+        assert session.previous == "B"
+        assert list(session.history) == ["A", "B"]
+
+        session.stop()
+        assert session.current is None
+        assert session.previous == "B"
+
+    def test_persist_and_reload(self, tmp_path):
+        path = str(tmp_path / "state.json")
+        session = PlaybackSession(path)
+        session.start("A")
+        session.start("B")
+
+        restored = PlaybackSession(path)
+        restored.load()
+        assert restored.to_dict() == {"current": "B", "previous": "A", "history": ["A"], "upcoming": []}
+
+    def test_corrupted_state_file_is_ignored(self, tmp_path, mocker):
+        mocker.patch("utils.music.log_message")
+        path = tmp_path / "state.json"
+        path.write_text("{ broken", encoding="utf-8")
+
+        session = PlaybackSession(str(path))
+        session.load()
+        assert session.current is None
+
+    @pytest.mark.asyncio
+    async def test_writes_are_deferred_in_event_loop(self, tmp_path, monkeypatch):
+        import utils.playback_session as playback_session
+
+        monkeypatch.setattr(playback_session, "PERSIST_DELAY_SECONDS", 0.01)
+        path = tmp_path / "state.json"
+        session = PlaybackSession(str(path))
+        for title in ("A", "B", "C"):
+            session.start(title)
+        assert not path.exists()
+
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if session.writes:
+                break
+        assert session.writes == 1
+        assert json.loads(path.read_text(encoding="utf-8"))["current"] == "C"
+
+    @pytest.mark.asyncio
+    async def test_switching_tracks_does_not_touch_musicsheet(self, tmp_path, isolated_musicsheet_store):
+        from utils.music import get_musicsheet
+
+        path = str(tmp_path / "musicsheet.json")
+        isolated_musicsheet_store.save(path, {"songs": [{"title": "A"}, {"title": "B"}]})
+        isolated_musicsheet_store.flush()
+        writes = isolated_musicsheet_store.stats()["writes"]
+
+        from utils.playback_session import get_session
+        get_session().start("A")
+        get_session().start("B")
+
+        assert get_musicsheet(path).current["title"] == "B"
+        assert isolated_musicsheet_store.stats()["writes"] == writes
+        assert isolated_musicsheet_store.stats()["pending"] == 0
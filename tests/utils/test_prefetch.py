@@ -0,0 +1,139 @@
+"""
+Test suite for utils/prefetch.py
+
+Tests cover:
+- Upcoming songs for each playback mode
+- Shuffle picks are committed ahead of time and consumed by play_next
+- peek_next agrees with play_next without changing state
+- Missing or invalid files are downloaded with prefetch priority
+"""
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from utils.musicsheet import Musicsheet
+from utils.playback_session import PlaybackSession
+from utils.downloads import PRIORITY_PREFETCH
+from utils.prefetch import (upcoming_songs, commit_shuffle, take_shuffle_pick, peek_next, _ensure_ready,
+                            MODE_LOOP, MODE_SINGLE, MODE_SHUFFLE, MODE_STANDBY)
+
+
+@pytest.fixture
+def sheet():
+    songs = [{"title": t, "url": f"https://example.com/{t}", "index": f"1.{i + 1}"}
+             for i, t in enumerate(["A", "B", "C", "D"])]
+    return Musicsheet("unused.json", {"songs": songs}, None)
+
+
+@pytest.fixture
+def session(tmp_path):
+    return PlaybackSession(str(tmp_path / "state.json"))
+
+
+class TestUpcomingSongs:
+
+    def test_loop_wraps_around(self, sheet, session):
+        session.start("D")
+        titles = [song["title"] for song in upcoming_songs(sheet, session, MODE_LOOP, ahead=2)]
+        assert titles == ["A", "B"]
+
+    def test_loop_without_current_starts_at_top(self, sheet, session):
+        titles = [song["title"] for song in upcoming_songs(sheet, session, MODE_LOOP, ahead=2)]
+        assert titles == ["A", "B"]
+
+    def test_single_repeats_current(self, sheet, session):
+        session.start("C")
+        assert [song["title"] for song in upcoming_songs(sheet, session, MODE_SINGLE)] == ["C"]
+
+    def test_standby_prefetches_nothing(self, sheet, session):
+        session.start("A")
+        assert upcoming_songs(sheet, session, MODE_STANDBY) == []
+
+    def test_shuffle_uses_committed_picks(self, sheet, session):
+        session.start("A")
+        songs = upcoming_songs(sheet, session, MODE_SHUFFLE, ahead=2)
+
+        assert [song["title"] for song in songs] == session.upcoming
+        assert len(songs) == 2
+        assert "A" not in session.upcoming
+
+
+class TestPeekNext:
+
+    def test_per_mode(self, sheet, session):
+        session.start("D")
+        assert peek_next(sheet, session, MODE_LOOP)["title"] == "A"
+        assert peek_next(sheet, session, MODE_SINGLE)["title"] == "D"
+        assert peek_next(sheet, session, MODE_STANDBY) is None
+
+    def test_shuffle_only_reads_committed_pick(self, sheet, session):
+        session.start("A")
+        assert peek_next(sheet, session, MODE_SHUFFLE) is None
+        session.set_upcoming(["C", "B"])
+        assert peek_next(sheet, session, MODE_SHUFFLE)["title"] == "C"
+        assert session.upcoming == ["C", "B"]
+
+
+class TestShuffle:
+
+    def test_commit_drops_removed_and_current(self, sheet, session):
+        session.start("B")
+        session.set_upcoming(["B", "Gone", "C"])
+
+        upcoming = commit_shuffle(sheet, session, ahead=2)
+
+        assert upcoming[0] == "C"
+        assert len(upcoming) == 2
+        assert "B" not in upcoming
+
+    def test_take_consumes_first_pick(self, sheet, session):
+        session.start("A")
+        commit_shuffle(sheet, session, ahead=2)
+        first, second = session.upcoming
+
+        assert take_shuffle_pick(sheet, session, 0) == sheet.position(first)
+        assert session.upcoming[0] == second
+
+    def test_single_song_sheet(self, session):
+        sheet = Musicsheet("unused.json", {"songs": [{"title": "A", "index": "1.1"}]}, None)
+        session.start("A")
+        assert take_shuffle_pick(sheet, session, 0) == 0
+        assert session.upcoming == []
+
+
+class TestEnsureReady:
+
+    @pytest.mark.asyncio
+    async def test_existing_valid_file_is_not_downloaded(self):
+        with patch("utils.music.find_downloaded_file", return_value="song_list/A.mp3"), \
+             patch("utils.music.check_audio_file", return_value=True), \
+             patch("utils.music.download_song", new_callable=AsyncMock) as mock_download:
+            assert await _ensure_ready({"title": "A", "url": "u"}) is True
+        mock_download.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_missing_file_downloads_with_prefetch_priority(self):
+        with patch("utils.music.find_downloaded_file", return_value=None), \
+             patch("utils.music.check_audio_file", return_value=True), \
+             patch("utils.music.download_song", new_callable=AsyncMock,
+                   return_value="song_list/A.mp3") as mock_download:
+            assert await _ensure_ready({"title": "A", "url": "u"}) is True
+        mock_download.assert_awaited_once_with("u", "A", None, PRIORITY_PREFETCH)
+
+    @pytest.mark.asyncio
+    async def test_invalid_file_is_replaced(self, tmp_path):
+        broken = tmp_path / "A.mp3"
+        broken.write_bytes(b"")
+        with patch("utils.music.find_downloaded_file", return_value=str(broken)), \
+             patch("utils.music.check_audio_file", side_effect=[False, True]), \
+             patch("utils.music.download_song", new_callable=AsyncMock,
+                   return_value=str(broken)) as mock_download:
+            assert await _ensure_ready({"title": "A", "url": "u"}) is True
+        assert not broken.exists()
+        mock_download.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_song_without_url(self):
+        with patch("utils.music.find_downloaded_file", return_value=None), \
+             patch("utils.music.download_song", new_callable=AsyncMock) as mock_download:
+            assert await _ensure_ready({"title": "A"}) is False
+        mock_download.assert_not_called()
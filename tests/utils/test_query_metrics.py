@@ -0,0 +1,85 @@
+"""
+Test suite for utils/query_metrics.py
+
+Tests cover:
+- query_label: logical names for unregistered statements
+- record / snapshot: per-query percentiles, error counts, slow-query log
+- Database calls are timed under their registered statement name
+"""
+
+import json
+import pytest
+from unittest.mock import patch
+from utils import db, query_metrics
+from utils.db import SQLiteBackend, init_db
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    query_metrics.reset()
+    yield
+    query_metrics.reset()
+
+
+class TestQueryLabel:
+    def test_labels(self):
+        assert query_metrics.query_label("DELETE FROM characters WHERE name = $1") == "delete_characters"
+        assert query_metrics.query_label(
+            "INSERT INTO combat_history (channel_id, data) VALUES ($1, $2)"
+        ) == "insert_combat_history"
+        assert query_metrics.query_label(
+            "CREATE TABLE IF NOT EXISTS characters (name TEXT)"
+        ) == "create_characters"
+        assert query_metrics.query_label("SELECT 1") == "select"
+
+
+class TestRecord:
+    def test_percentiles_and_errors(self):
+        for ms in range(1, 101):
+            query_metrics.record("q", ms / 1000, "SELECT 1", (), failed=(ms == 100))
+
+        summary = query_metrics.snapshot()["queries"]["q"]
+        assert summary["count"] == 100
+        assert summary["errors"] == 1
+        assert summary["p50_ms"] == pytest.approx(50, abs=1)
+        assert summary["p99_ms"] == pytest.approx(99, abs=1)
+        assert summary["max_ms"] == pytest.approx(100)
+
+    def test_slow_query_logged_with_param_sizes(self):
+        with patch("utils.music.log_message") as mock_log:
+            query_metrics.record(
+                "tracker_upsert", (query_metrics.SLOW_QUERY_MS + 5) / 1000,
+                "INSERT INTO t VALUES ($1, $2)", ("123", {"a": 1}),
+            )
+        slow = query_metrics.snapshot()["slow_queries"]
+        assert slow[0]["name"] == "tracker_upsert"
+        assert slow[0]["param_bytes"][0] == 3
+        assert "🐢" in mock_log.call_args[0][0]
+
+    def test_dump_is_json(self, tmp_path):
+        query_metrics.record("q", 0.001, "SELECT 1", ())
+        path = query_metrics.dump(str(tmp_path / "metrics.json"))
+        with open(path, encoding="utf-8") as f:
+            assert json.load(f)["queries"]["q"]["count"] == 1
+
+
+class TestDatabaseTiming:
+    @pytest.mark.asyncio
+    async def test_calls_are_recorded_by_name(self, tmp_path):
+        from utils.initiative import TRACKER_UPSERT
+
+        backend = SQLiteBackend(str(tmp_path / "goose.db"))
+        await backend.connect()
+        db.Database._backend = backend
+        try:
+            await init_db()
+            await db.Database.execute(TRACKER_UPSERT, "1", {"round": 1})
+            with pytest.raises(Exception):
+                await db.Database.fetchval("SELECT * FROM missing_table")
+        finally:
+            await db.Database.close()
+
+        queries = query_metrics.snapshot()["queries"]
+        assert queries["tracker_upsert"]["count"] == 1
+        assert queries["create_characters"]["count"] == 1
+        assert queries["select_missing_table"]["errors"] == 1
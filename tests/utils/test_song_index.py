@@ -0,0 +1,156 @@
+"""
+Test suite for utils/song_index.py
+
+Tests cover:
+- Exact hits ignore punctuation, spacing and the extension
+- Fuzzy fallback and its threshold
+- Incremental refresh on directory mtime change, add / discard hooks
+- .opus files win over legacy files with the same title
+- Startup reconciliation: exact join, blocked fuzzy pass, off-loop scan
+"""
+
+import os
+import pytest
+from pathlib import Path
+from utils.song_index import SongIndex
+
+
+@pytest.fixture
+def song_dir(tmp_path):
+    directory = tmp_path / "song"
+    directory.mkdir()
+    for name in ("Never Gonna Give You Up.mp3", "夜に駆ける (Official).m4a", "notes.txt"):
+        (directory / name).touch()
+    return str(directory)
+
+
+def bump_mtime(directory):
+    stat = os.stat(directory)
+    os.utime(directory, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+class TestSongIndex:
+
+    def test_exact_hit(self, song_dir):
+        index = SongIndex(song_dir)
+        path, score = index.find("never gonna give you up!")
+        assert path == os.path.join(song_dir, "Never Gonna Give You Up.mp3")
+        assert score == 100
+        assert len(index) == 2   # notes.txt 不列入
+
+    def test_fuzzy_fallback(self, song_dir):
+        index = SongIndex(song_dir)
+        path, score = index.find("夜に駆ける")
+        assert path == os.path.join(song_dir, "夜に駆ける (Official).m4a")
+        assert score > 80
+        assert index.find("completely different") == (None, 0)
+
+    def test_unchanged_directory_is_not_rescanned(self, song_dir, mocker):
+        index = SongIndex(song_dir)
+        index.find("anything")
+        listdir = mocker.spy(os, "listdir")
+        index.find("anything else")
+        listdir.assert_not_called()
+        assert index.refreshes == 1
+
+    def test_incremental_refresh(self, song_dir, mocker):
+        index = SongIndex(song_dir)
+        index.refresh()
+
+        clean = mocker.spy(SongIndex, "_clean")
+        Path(song_dir, "New Song.mp3").touch()
+        os.remove(os.path.join(song_dir, "Never Gonna Give You Up.mp3"))
+        bump_mtime(song_dir)
+
+        assert index.find("New Song")[0] == os.path.join(song_dir, "New Song.mp3")
+        assert index.find("Never Gonna Give You Up")[0] is None
+        # 只清理新檔案與兩次查詢字串
+        assert clean.call_count == 3
+
+    def test_add_and_discard(self, song_dir):
+        index = SongIndex(song_dir)
+        index.refresh()
+        index.add(os.path.join(song_dir, "Added.mp3"))
+        assert index.find("Added")[0] == os.path.join(song_dir, "Added.mp3")
+
+        index.discard(os.path.join(song_dir, "Added.mp3"))
+        assert index.find("Added")[0] is None
+
+    def test_opus_preferred_over_legacy_file(self, song_dir):
+        Path(song_dir, "Never Gonna Give You Up.opus").touch()
+        Path(song_dir, "Never Gonna Give You Up.source").touch()   # 下載中的原始檔不收錄
+        index = SongIndex(song_dir)
+        assert index.find("Never Gonna Give You Up")[0] == os.path.join(song_dir, "Never Gonna Give You Up.opus")
+
+        index.discard(os.path.join(song_dir, "Never Gonna Give You Up.opus"))
+        assert index.find("Never Gonna Give You Up")[0] == os.path.join(song_dir, "Never Gonna Give You Up.mp3")
+
+    def test_missing_directory(self, tmp_path):
+        assert SongIndex(str(tmp_path / "missing")).find("x") == (None, 0)
+
+
+class TestReconcile:
+
+    def test_exact_join_then_blocked_fuzzy(self):
+        from utils.song_index import reconcile
+
+        plan = reconcile(
+            ["Song/One", "夜に駆ける", "Gone Song"],
+            ["Song_One", "夜に駆ける (Official Video)", "Unrelated Track"],
+        )
+        assert plan["downloaded"] == {"Song/One": True, "夜に駆ける": True, "Gone Song": False}
+        assert plan["unmatched_files"] == ["Unrelated Track"]
+        assert plan["fuzzy_candidates"] == 2
+        assert set(plan["timings"]) == {"exact", "fuzzy"}
+
+    def test_fuzzy_only_scores_blocked_candidates(self, mocker):
+        import utils.song_index as song_index
+
+        scorer = mocker.spy(song_index, "_best_match")
+        song_index.reconcile(["abc"], ["xyz", "qqq"])
+        scorer.assert_not_called()
+
+    @pytest.mark.parametrize("title, stem", [
+        ("Toxic", "Toxc"),              # 一個字元的差異
+        ("Believer", "Beleiver"),       # 兩個字元的差異
+        ("a", "a song"),                # 單一字元沒有 bigram
+    ])
+    def test_near_miss_titles_still_match(self, title, stem):
+        from utils.song_index import reconcile, _fuzz
+
+        assert _fuzz.partial_ratio(title.lower(), stem.lower()) > 85
+        plan = reconcile([title], [stem])
+        assert plan["downloaded"] == {title: True}
+        assert plan["unmatched_files"] == []
+
+    def test_title_matching_an_already_joined_file(self):
+        from utils.song_index import reconcile
+
+        plan = reconcile(["Toxic", "Toxc"], ["Toxic"])
+        assert plan["downloaded"] == {"Toxic": True, "Toxc": True}
+
+    @pytest.mark.asyncio
+    async def test_scan_runs_off_loop_and_applies(self, tmp_path, monkeypatch, mocker):
+        import utils.music as music
+
+        song_dir = tmp_path / "song"
+        song_dir.mkdir()
+        (song_dir / "Kept.mp3").touch()
+        (song_dir / "Brand New.m4a").touch()
+        monkeypatch.setattr(music, "SONG_DIR", str(song_dir))
+        monkeypatch.setattr(music, "MUSIC_SHEET_PATH", str(tmp_path / "musicsheet.json"))
+        mocker.patch("utils.music.log_message")
+        music.save_musicsheet({"songs": [
+            {"title": "Kept", "url": None}, {"title": "Dead", "url": None}, {"title": "Remote", "url": "http://x"},
+        ]})
+
+        to_thread = mocker.spy(music.asyncio, "to_thread")
+        result = await music.scan_and_update_musicsheet_async()
+
+        to_thread.assert_called_once()
+        assert result["added"] == 1 and result["removed"] == 1
+        assert set(result["timings"]) == {"list", "exact", "fuzzy", "apply"}
+        songs = music.load_musicsheet()["songs"]
+        assert [(s["title"], s["is_downloaded"], s["index"]) for s in songs] == [
+            ("Kept", True, "1.1"), ("Remote", False, "1.2"), ("Brand New", True, "1.3"),
+        ]
@@ -0,0 +1,95 @@
+"""
+Test suite for utils/streaming.py
+
+Tests cover:
+- Stream URL extraction without downloading (direct url, requested_formats, playlists)
+- FFmpeg reconnect options and HTTP headers
+- Fallback to a full download when extraction fails
+- Background persistence with prefetch priority
+"""
+
+import shlex
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from utils.downloads import PRIORITY_PREFETCH
+from utils.streaming import (StreamSource, resolve_stream, persist_in_background, _extract_stream,
+                             RECONNECT_OPTIONS)
+
+
+def mock_ydl(info):
+    ydl = MagicMock()
+    ydl.__enter__.return_value = ydl
+    ydl.extract_info.return_value = info
+    return ydl
+
+
+class TestExtractStream:
+
+    def test_direct_url(self):
+        ydl = mock_ydl({"url": "https://cdn/audio", "http_headers": {"User-Agent": "UA"}})
+        with patch("utils.streaming.yt_dlp.YoutubeDL", return_value=ydl) as mock_cls:
+            stream = _extract_stream("https://youtube.com/watch?v=1")
+
+        assert stream.url == "https://cdn/audio"
+        assert stream.headers == {"User-Agent": "UA"}
+        ydl.extract_info.assert_called_once_with("https://youtube.com/watch?v=1", download=False)
+        assert mock_cls.call_args[0][0]["noplaylist"] is True
+
+    def test_requested_formats_and_playlist_entry(self):
+        ydl = mock_ydl({"entries": [None, {"requested_formats": [{"url": "https://cdn/a"}]}]})
+        with patch("utils.streaming.yt_dlp.YoutubeDL", return_value=ydl):
+            assert _extract_stream("u").url == "https://cdn/a"
+
+    def test_no_url(self):
+        with patch("utils.streaming.yt_dlp.YoutubeDL", return_value=mock_ydl({"title": "x"})):
+            assert _extract_stream("u") is None
+
+
+class TestStreamSource:
+
+    def test_before_options_reconnect(self):
+        assert StreamSource("https://cdn/a").before_options == RECONNECT_OPTIONS
+
+    def test_headers_survive_shlex_split(self):
+        stream = StreamSource("https://cdn/a", {"User-Agent": "Mozilla/5.0 (X11)", "Referer": "https://y"})
+        args = shlex.split(stream.before_options)
+
+        assert "-reconnect" in args
+        assert args[args.index("-headers") + 1] == "User-Agent: Mozilla/5.0 (X11)\r\nReferer: https://y\r\n"
+
+    def test_ffmpeg_options_keeps_output_options(self):
+        options = StreamSource("https://cdn/a").ffmpeg_options({"options": "-vn"})
+        assert options == {"options": "-vn", "before_options": RECONNECT_OPTIONS}
+
+
+class TestResolveStream:
+
+    @pytest.mark.asyncio
+    async def test_failure_returns_none(self):
+        with patch("utils.streaming._extract_stream", side_effect=Exception("blocked")):
+            assert await resolve_stream("u") is None
+
+    @pytest.mark.asyncio
+    async def test_empty_url(self):
+        assert await resolve_stream(None) is None
+
+    @pytest.mark.asyncio
+    async def test_success(self):
+        with patch("utils.streaming._extract_stream", return_value=StreamSource("https://cdn/a")):
+            assert (await resolve_stream("u")).url == "https://cdn/a"
+
+
+class TestPersistInBackground:
+
+    @pytest.mark.asyncio
+    async def test_downloads_with_prefetch_priority(self):
+        with patch("utils.music.download_song", new_callable=AsyncMock, return_value="song/A.mp3") as mock_download:
+            await persist_in_background("u", "A")
+        mock_download.assert_awaited_once_with("u", "A", None, PRIORITY_PREFETCH)
+
+    @pytest.mark.asyncio
+    async def test_errors_are_logged_not_raised(self):
+        with patch("utils.music.download_song", new_callable=AsyncMock, side_effect=Exception("boom")), \
+             patch("utils.music.log_message") as mock_log:
+            await persist_in_background("u", "A")
+        assert "boom" in mock_log.call_args[0][0]
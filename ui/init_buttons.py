@@ -608,7 +608,7 @@ class InitLoadCharButton(Button):
         self.ctx = ctx
 
     async def callback(self, interaction: discord.Interaction):
-        from utils.character_storage import get_all_names
+        from utils.character_storage import get_all_names, get_all_parties
         from ui.init_views import InitLoadSelectionView
 
         names = await get_all_names()
@@ -618,7 +618,7 @@ class InitLoadCharButton(Button):
             )
             return
 
-        view = InitLoadSelectionView(self.ctx, names)
+        view = InitLoadSelectionView(self.ctx, names, await get_all_parties())
         await interaction.response.send_message(
             "📂 選擇要導入的角色：", view=view, ephemeral=True
         )
@@ -200,14 +200,11 @@ class InitEndConfirmButton(discord.ui.Button):
         self.ctx = ctx
 
     async def callback(self, interaction: discord.Interaction):
-        from utils.initiative import end_combat
+        from utils.initiative import end_combat, format_combat_report
 
         channel_id = self.ctx.channel.id
         summary = await end_combat(channel_id)
-        msg = f"🏁 **戰鬥結束！**\n━━━━━━━━━━━━━━━━━━\n📊 總回合數: {summary['total_rounds']}\n👥 參戰角色: {summary['total_characters']}\n"
-        if summary["survivors"]:
-            msg += f"✨ 存活者: {', '.join(summary['survivors'])}\n"
-        await interaction.response.send_message(msg)
+        await interaction.response.send_message(format_combat_report(summary))
 
 
 class InitEndCancelButton(discord.ui.Button):
@@ -1582,67 +1579,58 @@ class InitSaveSelect(discord.ui.Select):
 
 
 class InitLoadSelectionView(View):
-    def __init__(self, ctx, names):
+    def __init__(self, ctx, names, parties=None):
         super().__init__(timeout=60)
         self.ctx = ctx
         self.add_item(InitLoadSelect(ctx, names))
+        if parties:
+            self.add_item(InitPartyPresetSelect(ctx, parties))
 
 
 class InitLoadSelect(discord.ui.Select):
     def __init__(self, ctx, names):
         options = [discord.SelectOption(label=name, value=name) for name in names[:25]]
-        super().__init__(placeholder="選擇要導入的角色...", options=options)
+        super().__init__(
+            placeholder="選擇要導入的角色 (可多選)...",
+            min_values=1,
+            max_values=len(options),
+            options=options,
+        )
         self.ctx = ctx
 
     async def callback(self, interaction: discord.Interaction):
-        from utils.character_storage import get_character
-        from utils.initiative import add_entry_with_roll, set_stats, add_favorite_dice
+        from utils.initiative import import_characters, format_import_results
         from ui.views import refresh_tracker_view
 
-        char_name = self.values[0]
-        data = await get_character(char_name)
-        channel_id = str(self.ctx.channel.id)
-
-        if not data:
-            await interaction.response.send_message("❌ 讀取失敗", ephemeral=True)
-            return
-
-        # 1. 擲先攻並加入 (使用保存的公式，若無則預設 1d20)
-        formula = data.get("initiative_formula") or "1d20"
-
-        # Check if character exists to decide message
-        success, result, detail = await add_entry_with_roll(
-            channel_id, formula, char_name
+        results, missing = await import_characters(str(self.ctx.channel.id), list(self.values))
+        await interaction.response.send_message(
+            format_import_results(results, missing), ephemeral=True
         )
+        await refresh_tracker_view(self.ctx)
 
-        msg = []
-        if success:
-            msg.append(f"✅ 已導入 **{char_name}**")
-            msg.append(f"🎲 先攻: {formula} → {detail}")
-        else:
-            msg.append(f"⚠️ **{char_name}** 已存在，將更新數值")
-
-        # 2. 設定數值
-        stats = data.get("stats", {})
-        if stats:
-            await set_stats(
-                channel_id,
-                char_name,
-                hp=stats.get("hp"),
-                elements=stats.get("elements"),
-                atk=stats.get("atk"),
-                def_=stats.get("def_"),
+
+class InitPartyPresetSelect(discord.ui.Select):
+    def __init__(self, ctx, parties: dict):
+        options = [
+            discord.SelectOption(
+                label=name, value=name, description=", ".join(members)[:100] or None
             )
-            msg.append("📊 數值已更新")
+            for name, members in list(parties.items())[:25]
+        ]
+        super().__init__(placeholder="或一鍵導入隊伍預設...", options=options)
+        self.ctx = ctx
+        self.parties = parties
 
-        # 3. 導入常用骰
-        fav_dice = data.get("favorite_dice", {})
-        if fav_dice:
-            count = 0
-            for dice_name, dice_formula in fav_dice.items():
-                await add_favorite_dice(channel_id, char_name, dice_name, dice_formula)
-                count += 1
-            msg.append(f"🎲 導入了 {count} 個常用骰")
+    async def callback(self, interaction: discord.Interaction):
+        from utils.initiative import import_characters, format_import_results
+        from ui.views import refresh_tracker_view
 
-        await interaction.response.send_message("\n".join(msg), ephemeral=True)
+        party = self.values[0]
+        results, missing = await import_characters(
+            str(self.ctx.channel.id), self.parties.get(party, [])
+        )
+        await interaction.response.send_message(
+            f"👥 隊伍 **{party}**\n" + format_import_results(results, missing),
+            ephemeral=True,
+        )
         await refresh_tracker_view(self.ctx)
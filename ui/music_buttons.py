@@ -2,7 +2,7 @@ import discord
 from discord.ui import Button
 import asyncio
 import math
-from utils.music import (load_musicsheet, save_musicsheet, find_downloaded_file, 
+from utils.music import (load_musicsheet, save_musicsheet, get_musicsheet, find_downloaded_file, 
                          download_song, play_next, remove_song, log_message, debug_log)
 import utils.shared_state as shared_state  # 引入共享狀態模組
 
@@ -18,24 +18,19 @@ class SearchButton(Button):
     async def callback(self, interaction):
         await interaction.response.defer()
         
-        from utils.music import load_musicsheet, get_next_index, save_musicsheet
+        sheet = get_musicsheet()
 
-        musicsheet_data = load_musicsheet()
-
-        if len(musicsheet_data["songs"]) >= 50:  # MAX_SONGS
+        if len(sheet.songs) >= 50:  # MAX_SONGS
             await interaction.followup.send("❌ 播放清單已滿 (最多 50 首)！", ephemeral=True)
             return
 
-        new_song = {
+        new_song = sheet.add({
             "title": self.entry["title"],
             "is_downloaded": False,
             "url": self.entry["url"],
             "musicsheet": "default",
-            "index": get_next_index(musicsheet_data)
-        }
-
-        musicsheet_data["songs"].append(new_song)
-        save_musicsheet(musicsheet_data)
+        })
+        save_musicsheet(sheet.data)
 
         debug_log(f"🎵 DEBUG: 已加入 `{new_song['title']}` 至 `musicsheet.json`")
 
@@ -130,9 +125,9 @@ class PlaySelectionButton(Button):
                 await interaction.followup.send(f"⚠️ 無法找到歌曲檔案或下載URL: {song_title}", ephemeral=True)
                 
                 # 自動從播放清單移除此歌曲
-                musicsheet_data = load_musicsheet()
-                musicsheet_data["songs"] = [s for s in musicsheet_data["songs"] if s["title"] != song_title]
-                save_musicsheet(musicsheet_data)
+                sheet = get_musicsheet()
+                sheet.remove(song_title)
+                save_musicsheet(sheet.data)
                 
                 await interaction.followup.send(f"已自動從播放清單移除無效歌曲: {song_title}", ephemeral=True)
                 # 重置操作狀態
@@ -140,12 +135,6 @@ class PlaySelectionButton(Button):
                 shared_state.current_song_title = None
                 return
                 
-            # 更新播放標記以確保切換順暢
-            musicsheet_data = load_musicsheet()
-            for song in musicsheet_data["songs"]:
-                song["is_playing"] = (song["title"] == song_title)
-            save_musicsheet(musicsheet_data)
-            
             # 獲取play命令
             play_cmd = self.ctx.bot.get_command("play")
             if play_cmd:
@@ -234,6 +223,12 @@ class PlaybackModeButton(Button):
         import utils.shared_state as shared_state
         shared_state.playback_mode = new_mode
 
+        # 模式改變，接下來要播的歌也不同
+        from utils.prefetch import schedule_prefetch
+        from utils.playback_engine import get_engine
+        schedule_prefetch()
+        get_engine().schedule_arm()
+
         self.label = f"🔄 播放模式：{new_mode}"
         await interaction.response.defer()
         await interaction.message.edit(view=self.view)
@@ -263,25 +258,22 @@ class PauseResumeButton(Button):
         self.ctx = ctx
 
     async def callback(self, interaction: discord.Interaction):
-        """暫停或繼續播放，確保 `is_playing` 保持正確"""
+        """暫停或繼續播放"""
         voice_client = self.ctx.voice_client
-        musicsheet_data = load_musicsheet()
-        current_song = next((s for s in musicsheet_data["songs"] if s.get("is_playing", False)), None)
+        current_song = get_musicsheet().current
 
         if not voice_client or not current_song:
             await interaction.response.send_message("❌ 目前沒有播放中的歌曲！", ephemeral=True)
             return
 
+        # 暫停時播放狀態不變 (目前歌曲仍是同一首)，不需要寫檔
         if voice_client.is_playing():
             voice_client.pause()
-            current_song["is_playing"] = True  # 確保暫停時 `is_playing` 仍維持 True
             self.label = "▶️ 播放"
         else:
             voice_client.resume()
-            current_song["is_playing"] = True  # 確保恢復時 `is_playing` 仍維持 True
             self.label = "⏸ 暫停"
 
-        save_musicsheet(musicsheet_data)  # 確保 `musicsheet.json` 也同步
         await interaction.response.edit_message(view=self.view)  # 修正 UI 交互失效
 
 class QueueRemoveButton(Button):
@@ -309,8 +301,10 @@ class QueueRemoveButton(Button):
             removed_song = musicsheet_data["songs"][index]
             song_title = removed_song["title"]
 
-            # 刪除歌曲
+            # 刪除歌曲，並重新準備下一首
             remove_song(song_title)
+            from utils.playback_engine import get_engine
+            get_engine().schedule_arm()
 
         debug_log(f"🗑️ DEBUG: `{song_title}` 已移除，更新後清單: {len(musicsheet_data['songs'])} 首")
 
@@ -376,10 +370,7 @@ class QueueControlButton(Button):
             debug_log("🛠 DEBUG: `QueueControlButton` 觸發播放 UI")
 
             # 重新整理當前頁面歌曲
-            current_page_songs = [
-                song for song in musicsheet_data["songs"]
-                if int(song["index"].split(".")[0]) == shared_state.current_page  # 使用共享狀態
-            ]
+            current_page_songs = get_musicsheet().page(shared_state.current_page)  # 使用共享狀態
 
             if not current_page_songs:
                 await interaction.followup.send("❌ 此頁沒有可播放的歌曲！", ephemeral=True)
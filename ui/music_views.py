@@ -6,6 +6,7 @@ from utils.music import (load_musicsheet, save_musicsheet, find_downloaded_file,
 from ui.music_buttons import (NextSongButton, PrevSongButton, PauseResumeButton, PlaybackModeButton,
                      QueueControlButton, QueuePageButton, QueueClearButton, PlaySelectionButton,
                      QueueRemoveButton, SearchButton)
+from utils.playback_session import get_session
 import utils.shared_state as shared_state
 
 QUEUE_PAGE_SIZE = 10
@@ -38,6 +39,7 @@ class QueuePaginationView(View):
     def get_queue_text(self):
         musicsheet_data = load_musicsheet()
         songs = musicsheet_data["songs"]
+        playing = get_session().current
         total_pages = max(1, math.ceil(len(songs) / QUEUE_PAGE_SIZE))
         if shared_state.current_page > total_pages:
             shared_state.current_page = 1
@@ -46,7 +48,7 @@ class QueuePaginationView(View):
         queue_slice = songs[start:end]
         queue_text = f"📜 **播放清單 (第 {shared_state.current_page} 頁 / {total_pages} 頁)**\n"
         for song in queue_slice:
-            prefix = "🎵 " if song.get("is_playing") else ""
+            prefix = "🎵 " if song["title"] == playing else ""
             queue_text += f"{prefix}{song['index']}. {song['title']}\n"
         queue_text += f"\n🔄 播放模式：**{shared_state.playback_mode}**"
         return queue_text
@@ -0,0 +1,129 @@
+"""
+Opus 音樂庫
+下載後的歌曲一律存成 48 kHz Ogg Opus (.opus)。YouTube 原生的 Opus 串流直接複製 (不重新編碼)，其他格式才轉檔；
+播放時用 FFmpegOpusAudio `-c:a copy` 直接把 Opus 封包送給 Discord，不必每次播放都解碼 → 調音量 → 重新編碼。
+舊的 .mp3 / .m4a 檔案仍走原本的 PCM 路徑。
+音量不在下載時寫死，而是由響度分析 (utils.loudness) 決定：原始下載檔保留到分析完成，
+增益超過 PASSTHROUGH_TOLERANCE_DB 時從原始檔一次編碼寫進 .opus (apply_gain_to_opus)，整個流程最多只有一代有損轉檔；
+播放仍是 `-c:a copy`，只有寫入失敗的檔案才在播放時重新編碼。
+"""
+
+import os
+import subprocess
+
+import discord
+
+OPUS_BITRATE = "128k"
+SOURCE_SUFFIX = ".source"       # yt-dlp 原始下載檔 (不是音檔副檔名，不會被歌曲索引收錄)，保留到響度分析完成
+PCM_VOLUME = 0.5                # 舊檔案沒有響度分析結果時的音量 (與舊版 PCMVolumeTransformer 相同)
+PASSTHROUGH_TOLERANCE_DB = 1.0
+FFMPEG_OPTIONS = {'options': '-vn -b:a 320k -bufsize 8192k'}     # PCM 路徑的 FFmpegPCMAudio 參數
+
+
+def opus_path(directory: str, sanitized_title: str) -> str:
+    return os.path.join(directory, f"{sanitized_title}.opus")
+
+
+def source_path(directory: str, sanitized_title: str) -> str:
+    return os.path.join(directory, f"{sanitized_title}{SOURCE_SUFFIX}")
+
+
+def source_for(song_file: str) -> str:
+    """.opus 檔對應的原始下載檔"""
+    return os.path.splitext(song_file)[0] + SOURCE_SUFFIX
+
+
+def _ffmpeg_attempts(gain_db: float) -> list:
+    """不需要調整音量時先嘗試直接複製 Opus 串流 (來源不是 Opus 會失敗，再改為轉檔)"""
+    encode = ["-ar", "48000", "-ac", "2", "-c:a", "libopus", "-b:a", OPUS_BITRATE]
+    if gain_db:
+        return [["-af", f"volume={gain_db:.2f}dB", *encode]]
+    return [["-c:a", "copy"], encode]
+
+
+def transcode_to_opus(source: str, target: str, gain_db: float = 0.0, keep_source: bool = False) -> bool:
+    """把原始檔轉成 .opus (先寫暫存檔再替換)；成功後刪除原始檔，keep_source 時保留給之後寫入增益"""
+    from utils.music import log_message
+
+    tmp_path = f"{target}.part"
+    error = None
+    for args in _ffmpeg_attempts(gain_db):
+        command = ["ffmpeg", "-y", "-loglevel", "error", "-i", source, "-vn", "-map_metadata", "-1",
+                   *args, "-f", "opus", tmp_path]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True)
+        except FileNotFoundError:
+            log_message("❌ 找不到 ffmpeg，無法轉成 Opus")
+            return False
+        if result.returncode == 0:
+            os.replace(tmp_path, target)
+            if not keep_source:
+                os.remove(source)
+            return True
+        error = result.stderr.strip()
+
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    log_message(f"❌ 轉成 Opus 失敗: {os.path.basename(source)}，{error}")
+    return False
+
+
+def apply_gain_to_opus(path: str, gain_db: float) -> bool:
+    """
+    把增益寫進 .opus 檔 (可在行程池執行)：從保留的原始檔一次編碼，成功後刪除原始檔
+    沒有原始檔的舊檔案 (下載時已轉檔過) 才退回重新編碼 .opus 本身
+    """
+    source = source_for(path)
+    if os.path.exists(source):
+        return transcode_to_opus(source, path, gain_db)
+
+    tmp_path = f"{path}.part"
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-i", path, "-vn", "-map_metadata", "-1",
+               "-af", f"volume={gain_db:.2f}dB", "-ar", "48000", "-ac", "2",
+               "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-f", "opus", tmp_path]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except FileNotFoundError:
+        return False
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, path)
+    return True
+
+
+def discard_source(path: str):
+    """響度分析完成、不需要 (或無法) 再寫入增益時刪除保留的原始檔"""
+    try:
+        os.remove(source_for(path))
+    except FileNotFoundError:
+        pass
+
+
+def finalize_download(directory: str, sanitized_title: str):
+    """給下載管理員在下載執行緒呼叫的收尾函式"""
+    def finalize() -> bool:
+        return transcode_to_opus(source_path(directory, sanitized_title), opus_path(directory, sanitized_title),
+                                 keep_source=True)
+    return finalize
+
+
+def create_audio_source(song_file: str, options: dict, gain_db: float | None = None,
+                        force_pcm: bool = False) -> discord.AudioSource:
+    """
+    .opus 直接傳送封包；其他格式 (舊檔案、串流網址) 解碼成 PCM 並調整音量
+    force_pcm: 一律解碼成 PCM (場景混音需要 PCM 音框)
+    """
+    is_opus = song_file.lower().endswith(".opus")
+    if is_opus and not force_pcm:
+        if gain_db is None or abs(gain_db) <= PASSTHROUGH_TOLERANCE_DB:
+            return discord.FFmpegOpusAudio(song_file, codec="copy")
+        return discord.FFmpegOpusAudio(song_file, codec="libopus", options=f"-af volume={gain_db:.2f}dB")
+    source = discord.FFmpegPCMAudio(song_file, **options)
+    if gain_db is not None:
+        volume = 10 ** (gain_db / 20)
+    else:
+        # 與 Opus 直送相同的原始音量，混音開始時音樂音量不會跳動
+        volume = 1.0 if is_opus else PCM_VOLUME
+    return discord.PCMVolumeTransformer(source, volume=volume)
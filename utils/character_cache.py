@@ -0,0 +1,286 @@
+"""
+全域角色快取
+快取角色文件與排序後的名稱列表，儲存 / 刪除時直接更新 (write-through)，並同步名稱索引。
+多個機器人實例共用同一個資料庫時，透過通知器 (Postgres LISTEN/NOTIFY) 互相告知失效。
+"""
+
+import uuid
+import copy
+import bisect
+import asyncio
+from utils.music import log_message
+from utils.db import encode_json, decode_json, merge_document
+from utils import name_index
+
+NOTIFY_CHANNEL = "goose_characters"
+NOTIFY_MAX_PAYLOAD = 7000      # Postgres NOTIFY 上限 8000 bytes，超過就改送全部失效
+RECONNECT_DELAY = 5
+RECONNECT_MAX_DELAY = 60
+
+
+class LocalNotifier:
+    """同一程式內的通知器 (SQLite 單一實例，或測試時模擬多個實例)"""
+
+    def __init__(self):
+        self._callbacks = []
+
+    async def start(self, callback):
+        self._callbacks.append(callback)
+
+    async def publish(self, message: dict):
+        for callback in list(self._callbacks):
+            callback(message)
+
+    async def stop(self):
+        self._callbacks.clear()
+
+
+class PostgresNotifier:
+    """
+    以 Postgres LISTEN/NOTIFY 傳遞失效訊息
+    監聽使用獨立連線 (不佔用連線池)；斷線時清空快取並以指數退避重新連線。
+    """
+
+    def __init__(self, url: str, channel: str = NOTIFY_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self._conn = None
+        self._callback = None
+        self._reconnect_task = None
+        self._closing = False
+
+    async def _connect(self):
+        import asyncpg
+        self._conn = await asyncpg.connect(self.url)
+        await self._conn.add_listener(self.channel, self._on_notify)
+        self._conn.add_termination_listener(self._on_terminate)
+
+    async def start(self, callback):
+        self._callback = callback
+        self._closing = False
+        await self._connect()
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            self._callback(decode_json(payload))
+        except Exception as e:
+            log_message(f"⚠️ 角色快取通知解析失敗: {e}")
+
+    def _on_terminate(self, conn):
+        if self._closing:
+            return
+        # 斷線期間可能漏掉通知，只能整個失效
+        self._conn = None
+        self._callback({"all": True})
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = RECONNECT_DELAY
+        while self._conn is None and not self._closing:
+            await asyncio.sleep(delay)
+            try:
+                await self._connect()
+                if self._closing:
+                    await self.stop()
+                    return
+                self._callback({"all": True})
+                log_message("✅ 角色快取通知已重新連線")
+            except Exception as e:
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                log_message(f"⚠️ 角色快取通知重新連線失敗，{delay} 秒後重試: {e}")
+
+    async def publish(self, message: dict):
+        from utils.db import Database
+        await Database.execute("SELECT pg_notify($1, $2)", self.channel, encode_json(message))
+
+    async def stop(self):
+        self._closing = True
+        task, self._reconnect_task = self._reconnect_task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            # 先移除斷線監聽，主動關閉時不再觸發失效與重新連線
+            conn.remove_termination_listener(self._on_terminate)
+            await conn.close()
+
+
+class CharacterCache:
+    """
+    角色文件 + 排序名稱列表的快取
+    只有在掛上通知器之後才會啟用，否則無法得知其他實例的變更，所有讀取都直接查資料庫。
+    """
+
+    def __init__(self):
+        self.instance_id = uuid.uuid4().hex
+        self._docs = {}
+        self._names = None           # None 表示尚未載入
+        self._notifier = None
+        self._version = 0            # 任何變更/失效都遞增，避免讀取途中的變更被舊資料覆蓋
+        self.doc_hits = 0
+        self.doc_misses = 0
+        self.name_hits = 0
+        self.name_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._notifier is not None
+
+    # ---------- 讀取 ----------
+
+    def get(self, name: str):
+        """回傳角色文件的副本，未快取則回傳 None"""
+        if not self.enabled:
+            return None
+        doc = self._docs.get(name)
+        if doc is None:
+            self.doc_misses += 1
+            return None
+        self.doc_hits += 1
+        return copy.deepcopy(doc)
+
+    def names(self):
+        """回傳排序後的名稱列表副本，未載入則回傳 None"""
+        if not self.enabled:
+            return None
+        if self._names is None:
+            self.name_misses += 1
+            return None
+        self.name_hits += 1
+        return list(self._names)
+
+    def token(self) -> int:
+        """讀取資料庫前取得，之後 put / set_names 時帶回"""
+        return self._version
+
+    # ---------- 寫入 ----------
+
+    def put(self, name: str, doc: dict, token: int):
+        if self.enabled and token == self._version:
+            self._docs[name] = copy.deepcopy(doc)
+
+    def set_names(self, names, token: int):
+        if self.enabled and token == self._version:
+            self._names = sorted(names)
+
+    def apply_patch(self, name: str, patch: dict):
+        """儲存成功後套用 patch；未快取的文件不補 (下次讀取時再載入完整文件)"""
+        self._version += 1
+        if name in self._docs:
+            self._docs[name] = merge_document(self._docs[name], copy.deepcopy(patch))
+        self._add_name(name)
+        name_index.character_added(name)
+
+    def remove(self, name: str):
+        self._version += 1
+        self._docs.pop(name, None)
+        name_index.character_removed(name)
+        if self._names is not None:
+            index = bisect.bisect_left(self._names, name)
+            if index < len(self._names) and self._names[index] == name:
+                del self._names[index]
+
+    def _add_name(self, name: str):
+        if self._names is None:
+            return
+        index = bisect.bisect_left(self._names, name)
+        if index == len(self._names) or self._names[index] != name:
+            self._names.insert(index, name)
+
+    def invalidate_all(self):
+        self._version += 1
+        self._docs.clear()
+        self._names = None
+        name_index.reset_character_index()
+
+    # ---------- 跨實例通知 ----------
+
+    async def attach(self, notifier):
+        """掛上通知器；已有其他通知器時先停止它，避免舊的 LISTEN 連線與回呼殘留"""
+        if notifier is self._notifier:
+            return
+        await self.detach()
+        self._notifier = notifier
+        await notifier.start(self.handle_message)
+
+    async def detach(self):
+        if self._notifier is not None:
+            notifier, self._notifier = self._notifier, None
+            self.invalidate_all()
+            await notifier.stop()
+
+    def message(self, op: str, names) -> dict:
+        """op ('upsert' / 'delete') 影響了哪些角色；超過 NOTIFY 上限時改為全部失效"""
+        message = {"origin": self.instance_id, "op": op, "names": list(names)}
+        if len(encode_json(message)) > NOTIFY_MAX_PAYLOAD:
+            message = {"origin": self.instance_id, "all": True}
+        return message
+
+    async def publish(self, op: str, names):
+        """通知其他實例 (寫入語句本身已送出 NOTIFY 時不需呼叫)"""
+        if self._notifier is None:
+            return
+        message = self.message(op, names)
+        try:
+            await self._notifier.publish(message)
+        except Exception as e:
+            log_message(f"⚠️ 角色快取通知發送失敗: {e}")
+
+    def handle_message(self, message: dict):
+        """收到其他實例的變更：丟棄文件快取，並同步名稱列表"""
+        if message.get("origin") == self.instance_id:
+            return
+        if message.get("all"):
+            self.invalidate_all()
+            return
+        for name in message.get("names", []):
+            if message.get("op") == "delete":
+                self.remove(name)
+            else:
+                self._version += 1
+                self._docs.pop(name, None)
+                self._add_name(name)
+                name_index.character_added(name)
+
+    def stats(self) -> dict:
+        lookups = self.doc_hits + self.doc_misses + self.name_hits + self.name_misses
+        hits = self.doc_hits + self.name_hits
+        return {
+            "docs": len(self._docs),
+            "names": None if self._names is None else len(self._names),
+            "doc_hits": self.doc_hits,
+            "doc_misses": self.doc_misses,
+            "name_hits": self.name_hits,
+            "name_misses": self.name_misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+
+
+_cache = CharacterCache()
+
+
+def get_cache() -> CharacterCache:
+    return _cache
+
+
+async def start_character_sync():
+    """依資料庫後端啟動跨實例失效通知 (Postgres 用 LISTEN/NOTIFY，其他用本地通知器)"""
+    from utils.db import Database, PostgresBackend, DATABASE_URL
+    if _cache.enabled:
+        return
+    try:
+        backend = await Database.get_backend()
+        if isinstance(backend, PostgresBackend):
+            notifier = PostgresNotifier(DATABASE_URL)
+        else:
+            notifier = LocalNotifier()
+        await _cache.attach(notifier)
+        log_message(f"✅ 角色快取同步已啟動 ({type(notifier).__name__})")
+    except Exception as e:
+        # 無法監聽時不能保證快取一致，維持停用 (每次都查資料庫)
+        log_message(f"❌ 角色快取同步啟動失敗，停用快取: {e}")
+
+
+async def stop_character_sync():
+    await _cache.detach()
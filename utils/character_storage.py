@@ -4,75 +4,278 @@
 """
 import json
 from utils.music import log_message
-from utils.db import Database
+from utils.db import Database, register_statement, encode_json, decode_json, merge_document
+from utils.journal import get_journal, register_applier
+from utils.character_cache import get_cache, NOTIFY_CHANNEL
+from utils.character_versions import CHECKPOINT_INTERVAL
 
-async def save_character(name: str, char_data: dict, selected_fields: list):
-    """
-    儲存單一角色到全域資料庫
-    
-    Args:
-        name: 角色名稱
-        char_data: 來源資料 (從 initiative entry 來的 dict)
-        selected_fields: 要儲存的欄位列表 ['stats', 'dice', 'formula']
-        
-    Returns:
-        bool: 是否成功
+# 新角色以完整文件插入；既有角色在伺服器端以 JSONB `||` 只覆蓋選取的頂層欄位。
+# 同一語句內寫入版本紀錄 (每 CHECKPOINT_INTERVAL 版存完整文件，其餘存 patch 本身) 並送出 NOTIFY
+# (交易提交時才送達)，整次儲存只需一個 round-trip。
+# 版本號來自角色列的遞增 (列鎖定下依序進行)；若已有同版本的舊紀錄 (例如從備份還原)，以本次為準。
+# $4 為跨實例通知的 payload。
+_VERSION_KIND = f"""
+    CASE WHEN (version - 1) % {CHECKPOINT_INTERVAL} = 0 THEN 'checkpoint' ELSE 'merge' END,
+    CASE WHEN (version - 1) % {CHECKPOINT_INTERVAL} = 0 THEN data ELSE $3 END
+"""
+_VERSION_CONFLICT = """
+    ON CONFLICT (name, version) DO UPDATE SET
+        kind = excluded.kind, body = excluded.body, created_at = CURRENT_TIMESTAMP
+"""
+CHARACTER_MERGE = register_statement("character_merge", f"""
+    WITH merged AS (
+        INSERT INTO characters (name, data) VALUES ($1, $2)
+        ON CONFLICT (name) DO UPDATE SET data = characters.data || $3,
+            version = characters.version + 1, updated_at = CURRENT_TIMESTAMP
+        RETURNING version, data
+    ), recorded AS (
+        INSERT INTO character_versions (name, version, kind, body)
+        SELECT $1, version, {_VERSION_KIND} FROM merged
+        {_VERSION_CONFLICT}
+    ), notified AS (
+        SELECT pg_notify('{NOTIFY_CHANNEL}', $4)
+    )
+    SELECT version, (SELECT count(*) FROM notified) > 0 AS notified FROM merged
+""", sqlite=(
+    # SQLite 沒有可寫入的 CTE：兩個語句在同一交易內執行；單一實例不需 NOTIFY (notified = 0)
     """
-    # 1. 獲取現有數據
-    existing_data = await get_character(name) or {
-        "stats": {},
-        "favorite_dice": {},
-        "initiative_formula": None
-    }
-    
-    target = existing_data
-    
-    # Update fields
+    INSERT INTO characters (name, data) VALUES ($1, $2)
+    ON CONFLICT (name) DO UPDATE SET data = jsonb_merge(characters.data, $3),
+        version = characters.version + 1, updated_at = CURRENT_TIMESTAMP
+    RETURNING version, 0 AS notified
+    """,
+    f"""
+    INSERT INTO character_versions (name, version, kind, body)
+    SELECT name, version, {_VERSION_KIND} FROM characters WHERE name = $1
+    {_VERSION_CONFLICT}
+    """,
+))
+CHARACTER_SELECT = register_statement(
+    "character_select", "SELECT data FROM characters WHERE name = $1"
+)
+CHARACTER_SELECT_MANY = register_statement(
+    "character_select_many", "SELECT name, data, version FROM characters WHERE name = ANY($1)",
+    sqlite="SELECT name, data, version FROM characters WHERE name IN (SELECT value FROM json_each($1))",
+)
+
+PARTY_UPSERT = """
+    INSERT INTO party_presets (name, members) VALUES ($1, $2)
+    ON CONFLICT (name) DO UPDATE SET members = $2, updated_at = CURRENT_TIMESTAMP
+"""
+
+EMPTY_CHARACTER = {
+    "stats": {},
+    "favorite_dice": {},
+    "initiative_formula": None
+}
+
+
+def build_patch(char_data: dict, selected_fields: list) -> dict:
+    """依選取的欄位組出要覆蓋的頂層欄位"""
+    patch = {}
     if 'stats' in selected_fields:
-        target["stats"] = {
+        patch["stats"] = {
             "hp": char_data.get("hp"),
             "elements": char_data.get("elements"),
             "atk": char_data.get("atk"),
             "def_": char_data.get("def_")
         }
-        
+
     if 'dice' in selected_fields:
-        target["favorite_dice"] = char_data.get("favorite_dice", {}).copy()
-        
+        patch["favorite_dice"] = (char_data.get("favorite_dice") or {}).copy()
+
     if 'formula' in selected_fields:
-        target["initiative_formula"] = char_data.get("last_formula")
+        patch["initiative_formula"] = char_data.get("last_formula")
+    return patch
+
+
+def _merge_args(name: str, data: dict):
+    # 相容舊格式日誌 (整份文件)
+    if "patch" not in data:
+        data = {"doc": data, "patch": data}
+    return name, data["doc"], data["patch"]
+
+
+def _fold_patches(older: dict, newer: dict) -> dict:
+    """同一角色的多筆 patch 依序合併"""
+    _, older_doc, older_patch = _merge_args(None, older)
+    return {
+        "doc": merge_document(older_doc, newer["patch"]),
+        "patch": merge_document(older_patch, newer["patch"]),
+    }
+
+
+async def _write_character(name: str, data: dict):
+    """寫入資料庫 (也作為日誌重播函數)；data = {"doc": 新角色的完整文件, "patch": 要覆蓋的欄位}"""
+    _, doc, patch = _merge_args(name, data)
+    cache = get_cache()
+    row = await Database.fetchrow(CHARACTER_MERGE, name, doc, patch, encode_json(cache.message("upsert", [name])))
+    cache.apply_patch(name, patch)
+    if not row["notified"]:
+        await cache.publish("upsert", [name])
+
+
+register_applier("character", _write_character, fold=_fold_patches)
+
+
+async def save_character(name: str, char_data: dict, selected_fields: list):
+    """
+    儲存單一角色到全域資料庫 (伺服器端合併，不需先讀取)
     
-    # Upsert
-    query = """
-        INSERT INTO characters (name, data) VALUES ($1, $2)
-        ON CONFLICT (name) DO UPDATE SET data = $2, updated_at = CURRENT_TIMESTAMP
+    Args:
+        name: 角色名稱
+        char_data: 來源資料 (從 initiative entry 來的 dict)
+        selected_fields: 要儲存的欄位列表 ['stats', 'dice', 'formula']
+        
+    Returns:
+        bool: 是否成功
     """
+    patch = build_patch(char_data, selected_fields)
+    record = {"doc": merge_document(EMPTY_CHARACTER, patch), "patch": patch}
+
+    # 先寫入本地日誌，資料庫離線時由背景重播器補寫
+    journal = get_journal()
+    seq = journal.append("character", name, record)
+    if journal.degraded:
+        get_cache().apply_patch(name, patch)
+        log_message(f"📒 全域角色庫: 資料庫離線，{name} 已暫存於本地日誌")
+        return True
+
     try:
-        await Database.execute(query, name, json.dumps(target))
+        await _write_character(name, record)
+        journal.ack(seq)
         log_message(f"💾 全域角色庫: 已儲存 {name} (欄位: {selected_fields})")
         return True
     except Exception as e:
         log_message(f"❌ 儲存角色失敗: {e}")
+        journal.start_replayer()
         return False
 
+
+async def save_characters(entries: list, selected_fields: list) -> int:
+    """
+    批次儲存多個角色 (例如先攻表中的所有參戰者)，整批在同一交易內合併
+    版本號在每列合併時遞增 (列鎖定下依序進行)，版本紀錄也在同一語句寫入，並行儲存不會算出相同的版本號
+
+    Returns:
+        int: 成功儲存的角色數 (失敗時為 0)
+    """
+    journal = get_journal()
+    rows = []
+    seqs = []
+    for entry in entries:
+        patch = build_patch(entry, selected_fields)
+        record = {"doc": merge_document(EMPTY_CHARACTER, patch), "patch": patch}
+        seqs.append(journal.append("character", entry["name"], record))
+        rows.append(_merge_args(entry["name"], record))
+
+    if not rows:
+        return 0
+    cache = get_cache()
+    if journal.degraded:
+        for name, _, patch in rows:
+            cache.apply_patch(name, patch)
+        log_message(f"📒 全域角色庫: 資料庫離線，{len(rows)} 名角色已暫存於本地日誌")
+        return len(rows)
+
+    try:
+        # 每列帶相同的 payload：同一交易內相同的通知只會送達一次
+        payload = encode_json(cache.message("upsert", [row[0] for row in rows]))
+        merged = await Database.fetchrow_many(CHARACTER_MERGE, [(*row, payload) for row in rows])
+        for seq in seqs:
+            journal.ack(seq)
+        for name, _, patch in rows:
+            cache.apply_patch(name, patch)
+        if not merged[0]["notified"]:
+            await cache.publish("upsert", [row[0] for row in rows])
+        log_message(f"💾 全域角色庫: 已批次儲存 {len(rows)} 名角色 (欄位: {selected_fields})")
+        return len(rows)
+    except Exception as e:
+        log_message(f"❌ 批次儲存角色失敗: {e}")
+        journal.start_replayer()
+        return 0
+
 async def get_character(name: str):
-    """取得指定角色的資料"""
-    query = "SELECT data FROM characters WHERE name = $1"
+    """取得指定角色的資料 (本地日誌中尚未寫入資料庫的版本優先)"""
+    journal = get_journal()
+    cache = get_cache()
+    pending = journal.latest("character", name)
+    if pending is not None:
+        # patch 疊在最後已知的完整文件上 (快取，其次資料庫)；只有完全沒有底稿時才用新角色的文件，
+        # 否則只改了 HP 的角色會讀回空白範本，再被存回去就永久遺失其他欄位
+        _, doc, patch = _merge_args(name, pending)
+        base = cache.get(name)
+        if base is None and not journal.degraded:
+            try:
+                base = decode_json(await Database.fetchval(CHARACTER_SELECT, name))
+            except Exception:
+                base = None
+        return json.loads(json.dumps(merge_document(base, patch) if base else doc))
+
+    cached = cache.get(name)
+    if cached is not None:
+        return cached
+
+    token = cache.token()
     try:
-        data_str = await Database.fetchval(query, name)
-        if data_str:
-            return json.loads(data_str)
-        return None
+        data = decode_json(await Database.fetchval(CHARACTER_SELECT, name)) or None
+        if data is not None:
+            cache.put(name, data, token)
+        return data
     except Exception as e:
         log_message(f"❌ 讀取角色失敗: {e}")
         return None
 
+async def get_characters(names: list) -> dict:
+    """
+    一次取得多個角色 (快取未命中的部分以單一 `name = ANY($1)` 查詢)
+
+    Returns:
+        dict: 名稱 -> 角色資料 (找不到的名稱不會出現在結果中)
+    """
+    journal = get_journal()
+    cache = get_cache()
+    found = {}
+    missing = []
+    for name in dict.fromkeys(names):
+        if journal.latest("character", name) is not None:
+            data = await get_character(name)
+            if data:
+                found[name] = data
+            continue
+        cached = cache.get(name)
+        if cached is not None:
+            found[name] = cached
+        else:
+            missing.append(name)
+
+    if missing:
+        token = cache.token()
+        try:
+            rows = await Database.fetch(CHARACTER_SELECT_MANY, missing)
+            for row in rows:
+                data = decode_json(row["data"])
+                cache.put(row["name"], data, token)
+                found[row["name"]] = data
+        except Exception as e:
+            log_message(f"❌ 批次讀取角色失敗: {e}")
+    return found
+
 async def get_all_names():
     """取得所有角色名稱列表"""
+    cache = get_cache()
+    names = cache.names()
+    if names is not None:
+        return names
+
+    token = cache.token()
     query = "SELECT name FROM characters ORDER BY name"
     try:
         rows = await Database.fetch(query)
-        return [row['name'] for row in rows]
+        # 與快取相同的排序 (Python 字串順序)，不受資料庫定序影響
+        names = sorted(row['name'] for row in rows)
+        cache.set_names(names, token)
+        return names
     except Exception as e:
         log_message(f"❌ 讀取角色列表失敗: {e}")
         return []
@@ -85,8 +288,56 @@ async def delete_character(name: str):
         # result format is typically "DELETE <count>"
         if result == "DELETE 0":
             return False
+        # 刪除成功後才丟棄尚未寫入的同名紀錄 (避免重播時復活)；失敗時保留，暫存的儲存不會遺失
+        get_journal().discard("character", name)
+        cache = get_cache()
+        cache.remove(name)
+        await cache.publish("delete", [name])
         log_message(f"🗑️ 全域角色庫: 已刪除 {name}")
         return True
     except Exception as e:
         log_message(f"❌ 刪除角色失敗: {e}")
         return False
+
+
+# ============================================
+# 隊伍預設 (一鍵導入整隊角色)
+# ============================================
+
+async def save_party(name: str, members: list) -> bool:
+    """儲存 (或覆蓋) 隊伍預設"""
+    try:
+        await Database.execute(PARTY_UPSERT, name, list(dict.fromkeys(members)))
+        log_message(f"💾 隊伍預設: 已儲存 {name} ({len(members)} 人)")
+        return True
+    except Exception as e:
+        log_message(f"❌ 儲存隊伍預設失敗: {e}")
+        return False
+
+async def get_party(name: str):
+    """取得隊伍預設的成員列表，找不到則回傳 None"""
+    try:
+        return decode_json(await Database.fetchval("SELECT members FROM party_presets WHERE name = $1", name))
+    except Exception as e:
+        log_message(f"❌ 讀取隊伍預設失敗: {e}")
+        return None
+
+async def get_all_parties() -> dict:
+    """所有隊伍預設：名稱 -> 成員列表"""
+    try:
+        rows = await Database.fetch("SELECT name, members FROM party_presets ORDER BY name")
+        return {row["name"]: decode_json(row["members"]) for row in rows}
+    except Exception as e:
+        log_message(f"❌ 讀取隊伍預設列表失敗: {e}")
+        return {}
+
+async def delete_party(name: str) -> bool:
+    try:
+        result = await Database.execute("DELETE FROM party_presets WHERE name = $1", name)
+        if result == "DELETE 0":
+            return False
+        log_message(f"🗑️ 隊伍預設: 已刪除 {name}")
+        return True
+    except Exception as e:
+        log_message(f"❌ 刪除隊伍預設失敗: {e}")
+        return False
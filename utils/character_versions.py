@@ -0,0 +1,154 @@
+"""
+角色版本紀錄
+每次儲存角色時，在 character_versions 表記錄該次覆蓋的頂層欄位 (kind = 'merge')，
+每 CHECKPOINT_INTERVAL 版存一次完整文件；紀錄與角色本身在同一語句寫入 (見 character_storage)。
+讀取任一歷史版本只需從最近的檢查點套用最多 CHECKPOINT_INTERVAL - 1 筆紀錄，
+儲存量則隨變動大小成長，而不是文件大小。舊版寫入的 JSON Patch 差異 (kind = 'diff') 仍可讀取。
+"""
+
+import copy
+from utils.music import log_message
+from utils.db import Database, register_statement, decode_json, merge_document
+
+CHECKPOINT_INTERVAL = 16
+LATEST = 2 ** 31 - 1       # 查詢最新版本時使用的版本上限
+
+# 最近的檢查點到指定版本之間的所有紀錄 (主鍵 (name, version) 範圍掃描)
+VERSION_RANGE = register_statement("character_version_range", """
+    SELECT version, kind, body FROM character_versions
+    WHERE name = $1 AND version <= $2 AND version >= (
+        SELECT MAX(version) FROM character_versions
+        WHERE name = $1 AND version <= $2 AND kind = 'checkpoint'
+    )
+    ORDER BY version
+""")
+# 目前版本沒有紀錄的角色 (升級前建立，或由匯入工具直接寫入) 以目前內容補一個檢查點
+CHECKPOINT_MISSING = """
+    INSERT INTO character_versions (name, version, kind, body)
+    SELECT name, version, 'checkpoint', data FROM characters c
+    WHERE NOT EXISTS (
+        SELECT 1 FROM character_versions v WHERE v.name = c.name AND v.version = c.version
+    )
+    ON CONFLICT (name, version) DO NOTHING
+"""
+VERSION_HISTORY = register_statement("character_version_history", """
+    SELECT version, kind, body, created_at FROM character_versions
+    WHERE name = $1 ORDER BY version DESC LIMIT $2
+""")
+
+
+# ============================================
+# JSON Patch (RFC 6902 的 add / remove / replace 子集)
+# ============================================
+
+def _escape(key) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def apply_patch(doc, ops: list):
+    """套用舊版 'diff' 紀錄的操作列表，回傳新文件 (不修改原文件)"""
+    doc = copy.deepcopy(doc)
+    for op in ops:
+        tokens = [_unescape(t) for t in op["path"].split("/")[1:]]
+        if not tokens:
+            doc = copy.deepcopy(op["value"])
+            continue
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[token]
+        if op["op"] == "remove":
+            parent.pop(tokens[-1], None)
+        else:
+            parent[tokens[-1]] = copy.deepcopy(op["value"])
+    return doc
+
+
+# ============================================
+# 讀取
+# ============================================
+
+async def checkpoint_missing() -> int:
+    """為目前版本缺少紀錄的角色補上檢查點，回傳補上的筆數"""
+    result = await Database.execute(CHECKPOINT_MISSING)
+    return int(result.rsplit(None, 1)[-1])
+
+
+async def get_version(name: str, version: int = None):
+    """
+    重建角色的某一版 (預設最新版)
+
+    Returns:
+        (int, dict): 版本號與文件；找不到或紀錄不連續時回傳 (None, None)
+    """
+    try:
+        rows = await Database.fetch(VERSION_RANGE, name, version or LATEST)
+    except Exception as e:
+        log_message(f"❌ 讀取角色版本失敗: {e}")
+        return None, None
+    if not rows or (version and rows[-1]["version"] != version):
+        return None, None
+
+    doc = None
+    expected = rows[0]["version"]
+    for row in rows:
+        if row["version"] != expected:
+            # 中間缺了一版 (例如寫入版本紀錄失敗)，無法可靠重建
+            return None, None
+        body = decode_json(row["body"])
+        if row["kind"] == "checkpoint":
+            doc = body
+        elif row["kind"] == "merge":
+            doc = merge_document(doc, body)
+        else:
+            doc = apply_patch(doc, body)
+        expected += 1
+    return rows[-1]["version"], doc
+
+
+async def get_history(name: str, limit: int = 10) -> list:
+    """最近的版本紀錄 (新到舊)：[{version, kind, paths, created_at}]"""
+    try:
+        rows = await Database.fetch(VERSION_HISTORY, name, limit)
+    except Exception as e:
+        log_message(f"❌ 讀取角色歷史失敗: {e}")
+        return []
+
+    history = []
+    for row in rows:
+        body = decode_json(row["body"])
+        if row["kind"] == "merge":
+            paths = [f"/{_escape(key)}" for key in body]
+        elif row["kind"] == "diff":
+            paths = [op["path"] for op in body]
+        else:
+            paths = []
+        history.append({
+            "version": row["version"],
+            "kind": row["kind"],
+            "paths": paths,
+            "created_at": row["created_at"],
+        })
+    return history
+
+
+def format_history(name: str, history: list) -> str:
+    """`!char history` 的訊息內容"""
+    if not history:
+        return f"📜 **{name}** 沒有版本紀錄"
+    lines = [f"📜 **{name}** 的版本紀錄 (新到舊)"]
+    for item in history:
+        created = str(item["created_at"] or "")[:16]
+        if item["kind"] == "checkpoint":
+            change = "完整檢查點"
+        elif item["paths"]:
+            change = ", ".join(f"`{p}`" for p in item["paths"][:6])
+            if len(item["paths"]) > 6:
+                change += f" 等 {len(item['paths'])} 處"
+        else:
+            change = "無變更"
+        lines.append(f"`v{item['version']}` {created} — {change}")
+    return "\n".join(lines)
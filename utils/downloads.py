@@ -0,0 +1,205 @@
+"""
+下載管理員
+所有 yt-dlp 下載都經過這裡：固定數量的下載執行緒、依優先順序排隊
+(正在播放 > 預先下載 > 背景)，同一個 URL 同時只會下載一次，呼叫端拿到的是可 await 的 future。
+yt-dlp 的 progress hook 會更新每個下載的進度，供 `!downloads` 顯示。
+下載完成後可選擇在同一個下載執行緒執行收尾 (例如轉成 Opus)，同一首歌只會收尾一次。
+"""
+
+import os
+import time
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import yt_dlp
+
+PRIORITY_NOW_PLAYING = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_NOW_PLAYING: "播放中", PRIORITY_PREFETCH: "預先下載", PRIORITY_BACKGROUND: "背景"}
+
+MAX_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "2"))
+FINISHED_KEEP_SECONDS = 60      # 完成的下載在進度列表中保留的時間
+
+
+class DownloadJob:
+    """單一 URL 的下載工作與進度"""
+
+    def __init__(self, url: str, title: str, options: dict, priority: int, future: asyncio.Future,
+                 finalize=None):
+        self.url = url
+        self.title = title
+        self.options = options
+        self.finalize = finalize       # 下載成功後在下載執行緒呼叫，回傳 False 視為失敗
+        self.priority = priority
+        self.future = future
+        self.status = "queued"         # queued / downloading / converting / finished / error
+        self.downloaded_bytes = 0
+        self.total_bytes = None
+        self.speed = None
+        self.eta = None
+        self.error = None
+        self.finished_at = None
+
+    @property
+    def percent(self) -> float | None:
+        if not self.total_bytes:
+            return None
+        return min(100.0, self.downloaded_bytes / self.total_bytes * 100)
+
+    def progress_hook(self, status: dict):
+        """yt-dlp 在下載執行緒呼叫；只更新數值欄位，事件迴圈讀取時不需要鎖"""
+        self.downloaded_bytes = status.get("downloaded_bytes") or self.downloaded_bytes
+        self.total_bytes = status.get("total_bytes") or status.get("total_bytes_estimate") or self.total_bytes
+        self.speed = status.get("speed")
+        self.eta = status.get("eta")
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "title": self.title,
+            "priority": self.priority,
+            "status": self.status,
+            "percent": self.percent,
+            "downloaded_bytes": self.downloaded_bytes,
+            "total_bytes": self.total_bytes,
+            "speed": self.speed,
+            "eta": self.eta,
+            "error": self.error,
+        }
+
+
+class DownloadManager:
+    """
+    事件迴圈上的下載佇列
+    submit() 回傳 future (True 表示 yt-dlp 成功結束)；同一 URL 已在佇列或下載中時回傳同一個 future，
+    若新的請求優先順序較高則提前該工作。
+    """
+
+    def __init__(self, workers: int = MAX_WORKERS):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download")
+        self._jobs = {}            # url -> DownloadJob (排隊中 / 下載中 / 剛完成)
+        self._sequence = itertools.count()
+        self._workers = [self._loop.create_task(self._worker()) for _ in range(workers)]
+        self.deduplicated = 0
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def submit(self, url: str, title: str, options: dict, priority: int = PRIORITY_BACKGROUND,
+               finalize=None) -> asyncio.Future:
+        job = self._jobs.get(url)
+        if job is not None and job.status in ("queued", "downloading", "converting"):
+            self.deduplicated += 1
+            if job.status == "queued" and priority < job.priority:
+                # 佇列中舊的項目在取出時會因優先順序不符而略過
+                job.priority = priority
+                self._queue.put_nowait((priority, next(self._sequence), job))
+            return job.future
+
+        job = DownloadJob(url, title, options, priority, self._loop.create_future(), finalize)
+        self._jobs[url] = job
+        self._queue.put_nowait((priority, next(self._sequence), job))
+        return job.future
+
+    async def download(self, url: str, title: str, options: dict, priority: int = PRIORITY_BACKGROUND,
+                       finalize=None) -> bool:
+        # shield：某個等待者被取消不會影響其他等待同一下載的人
+        return await asyncio.shield(self.submit(url, title, options, priority, finalize))
+
+    async def _worker(self):
+        while True:
+            priority, _, job = await self._queue.get()
+            if job.status != "queued" or priority != job.priority:
+                continue
+            job.status = "downloading"
+            try:
+                ok = await self._loop.run_in_executor(self._executor, self._run, job)
+            except Exception as e:
+                job.error = str(e)
+                ok = False
+            job.status = "finished" if ok else "error"
+            job.finished_at = time.monotonic()
+            if not job.future.done():
+                job.future.set_result(ok)
+            self._prune()
+
+    @staticmethod
+    def _run(job: DownloadJob) -> bool:
+        """在下載執行緒執行"""
+        from utils.music import log_message
+
+        options = dict(job.options)
+        options["progress_hooks"] = list(options.get("progress_hooks", [])) + [job.progress_hook]
+        try:
+            with yt_dlp.YoutubeDL(options) as ydl:
+                ydl.download([job.url])
+            if job.finalize is None:
+                return True
+            job.status = "converting"
+            return bool(job.finalize())
+        except Exception as e:
+            job.error = str(e)
+            log_message(f"❌ 下載失敗: {e}")
+            return False
+
+    def _prune(self):
+        now = time.monotonic()
+        for url, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > FINISHED_KEEP_SECONDS:
+                del self._jobs[url]
+
+    def snapshot(self) -> list:
+        """目前的下載進度 (下載中在前，其次依優先順序)"""
+        self._prune()
+        order = {"downloading": 0, "converting": 0, "queued": 1, "finished": 2, "error": 2}
+        jobs = sorted(self._jobs.values(), key=lambda job: (order[job.status], job.priority))
+        return [job.to_dict() for job in jobs]
+
+    async def close(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        for job in self._jobs.values():
+            if not job.future.done():
+                job.future.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def format_progress(jobs: list) -> str:
+    if not jobs:
+        return "📭 目前沒有下載工作"
+    icons = {"downloading": "⬇️", "converting": "🔄", "queued": "⏳", "finished": "✅", "error": "❌"}
+    lines = ["📥 **下載佇列**"]
+    for job in jobs:
+        line = f"{icons[job['status']]} `{job['title']}` ({PRIORITY_NAMES.get(job['priority'], job['priority'])})"
+        if job["status"] == "downloading" and job["percent"] is not None:
+            line += f" {job['percent']:.0f}%"
+            if job["speed"]:
+                line += f"，{job['speed'] / 1e6:.1f} MB/s"
+        elif job["status"] == "error" and job["error"]:
+            line += f"：{job['error'][:80]}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+_manager = None
+
+
+def get_download_manager() -> DownloadManager:
+    """取得目前事件迴圈的下載管理員 (需在事件迴圈內呼叫)"""
+    global _manager
+    if _manager is None or _manager.loop is not asyncio.get_running_loop():
+        _manager = DownloadManager()
+    return _manager
+
+
+async def close_download_manager():
+    global _manager
+    if _manager is not None:
+        await _manager.close()
+        _manager = None
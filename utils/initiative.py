@@ -3,44 +3,87 @@
 提供先攻表的核心邏輯功能 (支援多頻道)
 """
 
-import json
+import time
+import uuid
+import datetime
 import utils.shared_state as shared_state
 from utils.dice import parse_and_roll, DiceParseError
 from utils.music import log_message
-from utils.db import Database
+from utils.db import Database, register_statement, decode_json
+from utils.journal import get_journal, register_applier
 
 # ============================================
 # 存取函數 (Async DB)
 # ============================================
 
 
+TRACKER_UPSERT = register_statement("tracker_upsert", """
+    INSERT INTO initiative_trackers (channel_id, data) VALUES ($1, $2)
+    ON CONFLICT (channel_id) DO UPDATE SET data = $2, updated_at = CURRENT_TIMESTAMP
+""")
+TRACKER_SELECT = register_statement(
+    "tracker_select", "SELECT data FROM initiative_trackers WHERE channel_id = $1"
+)
+# 結束時間取自日誌紀錄，離線期間封存的戰鬥重播後仍保有原本的時間
+COMBAT_INSERT = register_statement("combat_insert", """
+    INSERT INTO combat_history (channel_id, data, ended_at) VALUES ($1, $2, to_timestamp($3)::timestamp)
+""", sqlite="""
+    INSERT INTO combat_history (channel_id, data, ended_at) VALUES ($1, $2, datetime($3, 'unixepoch'))
+""")
+
+
+async def _write_tracker(channel_id, data):
+    """寫入資料庫 (也作為日誌重播函數)"""
+    await Database.execute(TRACKER_UPSERT, channel_id, data)
+
+
+register_applier("tracker", _write_tracker)
+
+
+async def _write_combat(key, data):
+    """寫入 combat_history (也作為日誌重播函數)；每場戰鬥的 key 都不同，不會被合併"""
+    await Database.execute(COMBAT_INSERT, data["channel_id"], data["record"], data["ended_at"])
+
+
+register_applier("combat", _write_combat)
+
+
 async def save_tracker(channel_id):
-    """將特定頻道的先攻表儲存到資料庫"""
+    """將特定頻道的先攻表儲存到資料庫 (先寫入本地日誌)"""
     channel_id = str(channel_id)
     if channel_id not in shared_state.initiative_trackers:
         return
 
     data = shared_state.initiative_trackers[channel_id]
 
-    query = """
-        INSERT INTO initiative_trackers (channel_id, data) VALUES ($1, $2)
-        ON CONFLICT (channel_id) DO UPDATE SET data = $2, updated_at = CURRENT_TIMESTAMP
-    """
+    journal = get_journal()
+    seq = journal.append("tracker", channel_id, data)
+    if journal.degraded:
+        # 資料庫離線中：只寫日誌，由背景重播器補寫，不阻塞互動
+        return
+
     try:
-        await Database.execute(query, channel_id, json.dumps(data))
+        await _write_tracker(channel_id, data)
+        journal.ack(seq)
         # log_message(f"💾 先攻表已儲存 (頻道 {channel_id})") # 減少 log 噪音
     except Exception as e:
         log_message(f"❌ 儲存先攻表失敗: {e}")
+        journal.start_replayer()
 
 
 async def load_tracker(channel_id):
-    """從資料庫載入特定頻道的先攻表"""
+    """從資料庫載入特定頻道的先攻表 (日誌中較新的未寫入資料優先)"""
     channel_id = str(channel_id)
-    query = "SELECT data FROM initiative_trackers WHERE channel_id = $1"
+
+    pending = get_journal().latest("tracker", channel_id)
+    if pending is not None:
+        shared_state.initiative_trackers[channel_id] = pending
+        log_message(f"📒 先攻表已從本地日誌載入 (頻道 {channel_id})")
+        return True
+
     try:
-        data_str = await Database.fetchval(query, channel_id)
-        if data_str:
-            data = json.loads(data_str)
+        data = decode_json(await Database.fetchval(TRACKER_SELECT, channel_id))
+        if data:
             shared_state.initiative_trackers[channel_id] = data
             log_message(f"📂 先攻表已載入 (頻道 {channel_id})")
             return True
@@ -74,20 +117,74 @@ async def get_tracker(channel_id):
 
 
 # ============================================
-# 核心操作函數 (Async)
+# 戰鬥統計 (增量累計)
 # ============================================
 
 
-async def add_entry(
-    channel_id, name: str, initiative: int, roll_detail: str = None, formula: str = None
-):
+def _get_tally(tracker):
+    """取得先攻表的戰鬥統計，舊資料沒有時建立 (隨 tracker 一起持久化)"""
+    tally = tracker.get("tally")
+    if tally is None:
+        tally = {
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "rounds": tracker.get("current_round", 1),
+            "turns": 0,
+            "damage_taken": 0,
+            "healing": 0,
+            "combatants": {},
+        }
+        tracker["tally"] = tally
+    return tally
+
+
+def _get_combatant_tally(tally, name: str):
+    combatant = tally["combatants"].get(name)
+    if combatant is None:
+        combatant = {"damage_taken": 0, "healing": 0, "turns": 0}
+        tally["combatants"][name] = combatant
+    return combatant
+
+
+def _record_hp_delta(tracker, name: str, delta: int):
+    tally = _get_tally(tracker)
+    combatant = _get_combatant_tally(tally, name)
+    if delta < 0:
+        tally["damage_taken"] += -delta
+        combatant["damage_taken"] += -delta
+    elif delta > 0:
+        tally["healing"] += delta
+        combatant["healing"] += delta
+
+
+def _record_turn(tracker, name: str, step: int):
+    """step=1 記錄完成一個行動；step=-1 用於上一位時撤銷"""
+    tally = _get_tally(tracker)
+    combatant = _get_combatant_tally(tally, name)
+    if step < 0 and combatant["turns"] <= 0:
+        return
+    tally["turns"] += step
+    combatant["turns"] += step
+    tally["rounds"] = max(tally["rounds"], tracker["current_round"])
+
+
+async def get_combat_stats(channel_id):
+    """取得目前戰鬥的累計統計 (直接讀取 tally，不掃描紀錄)"""
     tracker = await get_tracker(channel_id)
+    if "tally" in tracker:
+        return tracker["tally"]
+    # 舊資料沒有 tally：建立後立即儲存，之後的查詢不必再重建
+    tally = _get_tally(tracker)
+    await save_tracker(channel_id)
+    return tally
 
-    for entry in tracker["entries"]:
-        if entry["name"] == name:
-            return False
 
-    new_entry = {
+# ============================================
+# 核心操作函數 (Async)
+# ============================================
+
+
+def _new_entry(name: str, initiative: int, roll_detail: str = None, formula: str = None):
+    return {
         "name": name,
         "initiative": initiative,
         "roll_detail": roll_detail,
@@ -102,6 +199,30 @@ async def add_entry(
         "last_formula": formula,
     }
 
+
+def _roll_with_detail(formula: str):
+    """擲骰並組出顯示用的明細，回傳 (結果, 明細)；公式錯誤時拋出 DiceParseError"""
+    result, dice_rolls = parse_and_roll(formula)
+    if dice_rolls:
+        rolls_str = ", ".join(
+            f"[{', '.join(map(str, d.kept_rolls if d.kept_rolls else d.rolls))}]"
+            for d in dice_rolls
+        )
+        return result, f"{rolls_str} = {result}"
+    return result, str(result)
+
+
+async def add_entry(
+    channel_id, name: str, initiative: int, roll_detail: str = None, formula: str = None
+):
+    tracker = await get_tracker(channel_id)
+
+    for entry in tracker["entries"]:
+        if entry["name"] == name:
+            return False
+
+    new_entry = _new_entry(name, initiative, roll_detail, formula)
+
     tracker["entries"].append(new_entry)
     tracker["is_active"] = True
 
@@ -114,16 +235,7 @@ async def add_entry(
 
 async def add_entry_with_roll(channel_id, formula: str, name: str):
     try:
-        result, dice_rolls = parse_and_roll(formula)
-
-        if dice_rolls:
-            rolls_str = ", ".join(
-                f"[{', '.join(map(str, d.kept_rolls if d.kept_rolls else d.rolls))}]"
-                for d in dice_rolls
-            )
-            roll_detail = f"{rolls_str} = {result}"
-        else:
-            roll_detail = str(result)
+        result, roll_detail = _roll_with_detail(formula)
 
         success = await add_entry(channel_id, name, result, roll_detail, formula)
         if success:
@@ -135,6 +247,83 @@ async def add_entry_with_roll(channel_id, formula: str, name: str):
         return False, str(e), None
 
 
+async def add_entries_bulk(channel_id, characters: dict):
+    """
+    一次導入多個全域角色：各自以保存的先攻公式擲骰 (預設 1d20)，
+    已在先攻表中的角色只更新數值與常用骰；最後只排序一次、儲存一次。
+
+    Args:
+        characters: 名稱 -> 全域角色資料 (get_characters 的回傳值)
+
+    Returns:
+        list: 每個角色一筆 dict {name, added, formula, detail, error}
+    """
+    tracker = await get_tracker(channel_id)
+    existing = {entry["name"]: entry for entry in tracker["entries"]}
+    results = []
+
+    for name, data in characters.items():
+        formula = data.get("initiative_formula") or "1d20"
+        entry = existing.get(name)
+        added = entry is None
+        detail = None
+        if added:
+            try:
+                initiative, detail = _roll_with_detail(formula)
+            except DiceParseError as e:
+                results.append({"name": name, "added": False, "formula": formula, "detail": None, "error": str(e)})
+                continue
+            entry = _new_entry(name, initiative, detail, formula)
+            tracker["entries"].append(entry)
+            existing[name] = entry
+
+        stats = data.get("stats") or {}
+        for key in ("hp", "elements", "atk", "def_"):
+            if stats.get(key) is not None:
+                entry[key] = stats[key]
+        entry.setdefault("favorite_dice", {}).update(data.get("favorite_dice") or {})
+        results.append({"name": name, "added": added, "formula": formula, "detail": detail, "error": None})
+
+    if results:
+        if any(r["added"] for r in results):
+            tracker["is_active"] = True
+            await sort_entries(channel_id)
+        await save_tracker(channel_id)
+        log_message(f"⚔️ 先攻表: 批次導入 {len(results)} 名角色")
+    return results
+
+
+async def import_characters(channel_id, names: list):
+    """
+    從全域角色庫導入多個角色 (單一查詢取得全部資料)
+
+    Returns:
+        (list, list): add_entries_bulk 的結果, 找不到的名稱
+    """
+    from utils.character_storage import get_characters
+
+    found = await get_characters(names)
+    ordered = {name: found[name] for name in names if name in found}
+    missing = [name for name in names if name not in found]
+    results = await add_entries_bulk(channel_id, ordered)
+    return results, missing
+
+
+def format_import_results(results: list, missing: list) -> str:
+    """批次導入結果訊息"""
+    lines = []
+    for r in results:
+        if r["error"]:
+            lines.append(f"❌ **{r['name']}** 先攻公式錯誤: {r['error']}")
+        elif r["added"]:
+            lines.append(f"✅ **{r['name']}** 🎲 {r['formula']} → {r['detail']}")
+        else:
+            lines.append(f"⚠️ **{r['name']}** 已存在，已更新數值與常用骰")
+    for name in missing:
+        lines.append(f"❓ 全域角色庫中找不到 **{name}**")
+    return "\n".join(lines) or "⚠️ 沒有導入任何角色"
+
+
 async def remove_entry(channel_id, name: str):
     tracker = await get_tracker(channel_id)
 
@@ -210,6 +399,8 @@ async def next_turn(channel_id):
     if not tracker["entries"]:
         return None, False
 
+    _record_turn(tracker, tracker["entries"][tracker["current_index"]]["name"], 1)
+
     tracker["current_index"] += 1
     new_round = False
 
@@ -217,6 +408,8 @@ async def next_turn(channel_id):
         tracker["current_index"] = 0
         tracker["current_round"] += 1
         new_round = True
+        tally = _get_tally(tracker)
+        tally["rounds"] = max(tally["rounds"], tracker["current_round"])
 
     current_entry = tracker["entries"][tracker["current_index"]]
     log_message(
@@ -233,6 +426,8 @@ async def prev_turn(channel_id):
     if not tracker["entries"]:
         return None, tracker["current_round"]
 
+    previous_index = tracker["current_index"]
+    previous_round = tracker["current_round"]
     tracker["current_index"] -= 1
 
     if tracker["current_index"] < 0:
@@ -243,6 +438,12 @@ async def prev_turn(channel_id):
             tracker["current_index"] = 0
 
     current_entry = tracker["entries"][tracker["current_index"]]
+    if (tracker["current_index"], tracker["current_round"]) != (
+        previous_index,
+        previous_round,
+    ):
+        # 回到上一位：撤銷其已完成的行動次數
+        _record_turn(tracker, current_entry["name"], -1)
     await save_tracker(channel_id)
 
     return current_entry["name"], tracker["current_round"]
@@ -280,6 +481,7 @@ async def modify_hp(channel_id, name: str, delta: int):
         return False, "找不到角色"
 
     entry["hp"] += delta
+    _record_hp_delta(await get_tracker(channel_id), name, delta)
     log_message(
         f"⚔️ 先攻表: {name} HP {'+' if delta >= 0 else ''}{delta} → {entry['hp']}"
     )
@@ -499,7 +701,9 @@ async def reset_tracker(channel_id):
 
 
 async def end_combat(channel_id):
+    channel_id = str(channel_id)
     tracker = await get_tracker(channel_id)
+    tally = _get_tally(tracker)
 
     summary = {
         "total_rounds": tracker["current_round"],
@@ -507,12 +711,17 @@ async def end_combat(channel_id):
         "survivors": [
             e["name"] for e in tracker["entries"] if e["hp"] is None or e["hp"] > 0
         ],
+        "tally": tally,
     }
 
+    if tracker["entries"] or tally["turns"]:
+        await archive_combat(channel_id, summary, tracker["entries"])
+
     tracker["entries"] = []
     tracker["current_round"] = 1
     tracker["current_index"] = 0
     tracker["is_active"] = False
+    tracker.pop("tally", None)
 
     log_message(f"⚔️ 先攻表: 戰鬥結束 (共 {summary['total_rounds']} 回合)")
     await save_tracker(channel_id)
@@ -520,6 +729,85 @@ async def end_combat(channel_id):
     return summary
 
 
+async def archive_combat(channel_id, summary: dict, entries: list):
+    """將結束的戰鬥寫入 combat_history 表 (先寫入本地日誌，資料庫離線時由背景重播器補寫)"""
+    channel_id = str(channel_id)
+    data = {
+        "channel_id": channel_id,
+        "ended_at": time.time(),
+        "record": {
+            "summary": {k: v for k, v in summary.items() if k != "tally"},
+            "tally": summary["tally"],
+            "entries": entries,
+        },
+    }
+
+    journal = get_journal()
+    seq = journal.append("combat", f"{channel_id}:{uuid.uuid4().hex}", data)
+    if journal.degraded:
+        log_message(f"📒 資料庫離線，戰鬥紀錄已暫存於本地日誌 (頻道 {channel_id})")
+        return True
+
+    try:
+        await _write_combat(None, data)
+        journal.ack(seq)
+        log_message(f"📚 戰鬥紀錄已封存 (頻道 {channel_id})")
+        return True
+    except Exception as e:
+        log_message(f"❌ 封存戰鬥紀錄失敗，已保留於本地日誌: {e}")
+        journal.start_replayer()
+        return False
+
+
+async def get_combat_history(channel_id, limit: int = 5):
+    """取得頻道最近的戰鬥紀錄 (新到舊)"""
+    query = """
+        SELECT data, ended_at FROM combat_history
+        WHERE channel_id = $1 ORDER BY ended_at DESC, id DESC LIMIT $2
+    """
+    try:
+        rows = await Database.fetch(query, str(channel_id), limit)
+        history = []
+        for row in rows:
+            record = decode_json(row["data"])
+            record["ended_at"] = row["ended_at"]
+            history.append(record)
+        return history
+    except Exception as e:
+        log_message(f"❌ 讀取戰鬥紀錄失敗: {e}")
+        return []
+
+
+def format_combat_report(summary: dict) -> str:
+    """組合戰鬥結束訊息 (回合數、參戰角色、存活者與累計統計)"""
+    tally = summary.get("tally") or {}
+    msg = "🏁 **戰鬥結束！**\n"
+    msg += "━━━━━━━━━━━━━━━━━━\n"
+    msg += f"📊 總回合數: {summary['total_rounds']}\n"
+    msg += f"👥 參戰角色: {summary['total_characters']}\n"
+    if summary["survivors"]:
+        msg += f"✨ 存活者: {', '.join(summary['survivors'])}\n"
+    if tally:
+        msg += format_combat_stats(tally, header=False)
+    return msg
+
+
+def format_combat_stats(tally: dict, header: bool = True) -> str:
+    """將 tally 轉為顯示文字"""
+    lines = []
+    if header:
+        lines.append(f"📈 **戰鬥統計** ─ 第 {tally['rounds']} 回合")
+        lines.append("━" * 30)
+    lines.append(
+        f"🔁 行動次數: {tally['turns']} | 💔 總傷害: {tally['damage_taken']} | 💚 總治療: {tally['healing']}"
+    )
+    for name, stats in tally["combatants"].items():
+        lines.append(
+            f"• **{name}**: 行動 {stats['turns']} | 受傷 {stats['damage_taken']} | 治療 {stats['healing']}"
+        )
+    return "\n".join(lines) + "\n"
+
+
 async def get_tracker_display(channel_id):
     tracker = await get_tracker(channel_id)
 
@@ -0,0 +1,300 @@
+"""
+本地寫前日誌 (Write-ahead journal)
+每次先攻表 / 角色變更都先追加到本地檔案，再寫入 PostgreSQL。
+資料庫無法連線時，變更只寫入日誌，由背景重播器在連線恢復後補寫；
+啟動時也會重播上次尚未確認 (ack) 的紀錄，確保不會遺失任何一回合。
+
+檔案格式：每行一筆 JSON
+    {"seq": 1, "op": "tracker", "key": "123", "data": {...}}   # 變更紀錄
+    {"ack": 1}                                                 # 已寫入資料庫
+"""
+
+import os
+import copy
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from utils.music import log_message
+
+JOURNAL_DIR = os.path.join("data", "journal")
+JOURNAL_PATH = os.path.join(JOURNAL_DIR, "journal.log")
+
+FSYNC_BATCH = 32           # 累積多少筆未 fsync 的紀錄就立即 fsync
+FSYNC_INTERVAL = 0.2       # 秒，未達批次數量時的最長 fsync 延遲
+COMPACT_BYTES = 1024 * 1024  # 全部確認後，檔案超過此大小就截斷
+REPLAY_RETRY_DELAY = 5     # 秒，重播失敗後的初始重試間隔
+REPLAY_MAX_DELAY = 60
+
+# op -> async def applier(key, data)，由各模組註冊自己的資料庫寫入函數
+_appliers = {}
+# op -> fold(older, newer)；增量 (patch) 型紀錄需要把同一 key 的多筆合併，文件型只取最新一筆
+_folders = {}
+
+
+def register_applier(op: str, applier, fold=None):
+    """註冊某種紀錄的重播函數 (例如 'tracker' -> 寫入 initiative_trackers)"""
+    _appliers[op] = applier
+    if fold is not None:
+        _folders[op] = fold
+
+
+class Journal:
+    """Append-only 日誌檔，追蹤尚未寫入資料庫的紀錄"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._seq = 0
+        self._pending = {}        # seq -> record (尚未 ack，data 為序列化時的副本)
+        self._unsynced = 0
+        # 檔案寫入與 fsync 都交給單一執行緒依序執行，不阻塞事件迴圈
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self._fsync_handle = None
+        self._replay_task = None
+        self.degraded = False     # 資料庫寫入失敗後為 True，直到重播完成
+
+    # ---------- 檔案操作 ----------
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._load()
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def _load(self):
+        """讀取既有日誌，重建未確認紀錄 (忽略當機時寫到一半的最後一行)"""
+        if not os.path.exists(self.path):
+            return
+        acked = set()
+        records = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "ack" in item:
+                    acked.add(item["ack"])
+                elif "seq" in item:
+                    records[item["seq"]] = item
+                    self._seq = max(self._seq, item["seq"])
+        self._pending = {seq: r for seq, r in records.items() if seq not in acked}
+        if self._pending:
+            self.degraded = True
+            log_message(f"📒 日誌中有 {len(self._pending)} 筆未寫入資料庫的紀錄")
+
+    def _submit(self, fn, *args):
+        """在寫入執行緒上依序執行；沒有事件迴圈時 (啟動 / 關閉) 直接等待完成"""
+        future = self._io.submit(self._run_io, fn, *args)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            future.result()
+
+    @staticmethod
+    def _run_io(fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            log_message(f"❌ 日誌寫入失敗: {e}")
+
+    def _write(self, item: dict):
+        self._write_line(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def _write_line(self, line: str):
+        f = self._open()
+        self._submit(self._write_file, f, line)
+        self._unsynced += 1
+        self._schedule_fsync()
+
+    @staticmethod
+    def _write_file(f, line: str):
+        f.write(line)
+        f.flush()
+
+    def _schedule_fsync(self):
+        """批次 fsync：累積到 FSYNC_BATCH 筆立即同步，否則延遲 FSYNC_INTERVAL 秒"""
+        if self._unsynced >= FSYNC_BATCH:
+            self.sync()
+            return
+        if self._fsync_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.sync()
+            return
+        self._fsync_handle = loop.call_later(FSYNC_INTERVAL, self.sync)
+
+    def sync(self):
+        """將已寫入的紀錄 fsync 到磁碟 (排在已送出的寫入之後)"""
+        if self._fsync_handle is not None:
+            self._fsync_handle.cancel()
+            self._fsync_handle = None
+        if self._file is not None and self._unsynced:
+            self._submit(os.fsync, self._file.fileno())
+            self._unsynced = 0
+
+    def _compact(self):
+        """所有紀錄都已確認時截斷檔案"""
+        if self._pending or self._file is None:
+            return
+        self._submit(self._truncate_file, self._file)
+
+    @staticmethod
+    def _truncate_file(f):
+        if f.tell() < COMPACT_BYTES:
+            return
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.truncate()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            # 等待所有排隊中的寫入與 fsync 完成後才關檔
+            self._io.shutdown(wait=True)
+            self._file.close()
+            self._file = None
+            self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+
+    # ---------- 紀錄 ----------
+
+    def append(self, op: str, key: str, data) -> int:
+        """追加一筆變更紀錄，回傳序號 (之後用 ack 確認)"""
+        self._open()
+        self._seq += 1
+        record = {"seq": self._seq, "op": op, "key": key, "data": data, "ts": time.time()}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self._write_line(line)
+        # 保存序列化當下的副本：之後呼叫端修改原物件不會影響尚未寫入資料庫的紀錄
+        self._pending[self._seq] = json.loads(line)
+        return self._seq
+
+    def ack(self, seq: int):
+        """標記紀錄已寫入資料庫"""
+        if self._pending.pop(seq, None) is None:
+            return
+        self._write({"ack": seq})
+        self._compact()
+
+    def ack_through(self, op: str, key: str, seq: int):
+        """確認同一個 (op, key) 中序號 <= seq 的所有紀錄 (已被較新的紀錄覆蓋)"""
+        for pending_seq in sorted(self._pending):
+            record = self._pending[pending_seq]
+            if pending_seq <= seq and record["op"] == op and record["key"] == key:
+                self.ack(pending_seq)
+
+    def discard(self, op: str, key: str):
+        """丟棄某個 key 所有未確認的紀錄 (例如資料已被刪除)"""
+        self._open()
+        if self._pending:
+            self.ack_through(op, key, self._seq)
+
+    def latest(self, op: str, key: str):
+        """取得某個 key 未確認資料的最終狀態 (比資料庫內容新)，沒有則回傳 None"""
+        self._open()
+        fold = _folders.get(op)
+        data = None
+        for seq in sorted(self._pending):
+            record = self._pending[seq]
+            if record["op"] == op and record["key"] == key:
+                data = fold(data, record["data"]) if fold and data is not None else record["data"]
+        # 回傳副本，呼叫端修改載入的資料不會改到尚未寫入資料庫的紀錄
+        return copy.deepcopy(data)
+
+    def pending_count(self) -> int:
+        self._open()
+        return len(self._pending)
+
+    def coalesced(self):
+        """每個 (op, key) 合併成一筆，依序號排序 (文件型只取最新；patch 型依序 fold)"""
+        latest = {}
+        for seq in sorted(self._pending):
+            record = self._pending[seq]
+            slot = (record["op"], record["key"])
+            fold = _folders.get(record["op"])
+            if fold and slot in latest:
+                record = dict(record, data=fold(latest[slot]["data"], record["data"]))
+            latest[slot] = record
+        return sorted(latest.values(), key=lambda r: r["seq"])
+
+    # ---------- 重播 ----------
+
+    async def replay(self):
+        """將未確認紀錄寫入資料庫，任何一筆失敗就拋出例外 (保留剩餘紀錄)"""
+        self._open()
+        replayed = 0
+        for record in self.coalesced():
+            applier = _appliers.get(record["op"])
+            if applier is None:
+                log_message(f"⚠️ 日誌紀錄類型 `{record['op']}` 沒有重播函數，略過")
+                self.ack_through(record["op"], record["key"], record["seq"])
+                continue
+            await applier(record["key"], record["data"])
+            self.ack_through(record["op"], record["key"], record["seq"])
+            replayed += 1
+        if not self._pending:
+            self.degraded = False
+        return replayed
+
+    def start_replayer(self):
+        """進入降級模式並啟動背景重播器 (若尚未啟動)"""
+        self.degraded = True
+        if self._replay_task is not None and not self._replay_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._replay_task = loop.create_task(self._replay_loop())
+
+    async def _replay_loop(self):
+        delay = REPLAY_RETRY_DELAY
+        log_message(f"📒 資料庫寫入失敗，啟動日誌重播器 ({self.pending_count()} 筆待寫入)")
+        while self._pending:
+            await asyncio.sleep(delay)
+            try:
+                replayed = await self.replay()
+                log_message(f"✅ 日誌重播完成，已補寫 {replayed} 筆紀錄")
+            except Exception as e:
+                delay = min(delay * 2, REPLAY_MAX_DELAY)
+                log_message(f"⚠️ 日誌重播失敗，{delay} 秒後重試: {e}")
+        self.degraded = False
+
+
+_journal = None
+
+
+def get_journal() -> Journal:
+    """取得全域日誌 (延遲建立，路徑依 JOURNAL_PATH)"""
+    global _journal
+    if _journal is None:
+        _journal = Journal(JOURNAL_PATH)
+    return _journal
+
+
+async def replay_journal():
+    """啟動時重播上次未寫入資料庫的紀錄"""
+    journal = get_journal()
+    journal._open()
+    if not journal.pending_count():
+        return 0
+    try:
+        replayed = await journal.replay()
+        log_message(f"✅ 啟動重播日誌完成，補寫 {replayed} 筆紀錄")
+        return replayed
+    except Exception as e:
+        log_message(f"❌ 啟動重播日誌失敗，改由背景重試: {e}")
+        journal.start_replayer()
+        return 0
+
+
+def close_journal():
+    """關閉日誌 (程式結束時呼叫，確保 fsync)"""
+    global _journal
+    if _journal is not None:
+        _journal.close()
+        _journal = None
@@ -0,0 +1,214 @@
+"""
+響度分析 (EBU R128)
+每個音檔只在背景分析一次 (ffmpeg loudnorm 量測，於獨立行程池執行，不佔用事件迴圈與 GIL)，
+結果連同檔案的 (檔名, 大小, mtime) 記在歌單的歌曲資料 `loudness` 欄位；檔案沒變就不再分析。
+播放時直接套用算好的增益，不必在播放當下分析音訊。
+.opus 檔的增益超出直送容許範圍時，分析後從保留的原始下載檔一次編碼寫進檔案 (gain_db 變為 0)，播放維持 Opus 直送；
+不需要寫入增益時直接刪除原始檔。
+"""
+
+import os
+import re
+import json
+import math
+import asyncio
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.audio_library import apply_gain_to_opus, discard_source, PASSTHROUGH_TOLERANCE_DB
+
+TARGET_LUFS = float(os.getenv("LOUDNESS_TARGET", "-18"))
+LOUDNESS_WORKERS = int(os.getenv("LOUDNESS_WORKERS", "1"))
+TRUE_PEAK_LIMIT = -1.0          # 套用增益後的最高真峰值 (dBTP)
+MAX_BOOST_DB = 12.0
+MAX_CUT_DB = -30.0
+
+_JSON_BLOCK = re.compile(r"\{[^{}]*\"input_i\"[^{}]*\}", re.S)
+
+
+def measure_loudness(path: str) -> dict | None:
+    """量測整合響度與真峰值 (在行程池中執行)；失敗回傳 None"""
+    command = ["ffmpeg", "-hide_banner", "-nostats", "-i", path, "-vn",
+               "-af", "loudnorm=print_format=json", "-f", "null", "-"]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    match = _JSON_BLOCK.search(result.stderr)
+    if result.returncode != 0 or not match:
+        return None
+    stats = json.loads(match.group(0))
+    try:
+        lufs, true_peak = float(stats["input_i"]), float(stats["input_tp"])
+    except (KeyError, ValueError):
+        return None
+    if not (math.isfinite(lufs) and math.isfinite(true_peak)):   # 無聲檔案會回報 -inf
+        return None
+    return {"lufs": lufs, "true_peak": true_peak}
+
+
+def gain_for(lufs: float, true_peak: float) -> float:
+    """達到目標響度需要的增益 (dB)，不讓真峰值超過上限"""
+    gain = min(TARGET_LUFS - lufs, TRUE_PEAK_LIMIT - true_peak)
+    return max(MAX_CUT_DB, min(MAX_BOOST_DB, round(gain, 2)))
+
+
+def _signature(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {"file": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _valid_entry(song: dict, path: str) -> dict | None:
+    entry = song.get("loudness") if song else None
+    if not entry or not path:
+        return None
+    signature = _signature(path)
+    if signature is None or any(entry.get(key) != value for key, value in signature.items()):
+        return None
+    return entry
+
+
+def cached_gain(song: dict, path: str) -> float | None:
+    """歌曲資料內的分析結果仍對應目前的檔案時回傳增益 (dB)，否則 None"""
+    entry = _valid_entry(song, path)
+    return entry.get("gain_db") if entry else None
+
+
+def _needs_baking(path: str, entry: dict) -> bool:
+    """.opus 檔的增益超出直送容許範圍，且尚未嘗試寫進檔案失敗過"""
+    return (path.lower().endswith(".opus") and not entry.get("bake_failed")
+            and abs(entry.get("gain_db") or 0.0) > PASSTHROUGH_TOLERANCE_DB)
+
+
+class LoudnessAnalyzer:
+    """背景響度分析；同一檔案同時只分析一次"""
+
+    def __init__(self, workers: int = LOUDNESS_WORKERS):
+        self.workers = workers
+        self._pool = None
+        self._pending = {}        # path -> 處理中的 Task
+        self.analyzed = 0
+        self.failed = 0
+        self.baked = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def analyze(self, title: str, path: str) -> float | None:
+        """分析一首歌並寫回歌單；已有有效結果則直接回傳"""
+        from utils.music import get_musicsheet
+
+        entry = _valid_entry(get_musicsheet().find(title), path)
+        if entry is not None and not _needs_baking(path, entry):
+            return entry.get("gain_db")
+
+        # 同一檔案同時只處理一次 (量測與寫入增益都在同一個工作內)
+        task = self._pending.get(path)
+        if task is None:
+            task = asyncio.ensure_future(self._process(title, path, entry))
+            self._pending[path] = task
+            task.add_done_callback(lambda _: self._pending.pop(path, None))
+        return await asyncio.shield(task)
+
+    async def _process(self, title: str, path: str, entry: dict | None) -> float | None:
+        from utils.music import get_musicsheet, save_musicsheet, log_message
+
+        loop = asyncio.get_running_loop()
+        if entry is None:
+            signature = _signature(path)
+            if signature is None:
+                return None
+            stats = await loop.run_in_executor(self._executor(), measure_loudness, path)
+            if stats is None:
+                self.failed += 1
+                log_message(f"⚠️ 響度分析失敗: {os.path.basename(path)}")
+                return None
+            self.analyzed += 1
+            entry = {**signature, **stats, "gain_db": gain_for(stats["lufs"], stats["true_peak"])}
+            log_message(f"🔊 響度分析 `{title}`: {stats['lufs']:.1f} LUFS，增益 {entry['gain_db']:+.1f} dB")
+
+        if _needs_baking(path, entry):
+            gain = entry["gain_db"]
+            if await loop.run_in_executor(self._executor(), apply_gain_to_opus, path, gain):
+                entry = {**entry, **_signature(path), "gain_db": 0.0, "applied_db": gain,
+                         "lufs": entry["lufs"] + gain, "true_peak": entry["true_peak"] + gain}
+                self.baked += 1
+                log_message(f"🔊 已將 {gain:+.1f} dB 寫入 `{title}`，播放維持 Opus 直送")
+            else:
+                entry = {**entry, "bake_failed": True}
+                log_message(f"⚠️ 無法將增益寫入 `{title}`，播放時改為重新編碼")
+        discard_source(path)        # 分析 (與寫入增益) 已完成，原始下載檔不再需要
+
+        sheet = get_musicsheet()
+        song = sheet.find(title)
+        if song is not None:
+            song["loudness"] = entry
+            save_musicsheet(sheet.data)
+        return entry["gain_db"]
+
+    async def scan_library(self):
+        """分析歌單內所有已下載但尚無有效結果的歌"""
+        from utils.music import get_musicsheet, find_downloaded_file, log_message
+
+        todo = []
+        for song in list(get_musicsheet().songs):
+            path = find_downloaded_file(song["title"])
+            if not path:
+                continue
+            entry = _valid_entry(song, path)
+            # 尚未分析，或舊版分析後增益還沒寫進 .opus 檔
+            if entry is None or _needs_baking(path, entry):
+                todo.append((song["title"], path))
+        if not todo:
+            return
+        log_message(f"🔊 背景響度分析 {len(todo)} 首歌")
+        results = await asyncio.gather(*(self.analyze(title, path) for title, path in todo),
+                                       return_exceptions=True)
+        log_message(f"✅ 響度分析完成，成功 {sum(1 for r in results if isinstance(r, float))} 首")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_analyzer = LoudnessAnalyzer()
+_tasks = set()
+
+
+def get_loudness_analyzer() -> LoudnessAnalyzer:
+    return _analyzer
+
+
+def _spawn(coro) -> asyncio.Task:
+    from utils.music import log_message
+
+    task = asyncio.get_running_loop().create_task(coro)
+    _tasks.add(task)
+
+    def done(task):
+        _tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            log_message(f"❌ 響度分析發生錯誤: {task.exception()}")
+
+    task.add_done_callback(done)
+    return task
+
+
+def schedule_analysis(title: str, path: str) -> asyncio.Task:
+    return _spawn(_analyzer.analyze(title, path))
+
+
+def schedule_library_scan() -> asyncio.Task:
+    return _spawn(_analyzer.scan_library())
+
+
+def shutdown_loudness():
+    for task in list(_tasks):
+        task.cancel()
+    _analyzer.shutdown()
@@ -1,57 +1,294 @@
-import json
+"""
+JSON <-> 資料庫 搬移 / 備份工具
+逐段解析 initiative_tracker.json 與 data/characters.json (不整份載入記憶體)，
+每 BATCH_SIZE 筆以 Database.bulk_upsert 寫入 (Postgres: COPY 到暫存表後合併；SQLite: 單一交易)。
+內容相同的列不會被改寫，重複執行結果相同，因此也可作為備份的匯入 / 匯出路徑。
+
+    python -m utils.migrate_json_to_db                 # 匯入
+    python -m utils.migrate_json_to_db export          # 匯出成相同格式的 JSON
+    python -m utils.migrate_json_to_db import --characters backup/characters.json
+
+匯入先攻表時請先停止機器人 (執行中的機器人會以記憶體中的先攻表覆蓋)。
+"""
+
 import os
+import sys
+import json
+import time
 import asyncio
-from utils.db import Database, init_db
+import argparse
+from utils.db import Database, init_db, encode_json, decode_json
+
+INIT_FILE = "initiative_tracker.json"
+CHAR_FILE = os.path.join("data", "characters.json")
+BATCH_SIZE = 5000
+CHUNK_SIZE = 64 * 1024
+
+CHARACTER_CONFLICT = """
+    ON CONFLICT (name) DO UPDATE SET data = EXCLUDED.data,
+        version = characters.version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE characters.data IS DISTINCT FROM EXCLUDED.data
+"""
+TRACKER_CONFLICT = """
+    ON CONFLICT (channel_id) DO UPDATE SET data = EXCLUDED.data, updated_at = CURRENT_TIMESTAMP
+    WHERE initiative_trackers.data IS DISTINCT FROM EXCLUDED.data
+"""
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+# ============================================
+# 串流 JSON 解析
+# ============================================
+
+class JsonStream:
+    """
+    逐段讀取 JSON 檔：只在需要時讀入下一段，每個值以 raw_decode 解析，
+    因此記憶體只需容納單一個值 (一個角色 / 一個頻道的先攻表)。
+    """
+
+    def __init__(self, f, chunk_size: int = CHUNK_SIZE):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size: int = None) -> bool:
+        chunk = self._f.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """跳過空白，回傳下一個字元 (檔案結束回傳空字串)"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON 格式錯誤: 預期 {char!r}，實際為 {found or 'EOF'!r}")
+        self._pos += 1
+
+    def value(self):
+        """解析下一個完整的值"""
+        self.peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+                # 值剛好在緩衝區結尾 (例如數字) 時可能還沒讀完，需再讀一段確認
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # 很大的值以倍增的讀取量避免重複解析太多次
+            self._fill(size)
+            size *= 2
+
+    def members(self):
+        """
+        逐一產生物件的 key；呼叫端必須在取下一個 key 之前讀掉對應的值
+        (value() 或巢狀的 members())
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            separator = self.peek()
+            self._pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"JSON 格式錯誤: 預期 ',' 或 '}}'，實際為 {separator or 'EOF'!r}")
+
+
+def iter_characters(path: str, chunk_size: int = CHUNK_SIZE):
+    """characters.json: {名稱: 角色資料}"""
+    with open(path, "r", encoding="utf-8") as f:
+        stream = JsonStream(f, chunk_size)
+        for name in stream.members():
+            yield name, stream.value()
+
+
+def iter_trackers(path: str, chunk_size: int = CHUNK_SIZE):
+    """initiative_tracker.json: {"channels": {頻道: 先攻表}}；舊格式 (頂層就是先攻表) 以 'legacy' 頻道匯入"""
+    legacy = {}
+    with open(path, "r", encoding="utf-8") as f:
+        stream = JsonStream(f, chunk_size)
+        for key in stream.members():
+            if key == "channels" and stream.peek() == "{":
+                for channel_id in stream.members():
+                    yield str(channel_id), stream.value()
+            else:
+                legacy[key] = stream.value()
+    if "entries" in legacy:
+        yield "legacy", legacy
+
+
+def _batches(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ============================================
+# 匯入 / 匯出
+# ============================================
+
+def _report(label: str, rows: int, changed: int, size: int, elapsed: float) -> dict:
+    elapsed = max(elapsed, 1e-9)
+    report = {
+        "rows": rows,
+        "changed": changed,
+        "bytes": size,
+        "seconds": elapsed,
+        "rows_per_s": rows / elapsed,
+        "mb_per_s": size / elapsed / 1e6,
+    }
+    print(f"✅ {label}: {rows} 筆 (新增/更新 {changed})，{size / 1e6:.2f} MB，"
+          f"{elapsed:.2f} 秒，{report['rows_per_s']:.0f} 筆/秒，{report['mb_per_s']:.2f} MB/秒")
+    return report
+
+
+async def _load(label: str, path: str, items, table: str, key: str, conflict: str, batch_size: int):
+    print(f"📦 匯入 {path}...")
+    start = time.perf_counter()
+    rows = changed = 0
+    for batch in _batches(items, batch_size):
+        changed += await Database.bulk_upsert(table, key, batch, conflict)
+        rows += len(batch)
+    return _report(label, rows, changed, os.path.getsize(path), time.perf_counter() - start)
+
+
+async def import_json(characters_path: str = CHAR_FILE, trackers_path: str = INIT_FILE,
+                      batch_size: int = BATCH_SIZE) -> dict:
+    """匯入 JSON 檔 (不存在的檔案略過)，回傳各表的吞吐量報告"""
+    from utils.character_versions import checkpoint_missing
 
-async def migrate():
     await init_db()
-    
-    # 1. Initiative Tracker
-    INIT_FILE = "initiative_tracker.json"
-    if os.path.exists(INIT_FILE):
-        print(f"📦 Migrating {INIT_FILE}...")
+    reports = {}
+    if trackers_path and os.path.exists(trackers_path):
         try:
-            with open(INIT_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            channels = data.get("channels", {})
-            # Also handle legacy "entries"
-            if "entries" in data:
-                channels["legacy"] = data
-                
-            count = 0
-            for cid, cdata in channels.items():
-                query = """
-                    INSERT INTO initiative_trackers (channel_id, data) VALUES ($1, $2)
-                    ON CONFLICT (channel_id) DO UPDATE SET data = $2
-                """
-                await Database.execute(query, str(cid), json.dumps(cdata))
-                count += 1
-            print(f"✅ Migrated {count} initiative trackers.")
+            reports["initiative_trackers"] = await _load(
+                "initiative_trackers", trackers_path, iter_trackers(trackers_path),
+                "initiative_trackers", "channel_id", TRACKER_CONFLICT, batch_size,
+            )
         except Exception as e:
-            print(f"❌ Migration failed for initiative: {e}")
-            
-    # 2. Characters
-    CHAR_FILE = "data/characters.json"
-    if os.path.exists(CHAR_FILE):
-        print(f"📦 Migrating {CHAR_FILE}...")
+            print(f"❌ 先攻表匯入失敗: {e}")
+
+    if characters_path and os.path.exists(characters_path):
         try:
-            with open(CHAR_FILE, 'r', encoding='utf-8') as f:
-                chars = json.load(f)
-                
-            count = 0
-            for name, cdata in chars.items():
-                query = """
-                    INSERT INTO characters (name, data) VALUES ($1, $2)
-                    ON CONFLICT (name) DO UPDATE SET data = $2
-                """
-                await Database.execute(query, name, json.dumps(cdata))
-                count += 1
-            print(f"✅ Migrated {count} characters.")
+            reports["characters"] = await _load(
+                "characters", characters_path, iter_characters(characters_path),
+                "characters", "name", CHARACTER_CONFLICT, batch_size,
+            )
+            # 匯入時改變的角色以新內容作為版本檢查點，並通知執行中的機器人丟棄快取
+            await checkpoint_missing()
+            await _notify_character_change()
         except Exception as e:
-            print(f"❌ Migration failed for characters: {e}")
+            print(f"❌ 角色匯入失敗: {e}")
+    return reports
+
+
+async def _notify_character_change():
+    from utils.db import PostgresBackend, DATABASE_URL
+    from utils.character_cache import PostgresNotifier
+
+    if isinstance(await Database.get_backend(), PostgresBackend):
+        await PostgresNotifier(DATABASE_URL).publish({"all": True})
+
+
+async def _dump(label: str, path: str, query: str, page_size: int, wrap: str = None) -> dict:
+    """以 keyset 分頁逐頁讀出並寫成 {key: data}，先寫暫存檔再取代，避免留下半份備份"""
+    print(f"📤 匯出 {path}...")
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    rows = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(f'{{"{wrap}": {{' if wrap else "{")
+        last = ""
+        while True:
+            page = await Database.fetch(query, last, page_size)
+            for row in page:
+                f.write(",\n" if rows else "\n")
+                f.write(f"{json.dumps(row[0], ensure_ascii=False)}: {encode_json(decode_json(row[1]))}")
+                rows += 1
+            if len(page) < page_size:
+                break
+            last = page[-1][0]
+        f.write("\n}}\n" if wrap else "\n}\n")
+    os.replace(tmp_path, path)
+    return _report(label, rows, 0, os.path.getsize(path), time.perf_counter() - start)
+
+
+async def export_json(characters_path: str = CHAR_FILE, trackers_path: str = INIT_FILE,
+                      batch_size: int = BATCH_SIZE) -> dict:
+    """將資料庫內容匯出成與匯入相同格式的 JSON 檔"""
+    reports = {}
+    if trackers_path:
+        reports["initiative_trackers"] = await _dump(
+            "initiative_trackers", trackers_path,
+            "SELECT channel_id, data FROM initiative_trackers WHERE channel_id > $1 ORDER BY channel_id LIMIT $2",
+            batch_size, wrap="channels",
+        )
+    if characters_path:
+        reports["characters"] = await _dump(
+            "characters", characters_path,
+            "SELECT name, data FROM characters WHERE name > $1 ORDER BY name LIMIT $2",
+            batch_size,
+        )
+    return reports
+
+
+async def migrate():
+    """相容舊用法：匯入預設路徑的 JSON 檔"""
+    return await import_json()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON 與資料庫之間的搬移 / 備份")
+    parser.add_argument("mode", nargs="?", choices=("import", "export"), default="import")
+    parser.add_argument("--characters", default=CHAR_FILE, help="角色 JSON 路徑")
+    parser.add_argument("--trackers", default=INIT_FILE, help="先攻表 JSON 路徑")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="每批筆數")
+    args = parser.parse_args(argv)
+
+    async def run():
+        try:
+            if args.mode == "export":
+                await export_json(args.characters, args.trackers, args.batch)
+            else:
+                await import_json(args.characters, args.trackers, args.batch)
+        finally:
+            await Database.close()
+
+    asyncio.run(run())
+
 
 if __name__ == "__main__":
     if os.name == 'nt':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(migrate())
+    main(sys.argv[1:])
@@ -0,0 +1,273 @@
+"""
+混音音源 (TRPG 場景)
+把音樂、持續的環境音 (例如雨聲) 與一次性音效混成同一個 PCM 串流，共用一個語音連線。
+每 20 ms 從每個圖層各讀一個音框，以 NumPy 向量運算 (int16 → float32) 乘上各圖層增益後相加；
+一次性音效播放時其他圖層自動壓低音量 (ducking)，總和超過 int16 範圍時以限幅器整體縮小，最後再截斷。
+"""
+
+import os
+import threading
+
+import numpy as np
+import discord
+
+FRAME_SIZE = 3840                   # 20 ms：48000 Hz x 2 聲道 x 2 位元組 / 50
+FRAME_SAMPLES = FRAME_SIZE // 2
+DUCK_GAIN = float(os.getenv("MIXER_DUCK_GAIN", "0.35"))
+DUCK_RAMP_FRAMES = 10               # 壓低 / 恢復音量花 200 ms
+LIMIT = 32767.0
+LIMITER_RELEASE = 0.02              # 限幅後每個音框恢復的增益
+SCENE_DIR = os.getenv("SCENE_DIR", "scene/")
+
+
+class Layer:
+    """混音器的一個圖層"""
+
+    def __init__(self, name: str, source: discord.AudioSource, gain: float = 1.0,
+                 ducks_others: bool = False, duckable: bool = True, owned: bool = True):
+        self.name = name
+        self.source = source
+        self.gain = gain
+        self.ducks_others = ducks_others   # 播放時壓低其他圖層 (一次性音效)
+        self.duckable = duckable
+        self.owned = owned                 # 混音器結束時是否一併清理 (場景的環境音由場景自己管理)
+        self.duck = 1.0                    # 目前的 ducking 倍率 (平滑變化)
+
+    def cleanup(self):
+        self.source.cleanup()
+
+
+class MixerSource(discord.AudioSource):
+    """
+    把多個 PCM 圖層混成一個 AudioSource
+    有主圖層 (音樂) 時，主圖層播完就結束，讓播放引擎的 after 回呼接下一首；
+    沒有主圖層時播到所有圖層都結束為止。
+    """
+
+    def __init__(self, main: Layer = None, layers=()):
+        self.main = main
+        self._layers = {layer.name: layer for layer in ([main] if main else []) + list(layers)}
+        self._lock = threading.Lock()
+        self._mix = np.zeros(FRAME_SAMPLES, dtype=np.float32)
+        self._scratch = np.zeros(FRAME_SAMPLES, dtype=np.float32)
+        self._limiter = 1.0
+        self._finished = False
+        self._retired = []          # 待播放執行緒清理的圖層 (讀取途中不能在事件迴圈關閉 ffmpeg)
+        self._cleaned = False
+        self.frames = 0
+        self.limited_frames = 0
+
+    # ---------- 圖層管理 (事件迴圈呼叫) ----------
+
+    def add_layer(self, layer: Layer):
+        with self._lock:
+            old = self._layers.get(layer.name)
+            self._layers[layer.name] = layer
+        if old is not None and old is not layer and old.owned:
+            self.retire(old)
+
+    def remove_layer(self, name: str) -> Layer | None:
+        with self._lock:
+            return self._layers.pop(name, None)
+
+    def retire(self, layer: Layer):
+        """移除圖層並交給播放執行緒在下一個音框前清理；混音器已清理過則直接清理"""
+        with self._lock:
+            if self._layers.get(layer.name) is layer:
+                del self._layers[layer.name]
+            if not self._cleaned:
+                self._retired.append(layer)
+                return
+        layer.cleanup()
+
+    def set_gain(self, name: str, gain: float):
+        with self._lock:
+            if name in self._layers:
+                self._layers[name].gain = gain
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    @property
+    def layer_names(self) -> list:
+        with self._lock:
+            return list(self._layers)
+
+    # ---------- 混音 (播放執行緒呼叫) ----------
+
+    def read(self) -> bytes:
+        with self._lock:
+            retired, self._retired = self._retired, []
+            layers = list(self._layers.values())
+        for layer in retired:
+            layer.cleanup()
+        if self._finished:
+            return b""
+        ducking = any(layer.ducks_others for layer in layers)
+        step = (1.0 - DUCK_GAIN) / DUCK_RAMP_FRAMES
+
+        mix = self._mix
+        mix.fill(0.0)
+        mixed = 0
+        for layer in layers:
+            try:
+                data = layer.source.read()
+            except Exception:
+                data = b""          # 單一圖層讀取失敗只移除該圖層，不中斷整個播放
+            if not data:
+                self._layer_ended(layer)
+                if self._finished:
+                    return b""
+                continue
+            if len(data) != FRAME_SIZE:     # 最後不足一個音框的部分補靜音
+                data = data[:FRAME_SIZE].ljust(FRAME_SIZE, b"\x00")
+
+            target = DUCK_GAIN if ducking and layer.duckable and not layer.ducks_others else 1.0
+            if layer.duck > target:
+                layer.duck = max(target, layer.duck - step)
+            elif layer.duck < target:
+                layer.duck = min(target, layer.duck + step)
+
+            samples = np.frombuffer(data, dtype=np.int16)
+            np.multiply(samples, np.float32(layer.gain * layer.duck), out=self._scratch)
+            mix += self._scratch
+            mixed += 1
+
+        if not mixed and not self._layers:
+            self._finished = True
+            return b""
+
+        # 限幅器：峰值超過 int16 時立即縮小整個音框，之後慢慢恢復，避免爆音與相鄰音框間的跳動
+        peak = float(np.max(np.abs(mix))) if mixed else 0.0
+        needed = LIMIT / peak if peak > LIMIT else 1.0
+        if needed < self._limiter:
+            self._limiter = needed
+        else:
+            self._limiter = min(needed, self._limiter + LIMITER_RELEASE)
+        if self._limiter < 1.0:
+            mix *= self._limiter
+            self.limited_frames += 1
+        np.clip(mix, -32768.0, LIMIT, out=mix)
+        self.frames += 1
+        return mix.astype(np.int16).tobytes()
+
+    def _layer_ended(self, layer: Layer):
+        with self._lock:
+            if self._layers.get(layer.name) is layer:
+                del self._layers[layer.name]
+        if layer is self.main:
+            self._finished = True
+        if layer.owned:
+            layer.cleanup()
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        self._finished = True
+        with self._lock:
+            layers, self._layers = list(self._layers.values()), {}
+            retired, self._retired = self._retired, []
+            self._cleaned = True
+        for layer in layers:
+            if layer.owned:
+                layer.cleanup()
+        for layer in retired:
+            layer.cleanup()
+
+
+def find_scene_file(name: str) -> str | None:
+    """在 SCENE_DIR 找環境音 / 音效檔案 (可省略副檔名)"""
+    name = os.path.basename(name)
+    path = os.path.join(SCENE_DIR, name)
+    if os.path.isfile(path):
+        return path
+    if os.path.isdir(SCENE_DIR):
+        for file in sorted(os.listdir(SCENE_DIR)):
+            if os.path.splitext(file)[0] == name:
+                return os.path.join(SCENE_DIR, file)
+    return None
+
+
+def open_layer_source(path: str, loop: bool = False) -> discord.AudioSource:
+    """以 ffmpeg 解碼成 PCM 的圖層音源；環境音以 -stream_loop 無限循環"""
+    return discord.FFmpegPCMAudio(path, before_options="-stream_loop -1" if loop else None, options="-vn")
+
+
+class Scene:
+    """
+    目前的場景音效：持續播放的環境音圖層 (跨歌曲保留) 與正在使用的混音器
+    播放引擎包裝每首歌時會把環境音一起放進混音器；沒有音樂時混音器只播環境音與音效。
+    """
+
+    def __init__(self):
+        self.ambience = {}          # 名稱 -> Layer
+        self.mixer = None           # 目前語音連線上的 MixerSource
+
+    @property
+    def active(self) -> bool:
+        return bool(self.ambience)
+
+    def wrap(self, track: discord.AudioSource = None, extra=()) -> MixerSource:
+        main = Layer("music", track) if track is not None else None
+        self.mixer = MixerSource(main, [*self.ambience.values(), *extra])
+        return self.mixer
+
+    def attach(self, voice_client, extra=()) -> bool:
+        """
+        讓語音連線播放場景混音器 (連同 extra 圖層)：沒在播放時先建好含所有圖層的混音器再播放，
+        PCM 音樂直接換成包著它的混音器。目前是 Opus 直送的歌時回傳 False，從下一首開始混音。
+        """
+        playing = voice_client.is_playing() or voice_client.is_paused()
+        current = voice_client.source if playing else None
+        if current is not None and current is self.mixer and not self.mixer.finished:
+            for layer in extra:
+                self.mixer.add_layer(layer)
+            return True
+        if current is None:
+            voice_client.play(self.wrap(extra=extra))
+            return True
+        if current.is_opus():
+            return False
+        voice_client.source = self.wrap(current, extra)
+        return True
+
+    def _dispose(self, layer: Layer):
+        """環境音圖層可能正被播放執行緒讀取：交給混音器在播放執行緒清理"""
+        if self.mixer is not None:
+            self.mixer.retire(layer)
+        else:
+            layer.cleanup()
+
+    def set_ambience(self, name: str, source: discord.AudioSource, gain: float = 0.5) -> Layer:
+        layer = Layer(f"ambience:{name}", source, gain, owned=False)
+        old = self.ambience.get(name)
+        self.ambience[name] = layer
+        if self.mixer is not None and not self.mixer.finished:
+            self.mixer.add_layer(layer)
+        if old is not None:
+            self._dispose(old)
+        return layer
+
+    def clear_ambience(self, name: str = None):
+        names = [name] if name else list(self.ambience)
+        for key in names:
+            layer = self.ambience.pop(key, None)
+            if layer is not None:
+                self._dispose(layer)
+
+    def play_sfx(self, voice_client, name: str, source: discord.AudioSource, gain: float = 1.0) -> bool:
+        """播放一次性音效 (播放期間壓低其他圖層)；目前是 Opus 直送的歌時回傳 False"""
+        layer = Layer(f"sfx:{name}", source, gain, ducks_others=True, duckable=False)
+        if self.attach(voice_client, [layer]):
+            return True
+        source.cleanup()
+        return False
+
+
+_scene = Scene()
+
+
+def get_scene() -> Scene:
+    return _scene
@@ -5,13 +5,14 @@ import glob
 import asyncio
 import yt_dlp
 import datetime
+import time
 import traceback
-import io
-import threading
 from yt_dlp.utils import sanitize_filename
-from pydub import AudioSegment
 from fuzzywuzzy import fuzz
 import utils.shared_state as shared_state  # 添加缺少的import，修復下一首按鈕錯誤
+from utils.musicsheet import get_store, index_for, renumber
+from utils.playback_session import get_session
+from utils.song_index import get_song_index
 
 # 全局常量
 DEBUG_MODE = True
@@ -56,42 +57,21 @@ def debug_log(message):
         print(message)
     log_message(message)  # 一律記錄到 log
 
-def load_musicsheet():
-    """讀取 musicsheet，確保 `is_playing`、`is_previous`、`sanitized_title` 欄位存在"""
-    if not os.path.exists(MUSIC_SHEET_PATH):
-        return {"songs": []}
+def load_musicsheet(path=None):
+    """
+    讀取 musicsheet (預設為目前歌單)，確保 `is_playing`、`is_previous`、`sanitized_title` 欄位存在
+    (目前播放 / 上一首記錄在 utils.playback_session，這兩個欄位只為相容舊格式保留)
+    檔案未變動時直接回傳記憶體中的資料；修改後請呼叫 save_musicsheet 寫回
+    """
+    return get_store().get(path or MUSIC_SHEET_PATH).data
 
-    with open(MUSIC_SHEET_PATH, "r", encoding="utf-8") as file:
-        try:
-            data = json.load(file)
-            for song in data["songs"]:
-                if "is_playing" not in song:
-                    song["is_playing"] = False
-                if "is_previous" not in song:
-                    song["is_previous"] = False
-                if "sanitized_title" not in song:
-                    song["sanitized_title"] = sanitize_filename(song["title"])
-            return data
-        except json.JSONDecodeError as e:
-            log_message(f"❌ 歌單檔案 {MUSIC_SHEET_PATH} 損壞: {e}")
-            try:
-                import shutil
-                backup_path = MUSIC_SHEET_PATH + ".corrupted"
-                shutil.copy(MUSIC_SHEET_PATH, backup_path)
-                log_message(f"⚠️ 已備份損壞檔案至 {backup_path}")
-            except Exception as backup_error:
-                log_message(f"❌ 備份失敗: {backup_error}")
-            return {"songs": []}
-
-def save_musicsheet(data):
-    """儲存 musicsheet，確保 `sanitized_title` 存在"""
-    for song in data["songs"]:
-        if "sanitized_title" not in song:
-            song["sanitized_title"] = sanitize_filename(song["title"])
-
-    os.makedirs(os.path.dirname(MUSIC_SHEET_PATH), exist_ok=True)
-    with open(MUSIC_SHEET_PATH, "w", encoding="utf-8") as file:
-        json.dump(data, file, ensure_ascii=False, indent=2)
+def get_musicsheet(path=None):
+    """取得歌單模型 (含 標題 / URL 對照表與目前播放中的歌曲)，`.data` 與 load_musicsheet 回傳的是同一份資料"""
+    return get_store().get(path or MUSIC_SHEET_PATH)
+
+def save_musicsheet(data, path=None):
+    """儲存 musicsheet，確保 `sanitized_title` 存在，並更新記憶體中的歌單"""
+    get_store().save(path or MUSIC_SHEET_PATH, data)
 
 def clean_string(text):
     """移除特殊字符與空白，只保留數字、字母、中文字"""
@@ -104,70 +84,30 @@ def sanitize_filename(title):
     return title[:80]  # 限制長度，避免超過 Windows 限制
 
 def find_downloaded_file(title):
-    """在 `song/` 目錄內尋找匹配的音檔（全面忽略特殊字符與空白）"""
-    cleaned_title = clean_string(title)
-    song_files = os.listdir(SONG_DIR)
+    """在 `song/` 目錄內尋找匹配的音檔（全面忽略特殊字符與空白），透過檔案索引查詢"""
+    song_file, similarity = get_song_index(SONG_DIR).find(title)
+    if song_file is None:
+        print("❌ 沒有找到匹配的音檔")
+    elif similarity == 100:
+        print(f"🔍 找到完全匹配音檔: {os.path.basename(song_file)}")
+    else:
+        print(f"🔍 找到高相似度匹配: {song_file} (相似度: {similarity})")
+    return song_file
 
-    best_match = None
-    best_similarity = 0
+def convert_to_pcm(audio_file, gain_db=None):
+    """
+    開啟音檔的串流 PCM 解碼 (48kHz / 16-bit / 立體聲)，返回一個可讀取的串流物件
+    由 ffmpeg 子行程邊解碼邊填入固定大小的環狀緩衝區，不會把整首歌解碼進記憶體
+    有預先分析的響度增益 (gain_db) 時直接套用；沒有時由 ffmpeg 即時正規化音量
+    """
+    from utils.pcm_stream import FFmpegPCMStream
 
-    for file in song_files:
-        cleaned_file = clean_string(file)
-        
-        # 完全匹配
-        if cleaned_title == cleaned_file and file.lower().endswith((".mp3", ".m4a")):
-            print(f"🔍 找到完全匹配音檔: {file}")
-            return os.path.join(SONG_DIR, file)
-
-        # 計算相似度
-        similarity = fuzz.partial_ratio(cleaned_title, cleaned_file)
-        if (similarity > best_similarity and file.lower().endswith((".mp3", ".m4a"))):
-            best_similarity = similarity
-            best_match = os.path.join(SONG_DIR, file)
-
-    if best_match and best_similarity > 80:  # 相似度高於 80 才算匹配
-        print(f"🔍 找到高相似度匹配: {best_match} (相似度: {best_similarity})")
-        return best_match
-    print("❌ 沒有找到匹配的音檔")
-    return None
-
-def convert_to_pcm(audio_file):
-    """將音檔轉換為PCM格式，並返回一個可讀取的IO物件"""
+    if not os.path.exists(audio_file):
+        log_message(f"❌ PCM轉換失敗: 檔案不存在 {audio_file}")
+        return None
     try:
-        log_message(f"🔄 開始將 `{audio_file}` 轉換為PCM格式")
-        
-        # 使用pydub讀取音檔
-        if (audio_file.lower().endswith('.mp3')):
-            audio = AudioSegment.from_mp3(audio_file)
-        elif (audio_file.lower().endswith('.m4a')):  # 修正拼寫錯誤 ends_with -> endswith
-            audio = AudioSegment.from_file(audio_file, format="m4a")
-        elif (audio_file.lower().endswith('.wav')):
-            audio = AudioSegment.from_wav(audio_file)
-        else:
-            audio = AudioSegment.from_file(audio_file)
-        
-        # 優化轉換參數 - 統一採用更穩定的設定
-        # - 固定採樣率為 48kHz (Discord 標準)
-        # - 使用 16-bit 深度處理
-        # - 設定標準立體聲
-        # - 增加前置處理步驟包含正規化音量
-        audio = audio.set_channels(2).set_frame_rate(48000).set_sample_width(2)
-        
-        # 正規化音量至適中水準 (-14dB)，避免爆音
-        normalized_audio = audio.normalize(headroom=-14.0)
-        
-        # 建立一個較大的記憶體IO物件存放PCM資料，增加緩衝區大小
-        pcm_io = io.BytesIO()
-        normalized_audio.export(pcm_io, format="s16le", parameters=[
-            "-ac", "2", "-ar", "48000", 
-            "-b:a", "192k",        # 增加位元率
-            "-bufsize", "4096k",   # 增加緩衝區
-            "-af", "dynaudnorm"    # 動態音量正規化
-        ])
-        pcm_io.seek(0)  # 讀寫指標歸零
-        
-        log_message(f"✅ `{audio_file}` PCM轉換成功，長度: {len(pcm_io.getbuffer())} 位元組")
-        return pcm_io
+        log_message(f"🔄 開始串流解碼 `{audio_file}`")
+        return FFmpegPCMStream(audio_file, gain_db)
     except Exception as e:
         log_message(f"❌ PCM轉換失敗: {e}")
         traceback_info = traceback.format_exc()
@@ -175,20 +115,22 @@ def convert_to_pcm(audio_file):
         return None
 
 class PCMStreamReader:
-    """用於讀取PCM串流的類別，提供Discord.py需要的read()方法，增強緩衝處理"""
+    """
+    用於讀取PCM串流的類別，提供Discord.py需要的read()方法
+    播放進度只記在記憶體計數器 (progress())，音訊執行緒上不寫日誌檔
+    """
     def __init__(self, pcm_io):
         self.pcm_io = pcm_io
         self.buffer_size = 3840  # Discord.py 標準值
         self.closed = False
         self.read_count = 0      # 追蹤讀取次數
+        self.bytes_read = 0
         
-        # 讀取文件大小用於診斷
+        # 記憶體內的資料才知道總長度；串流解碼為 0
         try:
             self.total_bytes = len(pcm_io.getbuffer())
-            log_message(f"📊 PCM數據大小: {self.total_bytes} 位元組")
-        except:
+        except Exception:
             self.total_bytes = 0
-            log_message(f"⚠ 無法獲取PCM數據大小")
     
     def read(self, frame_size=None):  # Discord.py 會提供 frame_size
         """讀取固定大小的PCM資料，兼容Discord.py調用方式"""
@@ -205,27 +147,32 @@ class PCMStreamReader:
         # 檢查是否已讀完
         if not chunk:
             self.closed = True
-            log_message(f"🔊 PCM音訊讀取完成: 共讀取 {self.read_count} 次")
             return b''
         
-        # 每隔50次讀取記錄一次進度
-        if self.read_count % 50 == 0:
-            if self.total_bytes > 0:
-                position = self.pcm_io.tell()
-                progress = min(100, int(position * 100 / self.total_bytes))
-                log_message(f"🔊 PCM播放進度: {progress}% (讀取 {self.read_count} 次)")
-            else:
-                log_message(f"🔊 PCM播放進行中: 已讀取 {self.read_count} 次")
-        
+        self.bytes_read += len(chunk)
         return chunk
     
+    def progress(self):
+        """目前的讀取進度 (percent 在總長度未知時為 None)"""
+        percent = min(100, int(self.bytes_read * 100 / self.total_bytes)) if self.total_bytes else None
+        return {"reads": self.read_count, "bytes": self.bytes_read, "percent": percent}
+    
     def cleanup(self):
-        """清理資源"""
+        """清理資源 (串流解碼會一併結束 ffmpeg 子行程)"""
         self.closed = True
+        if self.pcm_io is not None and hasattr(self.pcm_io, "close"):
+            self.pcm_io.close()
         self.pcm_io = None
 
-async def download_song(url, title, ctx):
-    """使用 yt-dlp 下載歌曲，確保 `musicsheet.json` 內 `sanitized_title` 正確"""
+async def download_song(url, title, ctx, priority=None):
+    """
+    使用 yt-dlp 下載歌曲，確保 `musicsheet.json` 內 `sanitized_title` 正確
+    下載交給下載管理員排隊 (預設為「正在播放」優先)，同一首歌同時被多次要求只會下載一次
+    優先下載原生 Opus 音訊，下載後直接複製成 48 kHz .opus (其他格式才轉檔)，播放時可直接傳送 Opus 封包
+    """
+    from utils.downloads import get_download_manager, PRIORITY_NOW_PLAYING
+    from utils.audio_library import source_path, finalize_download
+
     sanitized_title = sanitize_filename(title)
     log_message(f"🔽 開始下載 `{title}`")
     
@@ -235,15 +182,10 @@ async def download_song(url, title, ctx):
     # 引入 cookies 配置
     import utils.shared_state as shared_state
     
-    # yt-dlp 下載選項 - 優先下載 mp3/m4a 格式避免轉檔
+    # yt-dlp 下載選項 - 優先下載 Opus 音訊，原始檔下載完由 finalize_download 轉成 .opus
     ydl_opts = {
-        'format': 'bestaudio[ext=mp3]/bestaudio[ext=m4a]/bestaudio/best',  # 優先選擇 mp3/m4a 格式
-        'outtmpl': os.path.join(SONG_DIR, f'{sanitized_title}.%(ext)s'),
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
+        'format': 'bestaudio[acodec=opus]/bestaudio/best',
+        'outtmpl': source_path(SONG_DIR, sanitized_title),
         'quiet': True,
         'noplaylist': True,  # 避免下載整個播放清單
     }
@@ -253,30 +195,17 @@ async def download_song(url, title, ctx):
         log_message(f"🍪 使用 cookies 檔案進行下載: {shared_state.youtube_cookies_path}")
         ydl_opts['cookiefile'] = shared_state.youtube_cookies_path
     
-    def run_download(url, opts):
-        """在執行緒中執行下載"""
-        if url is None:
-            log_message(f"❌ 無法下載: URL為空")
-            return False
-            
-        try:
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                ydl.download([url])
-            return True
-        except Exception as e:
-            log_message(f"❌ 下載失敗: {e}")
-            return False
-
-    # 使用執行緒執行下載
-    download_thread = threading.Thread(target=run_download, args=(url, ydl_opts))
-    download_thread.daemon = True
-    download_thread.start()
-    
-    # 等待下載完成
-    while download_thread.is_alive():
-        await asyncio.sleep(1)
-    
-    # 檢查下載結果並更新 musicsheet.json
+    if url is None:
+        log_message(f"❌ 無法下載: URL為空")
+    else:
+        # 等待下載完成 (完成時 future 直接喚醒，不需要輪詢)
+        await get_download_manager().download(
+            url, title, ydl_opts, PRIORITY_NOW_PLAYING if priority is None else priority,
+            finalize_download(SONG_DIR, sanitized_title)
+        )
+    
+    # 檢查下載結果並更新 musicsheet.json (強制重新掃描，避免 mtime 精度不足漏掉剛寫入的檔案)
+    get_song_index(SONG_DIR).refresh(force=True)
     downloaded_file = find_downloaded_file(title)
     musicsheet_data = load_musicsheet()
     
@@ -286,6 +215,9 @@ async def download_song(url, title, ctx):
                 song["is_downloaded"] = True
                 song["sanitized_title"] = sanitized_title
                 log_message(f"✅ 下載完成: `{title}`")
+                # 新檔案在背景做一次響度分析
+                from utils.loudness import schedule_analysis
+                schedule_analysis(title, downloaded_file)
             else:
                 song["is_downloaded"] = False
                 log_message(f"❌ `{title}` 下載後找不到對應檔案")
@@ -312,11 +244,15 @@ def check_audio_file(file_path):
         with open(file_path, 'rb') as f:
             header = f.read(16)  # 讀取檔案頭
             
-        # 簡單檢查檔案頭是否符合 MP3 或 M4A 格式
+        # 簡單檢查檔案頭是否符合 MP3、M4A 或 Ogg Opus 格式
         if file_path.lower().endswith('.mp3') and not header.startswith(b'ID3') and not b'\xFF\xFB' in header:
             log_message(f"⚠️ 可能不是有效的 MP3 檔案: {file_path}")
             return False
             
+        if file_path.lower().endswith('.opus') and not header.startswith(b'OggS'):
+            log_message(f"⚠️ 可能不是有效的 Opus 檔案: {file_path}")
+            return False
+
         if file_path.lower().endswith('.m4a') and not b'ftyp' in header:
             log_message(f"⚠️ 可能不是有效的 M4A 檔案: {file_path}")
             return False
@@ -380,8 +316,9 @@ async def play_next(ctx):
             log_message(f"❌ 無法重新加入語音頻道: {e}")
             return
 
-    musicsheet_data = load_musicsheet()
-    song_list = musicsheet_data["songs"]
+    sheet = get_musicsheet()
+    musicsheet_data = sheet.data
+    song_list = sheet.songs
 
     if not song_list:
         log_message("⚠ 播放清單是空的，無法播放下一首")
@@ -391,8 +328,9 @@ async def play_next(ctx):
     # 設置操作狀態
     shared_state.current_operation = 'switching'
 
-    # 找出目前 is_playing=True 的歌曲索引
-    current_index = next((i for i, song in enumerate(song_list) if song.get("is_playing")), None)
+    # 目前播放中歌曲的位置
+    current_song = sheet.current
+    current_index = sheet.position(current_song["title"]) if current_song else None
 
     if current_index is None:
         log_message("⚠ 無法取得當前播放歌曲，直接播放第一首")
@@ -402,13 +340,9 @@ async def play_next(ctx):
         if current_mode == "單曲循環":
             next_index = current_index  # 單曲循環：重播同一首
         elif current_mode == "隨機播放":
-            import random
-            if len(song_list) > 1:
-                next_index = random.randint(0, len(song_list) - 1)
-                while next_index == current_index:
-                    next_index = random.randint(0, len(song_list) - 1)
-            else:
-                next_index = 0
+            # 優先取用預先抽好 (已在預先下載) 的歌
+            from utils.prefetch import take_shuffle_pick
+            next_index = take_shuffle_pick(sheet, get_session(), current_index)
         else:  # 循環播放清單
             next_index = (current_index + 1) % len(song_list)
 
@@ -423,7 +357,7 @@ async def play_next(ctx):
         
         # 從播放清單中移除這首歌
         log_message(f"🗑️ 從播放清單移除找不到檔案的歌曲: `{next_song['title']}`")
-        musicsheet_data["songs"] = [song for song in musicsheet_data["songs"] if song["title"] != next_song["title"]]
+        sheet.remove(next_song["title"])
         save_musicsheet(musicsheet_data)
         
         # 清除操作狀態
@@ -457,10 +391,8 @@ async def play_next(ctx):
     except Exception as e:
         log_message(f"❌ 呼叫play_cmd失敗: {e}")
         
-        # 重置歌曲狀態
-        for song in musicsheet_data["songs"]:
-            song["is_playing"] = False
-        save_musicsheet(musicsheet_data)
+        # 重置播放狀態
+        get_session().stop()
         
         # 清除操作狀態
         shared_state.current_operation = None
@@ -470,52 +402,23 @@ async def play_next(ctx):
         await play_next(ctx)
 
 def get_next_index(musicsheet_data):
-    """計算下一個可用的 `a.b` 座標"""
-    used_indexes = {song["index"] for song in musicsheet_data["songs"]}
-
-    a = 1
-    while True:
-        for b in range(1, 11):
-            new_index = f"{a}.{b}"
-            if new_index not in used_indexes:
-                return new_index
-        a += 1
+    """下一首歌 (加在清單尾端) 的 `a.b` 座標，由位置直接推得"""
+    return index_for(len(musicsheet_data["songs"]))
 
 def reorganize_musicsheet(musicsheet_data):
-    """重新整理 `musicsheet.json` 內的 `index`，確保索引連續"""
-    new_songs = []
-    current_a, current_b = 1, 1
-
-    try:
-        # 確保索引為 `a.b` 格式並排序
-        musicsheet_data["songs"].sort(key=lambda x: tuple(map(int, x["index"].split("."))))
-    except Exception as e:
-        debug_log(f"⚠️ DEBUG: 索引整理失敗 -> {e}")
-
-    for song in musicsheet_data["songs"]:
-        song["index"] = f"{current_a}.{current_b}"
-        new_songs.append(song)
-
-        current_b += 1
-        if current_b > 10:
-            current_a += 1
-            current_b = 1
-
-    musicsheet_data["songs"] = new_songs
+    """依清單位置重新產生 `index`，確保索引連續"""
+    renumber(musicsheet_data["songs"])
 
 def remove_song(title):
     """刪除 `musicsheet.json` 內的歌曲，並同步刪除 `song/` 內的檔案（如果已下載）"""
-    musicsheet_data = load_musicsheet()
-    song_to_remove = next((song for song in musicsheet_data["songs"] if song["title"] == title), None)
+    sheet = get_musicsheet()
+    song_to_remove = sheet.remove(title)  # 後面的歌曲會依新位置重新編號
 
     if not song_to_remove:
         log_message(f"❌ `{title}` 不在播放清單內")
         return False
 
-    # 刪除 `musicsheet.json` 內的歌曲
-    musicsheet_data["songs"] = [song for song in musicsheet_data["songs"] if song["title"] != title]
-    reorganize_musicsheet(musicsheet_data)  # 重新整理索引
-    save_musicsheet(musicsheet_data)
+    save_musicsheet(sheet.data)
 
     log_message(f"✅ `{title}` 已從播放清單移除")
 
@@ -525,6 +428,7 @@ def remove_song(title):
         if song_file:
             try:
                 os.remove(song_file)
+                get_song_index(SONG_DIR).discard(song_file)
                 log_message(f"🗑️ `{song_file}` 已刪除")
             except Exception as e:
                 log_message(f"⚠ 無法刪除 `{song_file}`，錯誤: {e}")
@@ -532,37 +436,32 @@ def remove_song(title):
     return True
 
 def update_previous_song(current_song):
-    """更新 `is_previous` 屬性，**僅 `隨機播放` 模式適用**"""
-    musicsheet_data = load_musicsheet()
-
+    """記錄上一首 (存在播放狀態，不改寫歌單)，**僅 `隨機播放` 模式適用**"""
     # 導入共享狀態模組獲取播放模式
     import utils.shared_state as shared_state
 
-    # 僅隨機播放模式才更新 `is_previous`
+    # 僅隨機播放模式才更新上一首
     if shared_state.playback_mode != "隨機播放":  # 使用共享狀態代替直接引用bot
         debug_log("⚠️ `update_previous_song` 只在 `隨機播放` 模式更新，其他模式無變更")
         return  
 
-    for song in musicsheet_data["songs"]:
-        song["is_previous"] = (song["title"] == current_song["title"])  # 只標記上一首
-
-    debug_log(f"🔄 `is_previous` 已更新，上一首: `{current_song['title']}`")
-    save_musicsheet(musicsheet_data)  # 儲存更新
+    get_session().mark_previous(current_song["title"])
+    debug_log(f"🔄 上一首已更新: `{current_song['title']}`")
 
 def delete_unlisted_songs():
-    """刪除 `song/` 內不在 `musicsheet.json` 的 .mp3 檔案"""
+    """刪除 `song/` 內不在 `musicsheet.json` 的音樂檔案"""
     musicsheet_data = load_musicsheet()
 
     # 取得 `musicsheet.json` 內的所有歌曲標題
     valid_titles = {sanitize_filename(song["title"]) for song in musicsheet_data["songs"]}
 
-    # 取得 `song/` 目錄內的所有 `.mp3` 檔案
-    song_files = glob.glob(os.path.join(SONG_DIR, "*.mp3"))
+    # 取得 `song/` 目錄內的所有音樂檔案
+    song_files = list(_list_song_files().values())
 
     deleted_count = 0
     for file_path in song_files:
         file_name = os.path.basename(file_path)
-        file_title, _ = os.path.splitext(file_name)  # 移除 `.mp3`
+        file_title, _ = os.path.splitext(file_name)  # 移除副檔名
 
         # 如果這個檔案不在 `musicsheet.json` 內，刪除
         if file_title not in valid_titles:
@@ -575,75 +474,80 @@ def delete_unlisted_songs():
 
     log_message(f"✅ 已刪除 {deleted_count} 個不在播放清單內的音樂檔案")
 
-def scan_and_update_musicsheet():
-    """掃描 `song/` 目錄，並更新 `musicsheet.json` 內 `is_downloaded`，新增未登記歌曲，並自動排除重複項"""
-    if not os.path.exists(MUSIC_SHEET_PATH):
-        os.makedirs(os.path.dirname(MUSIC_SHEET_PATH), exist_ok=True)
-        with open(MUSIC_SHEET_PATH, "w", encoding="utf-8") as file:
-            json.dump({"songs": []}, file)
-    
-    # 讀取現有的 musicsheet 數據
-    with open(MUSIC_SHEET_PATH, "r", encoding="utf-8") as file:
-        try:
-            musicsheet_data = json.load(file)
-        except json.JSONDecodeError:
-            musicsheet_data = {"songs": []}
+def _list_song_files():
+    """`song/` 內所有 `.mp3` & `.m4a` & `.opus`：{檔名(不含副檔名): 路徑} (同名時 .opus 優先)"""
+    downloaded_files = {}
+    for extension in ("*.mp3", "*.m4a", "*.opus"):
+        downloaded_files.update({os.path.splitext(os.path.basename(f))[0]: f
+                                 for f in glob.glob(os.path.join(SONG_DIR, extension))})
+    return downloaded_files
+
+def _plan_musicsheet_update(titles):
+    """列出檔案並與歌單標題對帳 (不碰歌單資料，可在背景執行緒執行)"""
+    from utils.song_index import reconcile
+
+    start = time.perf_counter()
+    downloaded_files = _list_song_files()
+    list_seconds = time.perf_counter() - start
+
+    plan = reconcile(titles, list(downloaded_files))
+    plan["timings"] = {"list": list_seconds, **plan["timings"]}
+    return plan
 
-    # 取得 `song/` 內所有 `.mp3` & `.m4a` 檔案名稱
-    downloaded_files = {os.path.splitext(os.path.basename(f))[0]: f for f in glob.glob(os.path.join(SONG_DIR, "*.mp3"))}
-    downloaded_files.update({os.path.splitext(os.path.basename(f))[0]: f for f in glob.glob(os.path.join(SONG_DIR, "*.m4a"))})
+def _apply_musicsheet_update(plan):
+    """依對帳結果更新 `is_downloaded`、移除無效歌曲並登記新檔案 (需在持有歌單的執行緒執行)"""
+    start = time.perf_counter()
+    sheet = get_musicsheet()
+    downloaded = plan["downloaded"]
 
-    # 標記已下載的歌曲
-    registered_titles = set()
     removed_count = 0
-    
-    # 檢查現有歌曲的下載狀態
-    for song in musicsheet_data["songs"]:
-        sanitized_title = sanitize_filename(song["title"])
-        song["is_downloaded"] = any(fuzz.partial_ratio(sanitized_title, key) > 85 for key in downloaded_files)
-        
-        # 添加已下載的歌曲到已登記清單
-        if song["is_downloaded"]:
-            registered_titles.add(sanitized_title)
-        
-        # 檢查並移除無效歌曲 (沒有檔案且無URL的歌曲)
+    kept = []
+    for song in sheet.songs:
+        # 對帳期間新加入的歌曲維持原狀
+        song["is_downloaded"] = downloaded.get(song["title"], song.get("is_downloaded", False))
+        # 沒有檔案且無URL的歌曲視為無效
         if not song["is_downloaded"] and not song.get("url"):
             log_message(f"🗑️ 移除無效歌曲: `{song['title']}` (無檔案且無URL)")
-            musicsheet_data["songs"].remove(song)
             removed_count += 1
-    
+            continue
+        kept.append(song)
+    sheet.data["songs"] = kept
+
     # 加入 `song/` 內但未登記的歌曲
-    new_songs = []
-    for file_name, file_path in downloaded_files.items():
-        sanitized_title = sanitize_filename(file_name)
-        
-        # 模糊比對，避免加入重複歌曲
-        if any(fuzz.partial_ratio(sanitized_title, title) > 85 for title in registered_titles):
+    added_count = 0
+    for file_name in plan["unmatched_files"]:
+        if sheet.find(file_name):
             continue
-        
-        new_song = {
+        sheet.add({
             "title": file_name,  # 保留原始檔名
-            "sanitized_title": sanitized_title,
+            "sanitized_title": sanitize_filename(file_name),
             "is_downloaded": True,
             "url": None,  # 無法回溯 URL
             "musicsheet": "default",
-            "index": get_next_index(musicsheet_data),
             "is_playing": False,
             "is_previous": False
-        }
-        new_songs.append(new_song)
-    
-    # 添加新歌曲到清單
-    musicsheet_data["songs"].extend(new_songs)
+        })
+        added_count += 1
 
-    # 重新整理索引
-    reorganize_musicsheet(musicsheet_data)
+    # 依位置重新整理索引並儲存
+    save_musicsheet(sheet.data)
 
-    # 儲存 `musicsheet.json`
-    with open(MUSIC_SHEET_PATH, "w", encoding="utf-8") as file:
-        json.dump(musicsheet_data, file, ensure_ascii=False, indent=2)
+    timings = {**plan["timings"], "apply": time.perf_counter() - start}
+    timing_text = "，".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in timings.items())
+    log_message(f"✅ `musicsheet.json` 已更新，新增 {added_count} 首歌曲，移除 {removed_count} 首無效歌曲")
+    log_message(f"⏱️ 歌單掃描耗時：{timing_text} (模糊比對 {plan['fuzzy_candidates']} 首)")
+    return {"added": added_count, "removed": removed_count, "timings": timings}
 
-    log_message(f"✅ `musicsheet.json` 已更新，新增 {len(new_songs)} 首歌曲，移除 {removed_count} 首無效歌曲")
+def scan_and_update_musicsheet():
+    """掃描 `song/` 目錄，並更新 `musicsheet.json` 內 `is_downloaded`，新增未登記歌曲，並自動排除重複項"""
+    titles = [song["title"] for song in get_musicsheet().songs]
+    return _apply_musicsheet_update(_plan_musicsheet_update(titles))
+
+async def scan_and_update_musicsheet_async():
+    """同 scan_and_update_musicsheet，但檔案列舉與比對在背景執行緒進行，不阻塞事件迴圈"""
+    titles = [song["title"] for song in get_musicsheet().songs]
+    plan = await asyncio.to_thread(_plan_musicsheet_update, titles)
+    return _apply_musicsheet_update(plan)
 
 
 # ==================== 多歌單系統 ====================
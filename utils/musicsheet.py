@@ -0,0 +1,345 @@
+"""
+歌單記憶體模型
+每個歌單檔案在程式內只保留一份解析後的資料，讀取時只比對檔案的 mtime / 大小，
+沒變就直接回傳記憶體中的資料；寫入也經過這裡，寫完立即更新快取，不需要重新解析。
+
+歌曲在清單中的位置就是它的索引：第 pos 首 (從 0 起算) 的 `a.b` 為
+(pos // 10 + 1).(pos % 10 + 1)，檔案中的 `index` 欄位只是寫出時依位置重新產生的顯示值。
+"""
+
+import os
+import json
+import asyncio
+import threading
+
+PAGE_SIZE = 10
+WRITE_DEBOUNCE_SECONDS = 0.5    # 這段時間內的多次 save 只寫一次檔
+
+
+def index_for(position: int) -> str:
+    """清單位置 -> `a.b` 索引"""
+    return f"{position // PAGE_SIZE + 1}.{position % PAGE_SIZE + 1}"
+
+
+def position_of(index) -> int | None:
+    """`a.b` 索引 -> 清單位置，格式錯誤回傳 None"""
+    try:
+        a, b = map(int, str(index).split("."))
+    except ValueError:
+        return None
+    if a < 1 or not 1 <= b <= PAGE_SIZE:
+        return None
+    return (a - 1) * PAGE_SIZE + (b - 1)
+
+
+def renumber(songs: list, start: int = 0):
+    """依位置重新產生 `start` 之後每首歌的 `index`"""
+    for position in range(start, len(songs)):
+        songs[position]["index"] = index_for(position)
+
+
+class Musicsheet:
+    """
+    單一歌單檔案的記憶體模型
+    維護 標題 / URL -> 歌曲、標題 -> 位置 的對照表，查詢不需逐首掃描。
+    對照表在歌曲清單被替換或長度改變時自動重建；目前播放中的歌曲由 PlaybackSession 記錄。
+    """
+
+    def __init__(self, path: str, data: dict, signature):
+        self.path = path
+        self.data = data
+        self.signature = signature     # (mtime_ns, size)，None 表示檔案不存在
+        self._indexed = None           # 建立對照表時的歌曲清單
+        self._count = 0
+
+    @property
+    def songs(self) -> list:
+        return self.data["songs"]
+
+    def reindex(self):
+        songs = self.data["songs"]
+        self._by_title = {}
+        self._by_url = {}
+        self._positions = {}
+        for position, song in enumerate(songs):
+            title = song.get("title")
+            if title not in self._by_title:
+                self._by_title[title] = song
+                self._positions[title] = position
+            if song.get("url"):
+                self._by_url.setdefault(song["url"], song)
+        self._indexed = songs
+        self._count = len(songs)
+
+    def _ensure(self):
+        songs = self.data["songs"]
+        if songs is not self._indexed or len(songs) != self._count:
+            self.reindex()
+
+    def find(self, title: str) -> dict | None:
+        self._ensure()
+        return self._by_title.get(title)
+
+    def find_url(self, url: str) -> dict | None:
+        self._ensure()
+        return self._by_url.get(url)
+
+    def position(self, title: str) -> int | None:
+        self._ensure()
+        return self._positions.get(title)
+
+    def at(self, index: str) -> dict | None:
+        """以 `a.b` 索引取歌曲"""
+        position = position_of(index)
+        if position is None or position >= len(self.songs):
+            return None
+        return self.songs[position]
+
+    def page(self, page: int) -> list:
+        start = (page - 1) * PAGE_SIZE
+        return self.songs[start:start + PAGE_SIZE]
+
+    @property
+    def current(self) -> dict | None:
+        """目前播放中的歌曲 (不在此歌單內則為 None)"""
+        from utils.playback_session import get_session
+
+        title = get_session().current
+        return self.find(title) if title is not None else None
+
+    def next_index(self) -> str:
+        return index_for(len(self.songs))
+
+    def add(self, song: dict) -> dict:
+        """加到清單尾端並依位置給定索引"""
+        self._ensure()
+        song["index"] = index_for(len(self.songs))
+        self.songs.append(song)
+        title = song.get("title")
+        if title not in self._by_title:
+            self._by_title[title] = song
+            self._positions[title] = len(self.songs) - 1
+        if song.get("url"):
+            self._by_url.setdefault(song["url"], song)
+        self._count = len(self.songs)
+        return song
+
+    def remove(self, title: str) -> dict | None:
+        """移除歌曲，後面的歌依新位置重新編號"""
+        position = self.position(title)
+        if position is None:
+            return None
+        song = self.songs.pop(position)
+        renumber(self.songs, position)
+        self.reindex()
+        return song
+
+
+class MusicsheetStore:
+    """
+    以路徑為 key 的歌單快取 (整個程式共用一份)
+    get() 回傳的是快取中的同一個物件：修改後必須呼叫 save() 寫回，
+    否則記憶體與檔案內容會不一致。
+    """
+
+    def __init__(self):
+        self._sheets = {}
+        self._pending = {}             # path -> 延遲寫入的 TimerHandle
+        self._dirty = set()            # 記憶體比檔案新 (等待或正在寫入) 的歌單
+        self._versions = {}            # path -> save 次數，避免較舊的內容晚寫入而覆蓋較新的
+        self._written = {}             # path -> 已寫入檔案的版本 (只在 _write_lock 內存取)
+        self._write_lock = threading.Lock()
+        self.hits = 0          # 直接使用記憶體中的資料
+        self.loads = 0         # 檔案變動 (或第一次讀取) 而重新解析
+        self.writes = 0
+        self.coalesced = 0     # 被合併掉的 save
+
+    @staticmethod
+    def _signature(path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str) -> Musicsheet:
+        signature = self._signature(path)
+        sheet = self._sheets.get(path)
+        if sheet is not None and (path in self._dirty or (signature is not None and sheet.signature == signature)):
+            self.hits += 1
+            return sheet
+
+        if signature is None:
+            # 檔案不存在時不快取，之後建立檔案就會被讀到
+            self._sheets.pop(path, None)
+            return Musicsheet(path, {"songs": []}, None)
+
+        self.loads += 1
+        sheet = Musicsheet(path, self._read(path), signature)
+        self._sheets[path] = sheet
+        return sheet
+
+    def _read(self, path: str) -> dict:
+        from utils.music import log_message, sanitize_filename
+
+        with open(path, "r", encoding="utf-8") as file:
+            try:
+                data = json.load(file)
+            except json.JSONDecodeError as e:
+                log_message(f"❌ 歌單檔案 {path} 損壞: {e}")
+                try:
+                    import shutil
+                    backup_path = path + ".corrupted"
+                    shutil.copy(path, backup_path)
+                    log_message(f"⚠️ 已備份損壞檔案至 {backup_path}")
+                except Exception as backup_error:
+                    log_message(f"❌ 備份失敗: {backup_error}")
+                return {"songs": []}
+
+        # 舊檔案的索引可能不連續或順序錯亂：索引都合法時依索引排序一次，之後一律以位置為準
+        songs = data["songs"]
+        positions = [position_of(song.get("index")) for song in songs]
+        if positions != list(range(len(songs))):
+            if None not in positions:
+                songs.sort(key=lambda song: position_of(song["index"]))
+            renumber(songs)
+
+        # 補齊欄位只在重新解析時做一次；舊版檔案的 `is_playing` 標記轉交給播放狀態
+        for song in songs:
+            if song.get("is_playing"):
+                from utils.playback_session import get_session
+                get_session().adopt(song["title"])
+            song["is_playing"] = False
+            song.setdefault("is_previous", False)
+            if "sanitized_title" not in song:
+                song["sanitized_title"] = sanitize_filename(song["title"])
+        return data
+
+    def save(self, path: str, data: dict):
+        """
+        更新記憶體中的歌單並安排寫檔
+        在事件迴圈中呼叫時延遲 WRITE_DEBOUNCE_SECONDS 後於執行緒寫入 (期間的多次 save 合併為一次)；
+        沒有事件迴圈 (啟動前 / 命令列工具) 時直接寫入
+        """
+        from utils.music import sanitize_filename
+
+        for song in data["songs"]:
+            if "sanitized_title" not in song:
+                song["sanitized_title"] = sanitize_filename(song["title"])
+        renumber(data["songs"])
+
+        # 同一份資料寫回時沿用原本的模型，只重建對照表
+        sheet = self._sheets.get(path)
+        if sheet is None or sheet.data is not data:
+            sheet = Musicsheet(path, data, sheet.signature if sheet else None)
+        sheet.reindex()
+        self._sheets[path] = sheet
+        self._versions[path] = self._versions.get(path, 0) + 1
+        self._dirty.add(path)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._flush_path(path)
+            return
+
+        handle = self._pending.pop(path, None)
+        if handle is not None:
+            handle.cancel()
+            self.coalesced += 1
+        self._pending[path] = loop.call_later(WRITE_DEBOUNCE_SECONDS, self._write_later, loop, path)
+
+    def _snapshot(self, path: str):
+        """在事件迴圈的執行緒序列化，寫檔執行緒不會碰到正在被修改的 dict"""
+        return self._versions[path], json.dumps(self._sheets[path].data, ensure_ascii=False, indent=2)
+
+    def _write_later(self, loop, path: str):
+        self._pending.pop(path, None)
+        if path not in self._sheets:
+            self._dirty.discard(path)
+            return
+        version, text = self._snapshot(path)
+        future = loop.run_in_executor(None, self._write_file, path, version, text)
+        # 完成回呼在事件迴圈執行：快取的狀態只在事件迴圈更新，執行緒只負責檔案 IO
+        future.add_done_callback(lambda f: self._write_done(path, version, f))
+
+    def _write_done(self, path: str, version: int, future):
+        if future.cancelled():
+            return
+        if future.exception():
+            from utils.music import log_message
+            log_message(f"❌ 歌單寫入失敗 {path}: {future.exception()}")
+            return
+        self._written_back(path, version, *future.result())
+
+    def _write_file(self, path: str, version: int, text: str):
+        """
+        只做檔案 IO (可在執行緒執行)：先寫暫存檔再 os.replace，寫到一半中斷也不會留下損壞的歌單
+        回傳 (是否寫入, 檔案簽章)；檔案已是這個版本或更新的版本時不寫
+        """
+        with self._write_lock:
+            if version > self._written.get(path, 0):
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as file:
+                    file.write(text)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, path)
+                self._written[path] = version
+                return True, self._signature(path)
+            return False, self._signature(path)
+
+    def _written_back(self, path: str, version: int, written: bool, signature):
+        """寫檔完成後更新快取狀態；期間又有新的 save 時歌單仍是 dirty，等下一次寫入"""
+        if written:
+            self.writes += 1
+        sheet = self._sheets.get(path)
+        if sheet is not None:
+            sheet.signature = signature
+        if self._versions.get(path) == version:
+            self._dirty.discard(path)
+
+    def _flush_path(self, path: str):
+        handle = self._pending.pop(path, None)
+        if handle is not None:
+            handle.cancel()
+        if path in self._sheets and path in self._dirty:
+            version, text = self._snapshot(path)
+            self._written_back(path, version, *self._write_file(path, version, text))
+
+    def flush(self):
+        """立即寫出所有尚未寫入的歌單 (關閉機器人時呼叫)"""
+        for path in list(self._dirty):
+            try:
+                self._flush_path(path)
+            except Exception as e:
+                from utils.music import log_message
+                log_message(f"❌ 歌單寫入失敗 {path}: {e}")
+
+    def invalidate(self, path: str = None):
+        """丟棄快取 (尚未寫入的內容會先寫出)"""
+        self.flush()
+        if path is None:
+            self._sheets.clear()
+        else:
+            self._sheets.pop(path, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.loads
+        return {
+            "sheets": len(self._sheets),
+            "hits": self.hits,
+            "loads": self.loads,
+            "writes": self.writes,
+            "coalesced": self.coalesced,
+            "pending": len(self._dirty),
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_store = MusicsheetStore()
+
+
+def get_store() -> MusicsheetStore:
+    return _store
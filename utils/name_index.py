@@ -0,0 +1,209 @@
+"""
+角色名稱索引 (前綴 trie + trigram 模糊搜尋)
+供 slash command 的 autocomplete 使用：全域角色名稱隨 save_character / delete_character
+增量更新，先攻表角色名稱則依頻道在名單變動時重建 (每桌最多幾十人)。
+"""
+
+import heapq
+
+GRAM = 3
+_PAD = "\x00"
+
+
+def _key(name: str) -> str:
+    return name.casefold().strip()
+
+
+def _trigrams(key: str):
+    padded = _PAD * (GRAM - 1) + key + _PAD
+    return {padded[i:i + GRAM] for i in range(len(padded) - GRAM + 1)}
+
+
+def _bigrams(key: str):
+    # 中文名稱很短，查詢常只有兩個字，需要字內 bigram 才找得到中段
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+def _query_grams(key: str):
+    """查詢 3 個字以上用 trigram，較短的用 bigram"""
+    return _trigrams(key) if len(key) >= GRAM else (_bigrams(key) or {key})
+
+
+class _Node:
+    __slots__ = ("children", "names")
+
+    def __init__(self):
+        self.children = {}
+        self.names = None      # 在此結束的原始名稱 (casefold 相同的名稱共用一個節點)
+
+
+class NameIndex:
+    """名稱索引：prefix() 走 trie，fuzzy() 以 trigram 重疊度排序"""
+
+    def __init__(self, names=()):
+        self._root = _Node()
+        self._grams = {}       # trigram -> {key}
+        self._keys = {}        # key -> {原始名稱}
+        self._gram_counts = {}  # key -> (trigram 數, bigram 數)，計算相似度用
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return sum(len(names) for names in self._keys.values())
+
+    def __contains__(self, name):
+        return name in self._keys.get(_key(name), ())
+
+    def add(self, name: str):
+        key = _key(name)
+        if not key:
+            return
+        originals = self._keys.get(key)
+        if originals is not None:
+            originals.add(name)
+            return
+
+        originals = self._keys[key] = {name}
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+        node.names = originals
+        trigrams, bigrams = _trigrams(key), _bigrams(key)
+        self._gram_counts[key] = (len(trigrams), len(bigrams))
+        for gram in trigrams | bigrams:
+            self._grams.setdefault(gram, set()).add(key)
+
+    def remove(self, name: str):
+        key = _key(name)
+        originals = self._keys.get(key)
+        if not originals or name not in originals:
+            return
+        originals.discard(name)
+        if originals:
+            return
+
+        del self._keys[key]
+        del self._gram_counts[key]
+        for gram in _trigrams(key) | _bigrams(key):
+            bucket = self._grams.get(gram)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._grams[gram]
+
+        # 刪除 trie 路徑上不再使用的節點
+        path = [self._root]
+        for char in key:
+            path.append(path[-1].children[char])
+        path[-1].names = None
+        for depth in range(len(key), 0, -1):
+            node = path[depth]
+            if node.names or node.children:
+                break
+            del path[depth - 1].children[key[depth - 1]]
+
+    def prefix(self, query: str, limit: int = 25):
+        """依字典序回傳以 query 開頭的名稱"""
+        node = self._root
+        for char in _key(query):
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        results = []
+        stack = [node]
+        while stack and len(results) < limit:
+            node = stack.pop()
+            if node.names:
+                results.extend(sorted(node.names))
+            # 反向壓入，讓字典序較小的先被取出
+            stack.extend(node.children[c] for c in sorted(node.children, reverse=True))
+        return results[:limit]
+
+    def fuzzy(self, query: str, limit: int = 25):
+        """n-gram 重疊度 (Dice 係數) 最高的名稱，另外給包含 query 的名稱加分"""
+        key = _key(query)
+        if not key:
+            return []
+        query_grams = _query_grams(key)
+        kind = 0 if len(key) >= GRAM else 1
+
+        # 由稀有的 gram 開始累計；很常見的 gram (例如開頭字母) 在已有候選時略過
+        buckets = sorted((self._grams.get(gram, ()) for gram in query_grams), key=len)
+        common = max(64, len(self._keys) // 20)
+        shared = {}
+        for bucket in buckets:
+            if shared and len(bucket) > common:
+                break
+            for candidate in bucket:
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        total = len(query_grams)
+        scored = []
+        for candidate, count in shared.items():
+            score = 2 * count / (total + self._gram_counts[candidate][kind])
+            if key in candidate:
+                score += 1
+            scored.append((score, candidate))
+
+        results = []
+        for _, candidate in heapq.nsmallest(limit, scored, key=lambda item: (-item[0], item[1])):
+            results.extend(sorted(self._keys[candidate]))
+        return results[:limit]
+
+    def search(self, query: str, limit: int = 25):
+        """前綴結果優先，不足時以模糊搜尋補齊；空字串回傳前 limit 個名稱"""
+        results = self.prefix(query, limit)
+        if len(results) < limit and _key(query):
+            seen = set(results)
+            for name in self.fuzzy(query, limit):
+                if name not in seen:
+                    results.append(name)
+                    seen.add(name)
+                    if len(results) >= limit:
+                        break
+        return results
+
+
+# ---------- 全域索引 ----------
+
+_character_index = None
+_entry_indexes = {}    # channel_id -> (名稱 tuple, NameIndex)
+
+
+async def get_character_index() -> NameIndex:
+    """全域角色名稱索引 (第一次使用時從資料庫載入)"""
+    global _character_index
+    if _character_index is None:
+        from utils.character_storage import get_all_names
+        index = NameIndex(await get_all_names())
+        if not len(index):
+            # 讀取失敗或角色庫為空時不保留，下次再試
+            return index
+        _character_index = index
+    return _character_index
+
+
+def character_added(name: str):
+    if _character_index is not None:
+        _character_index.add(name)
+
+
+def character_removed(name: str):
+    if _character_index is not None:
+        _character_index.remove(name)
+
+
+def reset_character_index():
+    global _character_index
+    _character_index = None
+
+
+def entry_index(channel_id, names) -> NameIndex:
+    """先攻表角色名稱索引，名單變動時重建"""
+    channel_id = str(channel_id)
+    names = tuple(names)
+    cached = _entry_indexes.get(channel_id)
+    if cached is None or cached[0] != names:
+        cached = _entry_indexes[channel_id] = (names, NameIndex(names))
+    return cached[1]
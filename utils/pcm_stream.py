@@ -0,0 +1,145 @@
+"""
+串流 PCM 解碼
+ffmpeg 子行程把音檔解碼成 48 kHz 立體聲 s16le，由背景執行緒每次讀取一個 20 ms 音框放進固定大小的環狀緩衝區；
+緩衝區滿了就暫停讀取 (ffmpeg 也會因管線塞滿而暫停)，每個串流佔用的記憶體固定，與歌曲長度無關。
+進度只記在記憶體計數器，播放執行緒不寫檔。
+"""
+
+import os
+import threading
+import subprocess
+
+FRAME_SIZE = 3840                                       # 20 ms：48000 Hz x 2 聲道 x 2 位元組 / 50
+RING_FRAMES = int(os.getenv("PCM_RING_FRAMES", "250"))  # 緩衝 5 秒
+
+
+class PCMRingBuffer:
+    """固定容量的位元組環狀緩衝區 (單一寫入者、單一讀取者)"""
+
+    def __init__(self, frames: int = RING_FRAMES, frame_size: int = FRAME_SIZE):
+        self.capacity = frames * frame_size
+        self._buffer = bytearray(self.capacity)
+        self._start = 0
+        self._size = 0
+        self._eof = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def level(self) -> int:
+        return self._size
+
+    @property
+    def eof(self) -> bool:
+        return self._eof
+
+    def write(self, data: bytes) -> bool:
+        """寫入資料，空間不足時等待讀取端；緩衝區已關閉回傳 False"""
+        view = memoryview(data)
+        while view:
+            with self._cond:
+                while self._size == self.capacity and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return False
+                end = (self._start + self._size) % self.capacity
+                count = min(len(view), self.capacity - self._size, self.capacity - end)
+                self._buffer[end:end + count] = view[:count]
+                self._size += count
+                self._cond.notify_all()
+            view = view[count:]
+        return True
+
+    def read(self, size: int) -> bytes:
+        """讀取 `size` 位元組；資料不足時等待，直到寫入端結束才回傳剩餘的部分"""
+        with self._cond:
+            while self._size < size and not self._eof and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return b""
+            count = min(size, self._size)
+            first = min(count, self.capacity - self._start)
+            data = bytes(self._buffer[self._start:self._start + first]) + bytes(self._buffer[:count - first])
+            self._start = (self._start + count) % self.capacity
+            self._size -= count
+            self._cond.notify_all()
+            return data
+
+    def finish(self):
+        """寫入端已結束 (讀完剩下的資料後回傳空位元組)"""
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class FFmpegPCMStream:
+    """
+    以 ffmpeg 串流解碼的 PCM 來源，提供與檔案相同的 read(size) 介面
+    gain_db 為預先分析好的增益；沒有時改用 ffmpeg 的 dynaudnorm 即時正規化 (不需要先讀完整首歌)。
+    """
+
+    def __init__(self, path: str, gain_db: float | None = None, frames: int = RING_FRAMES):
+        self.path = path
+        audio_filter = f"volume={gain_db:.2f}dB" if gain_db is not None else "dynaudnorm"
+        self.args = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path, "-vn",
+                     "-af", audio_filter, "-f", "s16le", "-ar", "48000", "-ac", "2", "pipe:1"]
+        self._ring = PCMRingBuffer(frames)
+        self.frames_decoded = 0
+        self.bytes_read = 0
+        self.underruns = 0          # 讀取時緩衝區不足一個音框 (解碼跟不上) 的次數
+        self._process = subprocess.Popen(self.args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._thread = threading.Thread(target=self._pump, name="pcm-decoder", daemon=True)
+        self._thread.start()
+
+    def _pump(self):
+        stdout = self._process.stdout
+        try:
+            while True:
+                frame = stdout.read(FRAME_SIZE)
+                if not frame:
+                    break
+                if len(frame) < FRAME_SIZE:     # 最後不足一個音框的部分補靜音
+                    frame += b"\x00" * (FRAME_SIZE - len(frame))
+                self.frames_decoded += 1
+                if not self._ring.write(frame):
+                    break
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._ring.finish()
+
+    def read(self, size: int = FRAME_SIZE) -> bytes:
+        if self._ring.level < size and not self._ring.eof:
+            self.underruns += 1
+        data = self._ring.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def tell(self) -> int:
+        return self.bytes_read
+
+    def stats(self) -> dict:
+        return {
+            "frames_decoded": self.frames_decoded,
+            "bytes_read": self.bytes_read,
+            "buffered": self._ring.level,
+            "capacity": self._ring.capacity,
+            "underruns": self.underruns,
+        }
+
+    def close(self):
+        self._ring.close()
+        if self._process.poll() is None:
+            self._process.kill()
+        try:
+            self._process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        if self._process.stdout:
+            self._process.stdout.close()
+        self._thread.join(timeout=5)
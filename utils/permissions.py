@@ -12,3 +12,11 @@ def check_authorization(ctx):
         asyncio.create_task(ctx.send("🚫 你沒有權限使用這個指令！", ephemeral=True))
         return False
     return True
+
+async def check_interaction_authorization(interaction):
+    """檢查 slash command 使用者是否有權限 (沒有權限時以 ephemeral 訊息回覆)"""
+    if interaction.user.id not in AUTHORIZED_USERS:
+        log_message(f"🚫 `{interaction.user}` 嘗試使用 `/{interaction.command.qualified_name if interaction.command else '?'}` 指令，但沒有權限")
+        await interaction.response.send_message("🚫 你沒有權限使用這個指令！", ephemeral=True)
+        return False
+    return True
@@ -0,0 +1,356 @@
+"""
+無縫播放引擎
+目前這首播放時就先開好下一首的音源並預先緩衝開頭的音框；播放結束的 after 回呼裡直接改播已準備好的音源，
+不經過 play 指令、不需要任何 sleep。設定 CROSSFADE_MS 時，兩首都是 PCM 音源會在同一個音源內交叉淡入淡出
+(期間 shared_state.is_fading_out 為 True)。每次切換都記錄上一首最後一個音框到下一首第一個音框的間隔 (毫秒)。
+下一首的歌名在事件迴圈上算好 (準備時、切換後、模式或歌單改變時)，播放執行緒只比對這個值；
+準備好的歌若已不是 play_next 會選的歌，就照舊交給 play_next。
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+
+import numpy as np
+import discord
+
+import utils.shared_state as shared_state
+
+CROSSFADE_MS = int(os.getenv("CROSSFADE_MS", "0"))
+PREBUFFER_FRAMES = int(os.getenv("PREBUFFER_FRAMES", "25"))    # 預先解碼 0.5 秒
+FRAME_MS = 20
+GAP_HISTORY = 20
+
+
+class TrackSource(discord.AudioSource):
+    """單一歌曲的音源：先讀好開頭的音框，並記錄第一個 / 最後一個音框送出的時間"""
+
+    def __init__(self, title: str, source: discord.AudioSource, on_first_frame=None):
+        self.title = title
+        self.source = source
+        self._buffered = deque()
+        self.first_frame_at = None
+        self.ended_at = None
+        self.gap_from = None            # 上一首結束的時間，第一個音框送出時換算成間隔
+        self._on_first_frame = on_first_frame
+
+    def prebuffer(self, frames: int = PREBUFFER_FRAMES):
+        """在背景執行緒呼叫：ffmpeg 開始解碼並先讀好 `frames` 個音框"""
+        for _ in range(frames):
+            data = self.source.read()
+            if not data:
+                break
+            self._buffered.append(data)
+
+    def read(self) -> bytes:
+        data = self._buffered.popleft() if self._buffered else self.source.read()
+        now = time.perf_counter()
+        if data and self.first_frame_at is None:
+            self.first_frame_at = now
+            if self.gap_from is not None and self._on_first_frame:
+                self._on_first_frame((now - self.gap_from) * 1000)
+        elif not data and self.ended_at is None:
+            self.ended_at = now
+        return data
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+
+def _cleanup_result(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().cleanup()
+
+
+def _fit(frame: bytes, size: int) -> bytes:
+    return frame[:size] if len(frame) >= size else frame + b"\x00" * (size - len(frame))
+
+
+def _blend(frame: bytes, head: bytes, weight: float) -> bytes:
+    """兩個 int16 PCM 音框以 (1 - weight) : weight 線性混音 (float32 計算後截斷回 int16)"""
+    size = len(frame) & ~1
+    mixed = np.frombuffer(frame, dtype=np.int16, count=size // 2) * np.float32(1 - weight)
+    mixed += np.frombuffer(_fit(head, size), dtype=np.int16) * np.float32(weight)
+    np.clip(mixed, -32768.0, 32767.0, out=mixed)
+    return mixed.astype(np.int16).tobytes()
+
+
+class CrossfadeSource(discord.AudioSource):
+    """
+    PCM 交叉淡入淡出：一直比目前這首多讀 `frames` 個音框，這首讀完時手上剛好是最後 N 毫秒，
+    向引擎要下一首並與其開頭的 N 毫秒線性混音，之後直接接著讀下一首。
+    """
+
+    def __init__(self, engine, track: TrackSource, frames: int):
+        self._engine = engine
+        self._track = track
+        self._frames = frames
+        self._ahead = deque()
+        self._ended = False
+        self._handed_over = False
+        self._fading = 0
+
+    @property
+    def track(self) -> TrackSource:
+        return self._track
+
+    def _fill(self):
+        while not self._ended and len(self._ahead) <= self._frames:
+            data = self._track.read()
+            if not data:
+                self._ended = True
+                break
+            self._ahead.append(data)
+
+    def _crossfade(self):
+        self._handed_over = True
+        incoming = self._engine._handover(self._track)
+        if incoming is None:
+            return      # 沒有可混音的下一首：播完剩下的音框，交給 after 回呼
+        tail = list(self._ahead)
+        self._ahead.clear()
+        shared_state.is_fading_out = True
+        for i, frame in enumerate(tail):
+            weight = (i + 1) / (len(tail) + 1)
+            self._ahead.append(_blend(frame, incoming.read(), weight))
+        self._fading = len(tail)
+        previous, self._track = self._track, incoming
+        self._ended = False
+        self._handed_over = False
+        previous.cleanup()
+
+    def read(self) -> bytes:
+        self._fill()
+        if self._ended and not self._handed_over:
+            self._crossfade()
+        if self._fading:
+            self._fading -= 1
+            if not self._fading:
+                shared_state.is_fading_out = False
+        return self._ahead.popleft() if self._ahead else b""
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        shared_state.is_fading_out = False
+        self._track.cleanup()
+
+
+class PlaybackEngine:
+    """管理目前播放的音源、已準備好的下一首，以及切換間隔統計"""
+
+    def __init__(self, crossfade_ms: int = CROSSFADE_MS):
+        self.crossfade_ms = crossfade_ms
+        self.ctx = None
+        self.voice_client = None
+        self.loop = None
+        self.current = None             # 目前播放的 TrackSource
+        self.armed = None               # 已準備好的下一首 TrackSource
+        self.next_title = None          # 事件迴圈上算好的下一首 (play_next 會選的歌)
+        self._arm_task = None
+        self._operation_id = None
+        self._lock = threading.Lock()
+        self.gaps_ms = deque(maxlen=GAP_HISTORY)
+        self.transitions = 0
+        self.fallbacks = 0
+
+    # ---------- 開始 / 停止 ----------
+
+    def start(self, ctx, title: str, source: discord.AudioSource, operation_id: str):
+        """由 play 指令呼叫：開始播放 `title`，並在背景準備下一首"""
+        self.ctx = ctx
+        self.voice_client = ctx.voice_client
+        self.loop = asyncio.get_running_loop()
+        self._operation_id = operation_id
+        self.discard_armed()
+        self.current = self._track(title, source)
+        self.voice_client.play(self._wrap(self.current), after=self._after)
+        self.schedule_arm()
+
+    def stop(self):
+        if self._arm_task is not None and not self._arm_task.done():
+            self._arm_task.cancel()
+        self.discard_armed()
+        self.current = None
+        self.next_title = None
+
+    def discard_armed(self):
+        with self._lock:
+            track, self.armed = self.armed, None
+        if track is not None:
+            track.cleanup()
+
+    def _track(self, title: str, source: discord.AudioSource) -> TrackSource:
+        return TrackSource(title, source, on_first_frame=self.gaps_ms.append)
+
+    def _wrap(self, track: TrackSource) -> discord.AudioSource:
+        from utils.mixer import get_scene
+
+        if track.is_opus():
+            return track
+        source = track
+        if self.crossfade_ms > 0:
+            source = CrossfadeSource(self, track, max(1, self.crossfade_ms // FRAME_MS))
+        scene = get_scene()
+        # 有場景環境音時，音樂作為混音器的主圖層播放
+        return scene.wrap(source) if scene.active else source
+
+    # ---------- 準備下一首 ----------
+
+    def schedule_arm(self):
+        if self.loop is None or self.current is None:
+            return None
+        if self._arm_task is not None and not self._arm_task.done():
+            self._arm_task.cancel()
+        self._arm_task = self.loop.create_task(self._arm())
+        return self._arm_task
+
+    async def _arm(self):
+        from utils.music import get_musicsheet, find_downloaded_file, log_message
+        from utils.playback_session import get_session
+        from utils.prefetch import get_prefetcher, peek_next
+        from utils.audio_library import create_audio_source, FFMPEG_OPTIONS
+        from utils.loudness import cached_gain
+        from utils.mixer import get_scene
+
+        # 先等預先下載 (以及隨機播放抽歌) 完成
+        self.next_title = None
+        await get_prefetcher().wait()
+        song = peek_next(get_musicsheet(), get_session(), shared_state.playback_mode)
+        self.next_title = song["title"] if song else None
+        if song is None:
+            self.discard_armed()
+            return
+        if self.armed is not None and self.armed.title == song["title"]:
+            return
+        song_file = find_downloaded_file(song["title"])
+        if not song_file:
+            return
+
+        # 被取消時執行緒仍會做完：等它結束再清理，避免留下沒人關閉的 ffmpeg
+        creating = asyncio.ensure_future(asyncio.to_thread(
+            create_audio_source, song_file, FFMPEG_OPTIONS, cached_gain(song, song_file), get_scene().active))
+        try:
+            source = await asyncio.shield(creating)
+        except asyncio.CancelledError:
+            creating.add_done_callback(_cleanup_result)
+            raise
+        track = self._track(song["title"], source)
+        prebuffering = asyncio.ensure_future(asyncio.to_thread(track.prebuffer))
+        try:
+            await asyncio.shield(prebuffering)
+        except asyncio.CancelledError:
+            prebuffering.add_done_callback(lambda _: track.cleanup())
+            raise
+        self.discard_armed()
+        with self._lock:
+            self.armed = track
+        log_message(f"⏭️ 已準備下一首 `{song['title']}`")
+
+    def _take_armed(self, pcm_only: bool = False):
+        """播放執行緒呼叫：只比對事件迴圈上算好的下一首，不在這裡讀取歌單或播放狀態"""
+        with self._lock:
+            track = self.armed
+            if track is None or (pcm_only and track.is_opus()):
+                return None
+            if track.title != self.next_title:
+                return None
+            self.armed = None
+            return track
+
+    # ---------- 切換 (播放執行緒) ----------
+
+    def _still_current(self) -> bool:
+        return (shared_state.current_operation_id == self._operation_id
+                and shared_state.stop_reason != "manual")
+
+    def _handover(self, previous: TrackSource):
+        """CrossfadeSource 呼叫：取得可混音的下一首"""
+        if not self._still_current():
+            return None
+        track = self._take_armed(pcm_only=True)
+        if track is None:
+            return None
+        self.gaps_ms.append(0.0)        # 交叉淡入淡出沒有空白
+        self.loop.call_soon_threadsafe(self._advanced, track)
+        return track
+
+    def _after(self, error):
+        from utils.music import log_message, play_next
+
+        if shared_state.current_operation_id != self._operation_id:
+            return
+        if error:
+            log_message(f"❌ 播放回調發生錯誤: {error}")
+            return
+        if shared_state.stop_reason == "manual":
+            return
+
+        previous = self.current
+        track = self._take_armed()
+        if track is not None:
+            track.gap_from = previous.ended_at if previous else None
+            try:
+                self.voice_client.play(self._wrap(track), after=self._after)
+            except Exception as e:
+                log_message(f"⚠️ 無縫切換失敗，改用一般流程: {e}")
+                track.cleanup()
+                track = None
+        if track is not None:
+            self.loop.call_soon_threadsafe(self._advanced, track)
+            return
+
+        self.fallbacks += 1
+        shared_state.stop_reason = "finished"
+        shared_state.current_operation = None
+        shared_state.current_song_title = None
+        asyncio.run_coroutine_threadsafe(play_next(self.ctx), self.loop)
+
+    def _advanced(self, track: TrackSource):
+        """事件迴圈上更新播放狀態，並準備再下一首"""
+        from utils.music import log_message
+        from utils.playback_session import get_session
+        from utils.prefetch import schedule_prefetch, MODE_SHUFFLE
+
+        session = get_session()
+        if shared_state.playback_mode == MODE_SHUFFLE and session.upcoming[:1] == [track.title]:
+            session.set_upcoming(session.upcoming[1:])
+        session.start(track.title)
+        self.current = track
+        self.next_title = None
+        self.transitions += 1
+        shared_state.current_operation = 'playing'
+        shared_state.current_song_title = track.title
+
+        gap = f"，間隔 {self.gaps_ms[-1]:.0f} ms" if self.gaps_ms else ""
+        log_message(f"🎵 無縫切換到 `{track.title}`{gap}")
+        if self.ctx is not None:
+            self.loop.create_task(self.ctx.send(f"🎵 正在播放 `{track.title}`"))
+        schedule_prefetch()
+        self.schedule_arm()
+
+    def stats(self) -> dict:
+        gaps = list(self.gaps_ms)
+        return {
+            "transitions": self.transitions,
+            "fallbacks": self.fallbacks,
+            "last_gap_ms": gaps[-1] if gaps else None,
+            "avg_gap_ms": sum(gaps) / len(gaps) if gaps else None,
+            "armed": self.armed.title if self.armed else None,
+        }
+
+
+_engine = None
+
+
+def get_engine() -> PlaybackEngine:
+    global _engine
+    if _engine is None:
+        _engine = PlaybackEngine()
+    return _engine
@@ -0,0 +1,135 @@
+"""
+播放狀態 (記憶體)
+目前播放、上一首與播放紀錄只存在這裡，切歌不需要改寫歌單檔案。
+狀態會延遲寫入一個很小的獨立檔案 (playback_state.json)，重新啟動後仍能知道上次播到哪裡。
+"""
+
+import os
+import json
+import asyncio
+from collections import deque
+
+STATE_PATH = os.path.join("musicsheet", "playback_state.json")
+HISTORY_SIZE = 50
+PERSIST_DELAY_SECONDS = 2.0
+
+
+class PlaybackSession:
+    """目前播放 / 上一首 / 播放紀錄 / 預先抽好的下一首 (都以歌曲標題記錄)"""
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self.current = None
+        self.previous = None
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.upcoming = []             # 隨機播放預先抽好的下一首 (utils.prefetch)
+        self._pending = None
+        self._dirty = False
+        self.writes = 0
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            from utils.music import log_message
+            log_message(f"⚠️ 播放狀態檔讀取失敗，從空白狀態開始: {e}")
+            return
+        self.current = state.get("current")
+        self.previous = state.get("previous")
+        self.history.extend(state.get("history", []))
+        self.upcoming = list(state.get("upcoming", []))
+
+    def to_dict(self) -> dict:
+        return {"current": self.current, "previous": self.previous, "history": list(self.history),
+                "upcoming": list(self.upcoming)}
+
+    # ---------- 狀態變更 ----------
+
+    def start(self, title: str):
+        """開始播放 `title`，原本播放中的歌曲成為上一首"""
+        if self.current is not None and self.current != title:
+            self.previous = self.current
+            self.history.append(self.current)
+        self.current = title
+        self._changed()
+
+    def stop(self):
+        if self.current is not None:
+            self.current = None
+            self._changed()
+
+    def mark_previous(self, title: str):
+        if self.previous != title:
+            self.previous = title
+            self._changed()
+
+    def set_upcoming(self, titles: list):
+        self.upcoming = list(titles)
+        self._changed()
+
+    def adopt(self, title: str):
+        """沿用舊版歌單檔案內 `is_playing` 標記的歌曲 (只在尚無播放狀態時)"""
+        if self.current is None:
+            self.current = title
+            self._changed()
+
+    # ---------- 寫檔 ----------
+
+    def _changed(self):
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._pending is None:
+            self._pending = loop.call_later(PERSIST_DELAY_SECONDS, self._persist_later, loop)
+
+    def _persist_later(self, loop):
+        self._pending = None
+        if not self._dirty:
+            return
+        self._dirty = False
+        text = json.dumps(self.to_dict(), ensure_ascii=False)
+        future = loop.run_in_executor(None, self._write, text)
+        future.add_done_callback(self._report_write_error)
+
+    def _report_write_error(self, future):
+        if not future.cancelled() and future.exception():
+            from utils.music import log_message
+            log_message(f"❌ 播放狀態寫入失敗: {future.exception()}")
+
+    def _write(self, text: str):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+        self.writes += 1
+
+    def flush(self):
+        """立即寫出尚未寫入的狀態 (關閉機器人時呼叫)"""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if self._dirty:
+            self._dirty = False
+            try:
+                self._write(json.dumps(self.to_dict(), ensure_ascii=False))
+            except OSError as e:
+                from utils.music import log_message
+                log_message(f"❌ 播放狀態寫入失敗: {e}")
+
+
+_session = None
+
+
+def get_session() -> PlaybackSession:
+    global _session
+    if _session is None:
+        _session = PlaybackSession()
+        _session.load()
+    return _session
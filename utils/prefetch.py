@@ -0,0 +1,163 @@
+"""
+預先下載接下來要播的歌
+依目前的播放模式推算接下來 PREFETCH_AHEAD 首，在背景確認檔案存在且通過 check_audio_file，
+缺少的以「預先下載」優先順序交給下載管理員，切歌時就不必等下載。
+隨機播放的下一首會預先抽好 (記在 PlaybackSession.upcoming)，play_next 直接取用，因此一定已在下載中或已下載。
+"""
+
+import os
+import random
+import asyncio
+
+PREFETCH_AHEAD = int(os.getenv("PREFETCH_AHEAD", "2"))
+
+MODE_LOOP = "循環播放清單"
+MODE_SINGLE = "單曲循環"
+MODE_SHUFFLE = "隨機播放"
+MODE_STANDBY = "播完後待機"
+
+
+def commit_shuffle(sheet, session, ahead: int = PREFETCH_AHEAD) -> list:
+    """補齊隨機播放預先抽好的歌 (排除目前播放中的歌與已不在歌單內的歌)，回傳標題清單"""
+    titles = [song["title"] for song in sheet.songs]
+    if len(titles) < 2:
+        if session.upcoming:
+            session.set_upcoming([])
+        return []
+
+    upcoming = [title for title in session.upcoming if title != session.current and sheet.find(title)]
+    pool = [title for title in titles if title != session.current and title not in upcoming]
+    while len(upcoming) < ahead and pool:
+        upcoming.append(pool.pop(random.randrange(len(pool))))
+    if upcoming != session.upcoming:
+        session.set_upcoming(upcoming)
+    return upcoming
+
+
+def take_shuffle_pick(sheet, session, current_index) -> int:
+    """隨機播放選下一首：優先取預先抽好的歌，沒有時才當場抽 (不重複目前這首)"""
+    commit_shuffle(sheet, session)
+    if session.upcoming:
+        title = session.upcoming[0]
+        session.set_upcoming(session.upcoming[1:])
+        position = sheet.position(title)
+        if position is not None:
+            return position
+
+    count = len(sheet.songs)
+    if count <= 1:
+        return 0
+    next_index = random.randrange(count)
+    while next_index == current_index:
+        next_index = random.randrange(count)
+    return next_index
+
+
+def upcoming_songs(sheet, session, mode: str, ahead: int = PREFETCH_AHEAD) -> list:
+    """依播放模式推算接下來會播的歌"""
+    songs = sheet.songs
+    if not songs or mode == MODE_STANDBY:
+        return []
+
+    current = session.current
+    position = sheet.position(current) if current is not None else None
+    if mode == MODE_SINGLE:
+        return [songs[position]] if position is not None else []
+    if mode == MODE_SHUFFLE:
+        return [sheet.find(title) for title in commit_shuffle(sheet, session, ahead)]
+
+    start = 0 if position is None else position + 1
+    count = min(ahead, len(songs) - (0 if position is None else 1))
+    return [songs[(start + i) % len(songs)] for i in range(count)]
+
+
+def peek_next(sheet, session, mode: str):
+    """play_next 會選到的下一首 (不改變任何狀態；隨機播放只看已抽好的歌)"""
+    songs = sheet.songs
+    if not songs or mode == MODE_STANDBY:
+        return None
+    position = sheet.position(session.current) if session.current is not None else None
+    if mode == MODE_SHUFFLE:
+        return sheet.find(session.upcoming[0]) if session.upcoming else None
+    if position is None:
+        return songs[0]
+    if mode == MODE_SINGLE:
+        return songs[position]
+    return songs[(position + 1) % len(songs)]
+
+
+async def _ensure_ready(song) -> bool:
+    """確認歌曲檔案存在且可播放；否則以「預先下載」優先順序下載"""
+    from utils.music import (find_downloaded_file, check_audio_file, download_song,
+                             get_song_index, log_message, SONG_DIR)
+    from utils.downloads import PRIORITY_PREFETCH
+
+    title = song["title"]
+    song_file = find_downloaded_file(title)
+    if song_file and await asyncio.to_thread(check_audio_file, song_file):
+        return True
+    if not song.get("url"):
+        return False
+
+    if song_file:
+        log_message(f"⚠️ 預先下載：`{title}` 檔案無效，重新下載")
+        try:
+            os.remove(song_file)
+            get_song_index(SONG_DIR).discard(song_file)
+        except OSError as e:
+            log_message(f"⚠ 無法刪除 `{song_file}`，錯誤: {e}")
+            return False
+
+    song_file = await download_song(song["url"], title, None, PRIORITY_PREFETCH)
+    return bool(song_file) and await asyncio.to_thread(check_audio_file, song_file)
+
+
+class Prefetcher:
+    """每次切歌或切換模式時重新排程；新的排程會取消尚未完成的舊排程 (已送出的下載照常進行)"""
+
+    def __init__(self):
+        self._task = None
+        self.prefetched = 0
+
+    async def wait(self):
+        """等到目前的預先下載排程結束 (排程被新的取代時改等新的)"""
+        while self._task is not None and not self._task.done():
+            await asyncio.wait({self._task})
+
+    def schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = loop.create_task(self.run())
+        return self._task
+
+    async def run(self):
+        from utils.music import get_musicsheet, log_message
+        from utils.playback_session import get_session
+        import utils.shared_state as shared_state
+
+        try:
+            songs = upcoming_songs(get_musicsheet(), get_session(), shared_state.playback_mode)
+            for song in songs:
+                if await _ensure_ready(song):
+                    self.prefetched += 1
+                else:
+                    log_message(f"⚠️ 預先下載失敗或無法取得: `{song['title']}`")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log_message(f"❌ 預先下載發生錯誤: {e}")
+
+
+_prefetcher = Prefetcher()
+
+
+def get_prefetcher() -> Prefetcher:
+    return _prefetcher
+
+
+def schedule_prefetch():
+    return _prefetcher.schedule()
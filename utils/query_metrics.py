@@ -0,0 +1,144 @@
+"""
+資料庫查詢延遲統計
+每個 Database 呼叫都以邏輯名稱 (具名 statement 或「動詞 資料表」) 記錄耗時，
+保留最近 RESERVOIR_SIZE 筆樣本計算 p50 / p95 / p99，超過門檻的查詢寫入慢查詢日誌。
+"""
+
+import os
+import re
+import json
+import time
+import functools
+from collections import deque
+
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+RESERVOIR_SIZE = 1024      # 每個查詢名稱保留的最近樣本數
+METRICS_DUMP_PATH = os.path.join("logs", "db_metrics.json")
+
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+NOT\s+EXISTS\s+)?([A-Za-z_][\w.]*)", re.I)
+
+
+@functools.lru_cache(maxsize=512)
+def query_label(query: str) -> str:
+    """未註冊名稱的查詢以「動詞_資料表」作為名稱，例如 delete_characters"""
+    words = query.split(None, 1)
+    if not words:
+        return "empty"
+    verb = words[0].lower()
+    match = _TABLE_RE.search(query)
+    return f"{verb}_{match.group(1).lower()}" if match else verb
+
+
+def _param_size(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (dict, list)):
+        from utils.db import encode_json
+        return len(encode_json(value))
+    return len(str(value))
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class QueryStats:
+    """單一查詢名稱的統計 (總次數、錯誤數、最近樣本)"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=RESERVOIR_SIZE)
+
+    def add(self, elapsed_ms: float, failed: bool = False):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.samples.append(elapsed_ms)
+        if failed:
+            self.errors += 1
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": _percentile(ordered, 50),
+            "p95_ms": _percentile(ordered, 95),
+            "p99_ms": _percentile(ordered, 99),
+            "max_ms": self.max_ms,
+        }
+
+
+_stats = {}
+_slow_queries = deque(maxlen=50)
+
+
+def record(name: str, elapsed: float, query: str, args, failed: bool = False):
+    """記錄一次查詢 (elapsed 單位為秒)"""
+    elapsed_ms = elapsed * 1000
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = QueryStats()
+    stats.add(elapsed_ms, failed)
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        sizes = [_param_size(arg) for arg in args]
+        statement = " ".join(query.split())
+        _slow_queries.append({
+            "name": name,
+            "ms": round(elapsed_ms, 2),
+            "statement": statement,
+            "param_bytes": sizes,
+            "at": time.time(),
+        })
+        from utils.music import log_message
+        log_message(f"🐢 慢查詢 `{name}` {elapsed_ms:.1f} ms (參數大小 {sizes} bytes): {statement}")
+
+
+def snapshot() -> dict:
+    """機器可讀的統計快照 (benchmark 可直接斷言)"""
+    from utils.db import Database
+    return {
+        "slow_query_ms": SLOW_QUERY_MS,
+        "queries": {name: stats.summary() for name, stats in sorted(_stats.items())},
+        "slow_queries": list(_slow_queries),
+        "pool": Database.pool_stats(),
+    }
+
+
+def dump(path: str = None) -> str:
+    """將快照寫成 JSON 檔，回傳路徑"""
+    path = path or METRICS_DUMP_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, ensure_ascii=False, indent=2)
+    return path
+
+
+def reset():
+    _stats.clear()
+    _slow_queries.clear()
+
+
+def format_metrics(limit: int = 15) -> str:
+    """Discord 訊息用的統計表 (依總耗時排序)"""
+    if not _stats:
+        return "📊 尚無資料庫查詢紀錄"
+    rows = sorted(_stats.items(), key=lambda item: item[1].total_ms, reverse=True)[:limit]
+    lines = [f"{'query':<24}{'n':>7}{'p50':>8}{'p95':>8}{'p99':>8}"]
+    for name, stats in rows:
+        s = stats.summary()
+        lines.append(f"{name[:23]:<24}{s['count']:>7}{s['p50_ms']:>8.1f}{s['p95_ms']:>8.1f}{s['p99_ms']:>8.1f}")
+    text = "📊 **資料庫查詢延遲 (ms)**\n```\n" + "\n".join(lines) + "\n```"
+    if _slow_queries:
+        text += f"\n🐢 慢查詢 (≥ {SLOW_QUERY_MS:.0f} ms): {len(_slow_queries)} 筆，最近一筆 `{_slow_queries[-1]['name']}` {_slow_queries[-1]['ms']} ms"
+    return text
@@ -0,0 +1,273 @@
+"""
+歌曲檔案索引
+把 `song/` 內的音檔以清理後的標題 (clean_string) 建成 標題 -> 檔案 的對照表，
+查詢先找完全相同的 key，找不到才對預先算好的候選清單做模糊比對。
+目錄的 mtime 改變時只處理新增 / 刪除的檔案，不重新清理整個目錄。
+"""
+
+import os
+import time
+import threading
+from functools import lru_cache
+
+try:
+    from rapidfuzz import process as _process, fuzz as _fuzz
+except ImportError:  # 沒有 rapidfuzz 時退回 fuzzywuzzy 逐一比對
+    _process = None
+    from fuzzywuzzy import fuzz as _fuzz
+
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".opus")
+MATCH_THRESHOLD = 80     # 相似度高於此值才算匹配
+RECONCILE_THRESHOLD = 85 # 啟動掃描時歌單與檔案對應的門檻 (模糊比對前的 bigram 過濾由此推導，見 _max_lost)
+
+
+class SongIndex:
+    """單一目錄的音檔索引"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._mtime_ns = None
+        self._files = {}        # 檔名 -> 清理後的標題
+        self._exact = {}        # 清理後的標題 -> 檔名 (同名取第一個)
+        self._choices = []      # 模糊比對用的 (檔名, 清理後的標題)，需要時才重建
+        self._choice_keys = []
+        self._choices_stale = True
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    @staticmethod
+    def _clean(text: str) -> str:
+        from utils.music import clean_string
+        return clean_string(text)
+
+    def refresh(self, force: bool = False):
+        """目錄 mtime 沒變就不做事；有變則只處理差異"""
+        try:
+            mtime_ns = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        with self._lock:
+            if not force and mtime_ns == self._mtime_ns and mtime_ns is not None:
+                return
+            names = set(os.listdir(self.directory)) if mtime_ns is not None else set()
+            for name in self._files.keys() - names:
+                self._discard(name)
+            for name in names - self._files.keys():
+                self._add(name)
+            self._mtime_ns = mtime_ns
+            self.refreshes += 1
+
+    def _add(self, name: str):
+        if not name.lower().endswith(AUDIO_EXTENSIONS):
+            return
+        key = self._clean(os.path.splitext(name)[0])
+        self._files[name] = key
+        if key not in self._exact or name.lower().endswith(".opus"):
+            self._exact[key] = name     # 同名時優先使用 Opus 檔
+        self._choices_stale = True
+
+    def _discard(self, name: str):
+        key = self._files.pop(name, None)
+        if key is None:
+            return
+        if self._exact.get(key) == name:
+            del self._exact[key]
+            other = next((n for n, k in self._files.items() if k == key), None)
+            if other is not None:
+                self._exact[key] = other
+        self._choices_stale = True
+
+    def add(self, path: str):
+        """下載完成後直接登記，不必等下一次 mtime 檢查"""
+        with self._lock:
+            self._add(os.path.basename(path))
+
+    def discard(self, path: str):
+        with self._lock:
+            self._discard(os.path.basename(path))
+
+    def _fuzzy(self, key: str):
+        if self._choices_stale:
+            self._choices = list(self._files.items())
+            self._choice_keys = [k for _, k in self._choices]
+            self._choices_stale = False
+        if not self._choices:
+            return None, 0
+
+        if _process is not None:
+            result = _process.extractOne(key, self._choice_keys, scorer=_fuzz.partial_ratio,
+                                         score_cutoff=MATCH_THRESHOLD)
+            if result is None:
+                return None, 0
+            _, score, position = result
+            return self._choices[position][0], score
+
+        best_name, best_score = None, 0
+        for name, choice in self._choices:
+            score = _fuzz.partial_ratio(key, choice)
+            if score > best_score:
+                best_name, best_score = name, score
+        return best_name, best_score
+
+    def find(self, title: str):
+        """回傳 (完整路徑, 相似度)；完全相同為 100，找不到為 (None, 0)"""
+        self.refresh()
+        key = self._clean(title)
+        with self._lock:
+            name = self._exact.get(key)
+            if name is not None:
+                return os.path.join(self.directory, name), 100
+            name, score = self._fuzzy(key)
+        if name is not None and score > MATCH_THRESHOLD:
+            return os.path.join(self.directory, name), score
+        return None, 0
+
+    def __len__(self):
+        return len(self._files)
+
+
+_indexes = {}
+
+
+def get_song_index(directory: str) -> SongIndex:
+    index = _indexes.get(directory)
+    if index is None:
+        index = _indexes[directory] = SongIndex(directory)
+    return index
+
+
+# ============================================
+# 啟動時歌單與檔案的對帳
+# ============================================
+
+def _bigrams(key: str):
+    return {key[i:i + 2] for i in range(len(key) - 1)} if len(key) > 1 else set()
+
+
+def _blocks(gram_sets: list) -> dict:
+    blocks = {}
+    for position, grams in enumerate(gram_sets):
+        for gram in grams:
+            blocks.setdefault(gram, []).append(position)
+    return blocks
+
+
+def _prefix_candidates(grams: set, blocks: dict, required: int):
+    """
+    前綴過濾：要和對方共享至少 required 個 bigram，對方一定含有「最稀有的 n - required + 1 個」之一，
+    只需展開這幾個 bigram 的 block，常見字組 (例如 love、the) 的大 block 不會被掃到
+    """
+    ordered = sorted(grams, key=lambda gram: len(blocks.get(gram, ())))
+    found = set()
+    for gram in ordered[:len(ordered) - required + 1]:
+        found.update(blocks.get(gram, ()))
+    return found
+
+
+@lru_cache(maxsize=None)
+def _max_lost(length: int) -> int:
+    """
+    長度 length 的較短字串與另一方 partial_ratio > RECONCILE_THRESHOLD 時，最多有幾個 bigram 位置不會出現在另一方
+    partial_ratio 取另一方長度 L (≤ length，頭尾可能較短) 的片段，分數 = 2M / (length + L)，M 為相同的字元數。
+    較短字串中未對上的字元把對上的字元切成最多 length - M + 1 段，片段中多出的 L - M 個字元最多再拆開 L - M 對，
+    所以保留的 bigram 至少 3M - length - L - 1 個，遺失的最多 2·length + L - 3M 個；對每個 L 取最小的 M 算最壞情況。
+    """
+    worst = 0
+    for window in range(1, length + 1):
+        matches = RECONCILE_THRESHOLD * (length + window) // 200 + 1
+        if matches <= window:
+            worst = max(worst, 2 * length + window - 3 * matches)
+    return worst
+
+
+def _candidates(key: str, grams: set, keys: list, gram_sets: list, blocks: dict):
+    """
+    以 key 當較短的一方，回傳不短於它、且可能 partial_ratio > 門檻的位置
+    每個遺失的 bigram 位置最多讓一種 bigram 消失，因此至少要共享 len(grams) - _max_lost(len(key)) 種；
+    算出來不到 1 種 (例如單一字元的 key 沒有 bigram) 時無法過濾，直接和所有夠長的一方比對
+    """
+    required = len(grams) - _max_lost(len(key))
+    if required <= 0:
+        return [p for p, other in enumerate(keys) if len(other) >= len(key)]
+    return [p for p in _prefix_candidates(grams, blocks, required)
+            if len(keys[p]) >= len(key) and len(grams & gram_sets[p]) >= required]
+
+
+def _best_match(key: str, choices: list):
+    """回傳 (位置, 相似度)，沒有超過門檻的回傳 (None, 0)"""
+    if _process is not None:
+        result = _process.extractOne(key, choices, scorer=_fuzz.partial_ratio, score_cutoff=RECONCILE_THRESHOLD)
+        if result is None:
+            return None, 0
+        return result[2], result[1]
+    best, best_score = None, 0
+    for position, choice in enumerate(choices):
+        score = _fuzz.partial_ratio(key, choice)
+        if score > best_score:
+            best, best_score = position, score
+    return best, best_score
+
+
+def reconcile(titles: list, stems: list) -> dict:
+    """
+    對照歌單標題與 `song/` 內的檔名 (不含副檔名)
+    1. 以 clean_string(sanitize_filename(標題)) 做完全相同的 join
+    2. 沒對上的歌曲只和「較短一方有足夠的 bigram 出現在另一方」的檔案做模糊比對
+       (需要的數量由 partial_ratio > 85 推導出下限，見 _max_lost)，配對以最稀有的 bigram 前綴過濾產生
+    回傳 {"downloaded": {標題: bool}, "unmatched_files": [檔名], "timings": {階段: 秒}}
+    純函式，可在背景執行緒執行。
+    """
+    from utils.music import clean_string, sanitize_filename
+
+    timings = {}
+    start = time.perf_counter()
+    file_keys = [clean_string(stem) for stem in stems]
+    by_key = {}
+    for position, key in enumerate(file_keys):
+        by_key.setdefault(key, []).append(position)
+
+    downloaded = {}
+    matched = set()
+    pending = []
+    for title in titles:
+        key = clean_string(sanitize_filename(title))
+        positions = by_key.get(key)
+        if positions:
+            downloaded[title] = True
+            matched.update(positions)
+        else:
+            downloaded[title] = False
+            pending.append((title, key))
+    timings["exact"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    file_grams = [_bigrams(key) for key in file_keys]
+    file_blocks = _blocks(file_grams)
+    title_grams = [_bigrams(key) for _, key in pending]
+    title_blocks = _blocks(title_grams)
+
+    # 候選配對：以較短的一方做前綴過濾 (一樣長時兩個方向都算)
+    title_keys = [key for _, key in pending]
+    candidates = [set(_candidates(key, grams, file_keys, file_grams, file_blocks))
+                  for key, grams in zip(title_keys, title_grams)]
+    # 檔名較短的方向 (已完全對上的檔案也要算，否則只對得上它的歌會被標成未下載)
+    for p, grams in enumerate(file_grams):
+        for i in _candidates(file_keys[p], grams, title_keys, title_grams, title_blocks):
+            candidates[i].add(p)
+
+    for (title, key), positions in zip(pending, candidates):
+        if not positions:
+            continue
+        positions = sorted(positions)
+        best, score = _best_match(key, [file_keys[p] for p in positions])
+        if best is not None and score > RECONCILE_THRESHOLD:
+            downloaded[title] = True
+            matched.add(positions[best])
+    timings["fuzzy"] = time.perf_counter() - start
+
+    return {
+        "downloaded": downloaded,
+        "unmatched_files": [stem for position, stem in enumerate(stems) if position not in matched],
+        "fuzzy_candidates": len(pending),
+        "timings": timings,
+    }
@@ -0,0 +1,108 @@
+"""
+邊下載邊播放
+還沒下載過的歌不必等 yt-dlp 下載、轉檔完成：先解析出音訊串流的直連網址交給 FFmpeg 直接播放
+(開啟斷線重連)，同時在背景把檔案下載到 song/，之後播放就走本機檔案。
+"""
+
+import os
+import time
+import shlex
+import asyncio
+
+import yt_dlp
+
+STREAM_NEW_SONGS = os.getenv("STREAM_NEW_SONGS", "1") != "0"
+STREAM_FORMAT = "bestaudio/best"
+RECONNECT_OPTIONS = "-reconnect 1 -reconnect_streamed 1 -reconnect_on_network_error 1 -reconnect_delay_max 5"
+
+_persist_tasks = set()      # 保留背景下載 task 的參照，避免被回收
+
+
+class StreamSource:
+    """解析出的音訊串流 (直連網址 + 需要帶上的 HTTP 標頭)"""
+
+    def __init__(self, url: str, headers: dict = None, resolved_in: float = 0.0):
+        self.url = url
+        self.headers = headers or {}
+        self.resolved_in = resolved_in
+
+    @property
+    def before_options(self) -> str:
+        options = RECONNECT_OPTIONS
+        if self.headers:
+            header_text = "".join(f"{key}: {value}\r\n" for key, value in self.headers.items())
+            options += f" -headers {shlex.quote(header_text)}"
+        return options
+
+    def ffmpeg_options(self, options: dict) -> dict:
+        """在原本的 FFmpegPCMAudio 參數加上串流用的 before_options"""
+        return {**options, "before_options": self.before_options}
+
+
+def _extract_stream(url: str) -> StreamSource | None:
+    """在執行緒中呼叫 yt-dlp 解析串流網址 (不下載)"""
+    import utils.shared_state as shared_state
+
+    ydl_opts = {
+        "format": STREAM_FORMAT,
+        "quiet": True,
+        "noplaylist": True,
+    }
+    if shared_state.youtube_cookies_path:
+        ydl_opts["cookiefile"] = shared_state.youtube_cookies_path
+
+    start = time.perf_counter()
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if not info:
+        return None
+    if "entries" in info:
+        entries = [entry for entry in info["entries"] if entry]
+        if not entries:
+            return None
+        info = entries[0]
+
+    stream_url = info.get("url")
+    if not stream_url:
+        # 有些網站只在 requested_formats 裡給網址
+        formats = info.get("requested_formats") or []
+        stream_url = formats[0].get("url") if formats else None
+    if not stream_url:
+        return None
+    return StreamSource(stream_url, info.get("http_headers"), time.perf_counter() - start)
+
+
+async def resolve_stream(url: str) -> StreamSource | None:
+    """解析歌曲的音訊串流；失敗時回傳 None，呼叫端改用完整下載"""
+    from utils.music import log_message
+
+    if not url:
+        return None
+    try:
+        stream = await asyncio.to_thread(_extract_stream, url)
+    except Exception as e:
+        log_message(f"⚠️ 無法解析串流網址，改為完整下載: {e}")
+        return None
+    if stream is None:
+        log_message(f"⚠️ 找不到可播放的串流，改為完整下載: {url}")
+        return None
+    log_message(f"📡 串流網址解析完成 ({stream.resolved_in:.1f} 秒)")
+    return stream
+
+
+def persist_in_background(url: str, title: str) -> asyncio.Task:
+    """串流播放時在背景下載檔案到 song/ (預先下載優先順序，同一 URL 已在下載中則共用)"""
+    from utils.music import download_song, log_message
+    from utils.downloads import PRIORITY_PREFETCH
+
+    async def persist():
+        try:
+            if not await download_song(url, title, None, PRIORITY_PREFETCH):
+                log_message(f"⚠️ 背景下載 `{title}` 失敗，下次播放仍會使用串流")
+        except Exception as e:
+            log_message(f"❌ 背景下載 `{title}` 發生錯誤: {e}")
+
+    task = asyncio.get_running_loop().create_task(persist())
+    _persist_tasks.add(task)
+    task.add_done_callback(_persist_tasks.discard)
+    return task